@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+"""Measure the time and the number of roundtrips to open a connection.
+
+Usage::
+
+    python benchmarks/bench_connect.py [dsn] [connections]
+
+The dsn defaults to the one used by the test suite (see the
+``PSYCOPG2_TESTDB*`` env variables). The roundtrips are counted as the
+times an asynchronous connection waits for the server to reply: they
+include the authentication exchange and the session setup queries (e.g.
+setting the datestyle if the server default is not ISO).
+"""
+
+import os
+import sys
+import time
+import select
+
+import psycopg2cffi
+from psycopg2cffi import extensions
+
+
+def default_dsn():
+    dsn = 'dbname=%s' % os.environ.get('PSYCOPG2_TESTDB', 'psycopg2_test')
+    for var, key in [('HOST', 'host'), ('PORT', 'port'),
+            ('USER', 'user'), ('PASSWORD', 'password')]:
+        value = os.environ.get('PSYCOPG2_TESTDB_' + var)
+        if value is not None:
+            dsn += ' %s=%s' % (key, value)
+    return dsn
+
+
+def count_roundtrips(dsn):
+    conn = psycopg2cffi.connect(dsn, async=True)
+    reads = 0
+    while 1:
+        state = conn.poll()
+        if state == extensions.POLL_OK:
+            break
+        elif state == extensions.POLL_READ:
+            reads += 1
+            select.select([conn], [], [])
+        elif state == extensions.POLL_WRITE:
+            select.select([], [conn], [])
+    datestyle = conn.get_parameter_status('DateStyle')
+    conn.close()
+    return reads, datestyle
+
+
+def run(dsn, nconns):
+    start = time.time()
+    for i in xrange(nconns):
+        psycopg2cffi.connect(dsn).close()
+    return (time.time() - start) / nconns
+
+
+def main():
+    dsn = len(sys.argv) > 1 and sys.argv[1] or default_dsn()
+    nconns = len(sys.argv) > 2 and int(sys.argv[2]) or 500
+
+    print 'using %s' % os.path.dirname(psycopg2cffi.__file__)
+    roundtrips, datestyle = count_roundtrips(dsn)
+    print 'roundtrips per connect: %d (DateStyle: %s)' % (
+        roundtrips, datestyle)
+    best = min([run(dsn, nconns) for i in range(3)])
+    print 'time per connect:       %.3f ms' % (best * 1000)
+
+
+if __name__ == '__main__':
+    main()
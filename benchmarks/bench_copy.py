@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+"""Measure the speed of loading Python records into a table.
+
+Usage::
+
+    python benchmarks/bench_copy.py [dsn] [rows]
+
+The dsn defaults to the one used by the test suite (see the
+``PSYCOPG2_TESTDB*`` env variables). The records are loaded with
+cursor.copy_records() and, for comparison, formatted by hand into a file
+for cursor.copy_from() and inserted by cursor.executemany().
+"""
+
+import datetime
+import os
+import sys
+import time
+from cStringIO import StringIO
+
+import psycopg2cffi
+
+
+def default_dsn():
+    dsn = 'dbname=%s' % os.environ.get('PSYCOPG2_TESTDB', 'psycopg2_test')
+    for var, key in [('HOST', 'host'), ('PORT', 'port'),
+            ('USER', 'user'), ('PASSWORD', 'password')]:
+        value = os.environ.get('PSYCOPG2_TESTDB_' + var)
+        if value is not None:
+            dsn += ' %s=%s' % (key, value)
+    return dsn
+
+
+def load_records(cur, records):
+    cur.copy_records('bench', records)
+
+
+def load_file(cur, records):
+    f = StringIO()
+    for r in records:
+        f.write('%d\t%s\t%r\t%s\n' % (r[0], r[1], r[2], r[3].isoformat()))
+    f.seek(0)
+    cur.copy_from(f, 'bench')
+
+
+def load_executemany(cur, records):
+    cur.executemany("INSERT INTO bench VALUES (%s, %s, %s, %s)", records)
+
+
+def run(conn, records, load):
+    cur = conn.cursor()
+    cur.execute("CREATE TEMP TABLE bench "
+        "(id int, data text, value float8, day date)")
+    start = time.time()
+    load(cur, records)
+    elapsed = time.time() - start
+    conn.rollback()
+    return len(records) / elapsed
+
+
+def main():
+    dsn = len(sys.argv) > 1 and sys.argv[1] or default_dsn()
+    nrows = len(sys.argv) > 2 and int(sys.argv[2]) or 200000
+
+    day = datetime.date(2012, 1, 1)
+    records = [(i, 'row number %d' % i, i / 3.0, day)
+        for i in xrange(nrows)]
+
+    conn = psycopg2cffi.connect(dsn)
+    print 'using %s' % os.path.dirname(psycopg2cffi.__file__)
+    for name, load in [('copy_records', load_records),
+            ('copy_from', load_file), ('executemany', load_executemany)]:
+        best = max([run(conn, records, load) for i in range(3)])
+        print '%-16s %10.0f rows/sec' % (name, best)
+    conn.close()
+
+
+if __name__ == '__main__':
+    main()
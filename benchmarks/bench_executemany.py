@@ -0,0 +1,56 @@
+#!/usr/bin/env python
+"""Measure the speed of cursor.executemany() inserting rows.
+
+Usage::
+
+    python benchmarks/bench_executemany.py [dsn] [rows]
+
+The dsn defaults to the one used by the test suite (see the
+``PSYCOPG2_TESTDB*`` env variables). A pagesize of 1 executes a statement
+per roundtrip, as executemany() used to do.
+"""
+
+import os
+import sys
+import time
+
+import psycopg2cffi
+
+
+def default_dsn():
+    dsn = 'dbname=%s' % os.environ.get('PSYCOPG2_TESTDB', 'psycopg2_test')
+    for var, key in [('HOST', 'host'), ('PORT', 'port'),
+            ('USER', 'user'), ('PASSWORD', 'password')]:
+        value = os.environ.get('PSYCOPG2_TESTDB_' + var)
+        if value is not None:
+            dsn += ' %s=%s' % (key, value)
+    return dsn
+
+
+def run(conn, nrows, pagesize):
+    cur = conn.cursor()
+    cur.pagesize = pagesize
+    cur.execute("CREATE TEMP TABLE bench (id int, data text, value float8)")
+    rows = [(i, 'row number %d' % i, i / 3.0) for i in xrange(nrows)]
+    start = time.time()
+    cur.executemany("INSERT INTO bench VALUES (%s, %s, %s)", rows)
+    elapsed = time.time() - start
+    assert cur.rowcount == nrows
+    conn.rollback()
+    return nrows / elapsed
+
+
+def main():
+    dsn = len(sys.argv) > 1 and sys.argv[1] or default_dsn()
+    nrows = len(sys.argv) > 2 and int(sys.argv[2]) or 100000
+
+    conn = psycopg2cffi.connect(dsn)
+    print 'using %s' % os.path.dirname(psycopg2cffi.__file__)
+    for pagesize in (1, 10, 100, 1000):
+        best = max([run(conn, nrows, pagesize) for i in range(3)])
+        print 'pagesize %-7d %10.0f rows/sec' % (pagesize, best)
+    conn.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+"""Measure how fast result rows are materialized by the fetch methods.
+
+Usage::
+
+    python benchmarks/bench_fetch.py [dsn] [rows]
+
+The dsn defaults to the one used by the test suite (see the
+``PSYCOPG2_TESTDB*`` env variables).
+
+The package is imported from the Python path, so the same script can be
+used to compare two revisions, e.g. the current tree against a worktree of
+an older commit::
+
+    git worktree add /tmp/psycopg2cffi-old <commit>
+    PYTHONPATH=/tmp/psycopg2cffi-old python benchmarks/bench_fetch.py
+    PYTHONPATH=. python benchmarks/bench_fetch.py
+"""
+
+import os
+import sys
+import time
+
+import psycopg2cffi
+
+
+QUERY = """
+    SELECT i, i::float8 / 3, 'row number ' || i, i::numeric(12, 2),
+        CASE WHEN i %% 10 = 0 THEN NULL ELSE i::int8 END
+    FROM generate_series(1, %s) AS i
+"""
+
+
+def default_dsn():
+    dsn = 'dbname=%s' % os.environ.get('PSYCOPG2_TESTDB', 'psycopg2_test')
+    for var, key in [('HOST', 'host'), ('PORT', 'port'),
+            ('USER', 'user'), ('PASSWORD', 'password')]:
+        value = os.environ.get('PSYCOPG2_TESTDB_' + var)
+        if value is not None:
+            dsn += ' %s=%s' % (key, value)
+    return dsn
+
+
+def run(cur, nrows, fetch):
+    cur.execute(QUERY, (nrows,))
+    start = time.time()
+    fetch(cur)
+    return nrows / (time.time() - start)
+
+
+def fetch_all(cur):
+    cur.fetchall()
+
+
+def fetch_many(cur):
+    while cur.fetchmany(1000):
+        pass
+
+
+def fetch_one(cur):
+    while cur.fetchone() is not None:
+        pass
+
+
+def main():
+    dsn = len(sys.argv) > 1 and sys.argv[1] or default_dsn()
+    nrows = len(sys.argv) > 2 and int(sys.argv[2]) or 200000
+
+    conn = psycopg2cffi.connect(dsn)
+    cur = conn.cursor()
+    print 'using %s' % os.path.dirname(psycopg2cffi.__file__)
+    for name, fetch in [('fetchall', fetch_all),
+            ('fetchmany(1000)', fetch_many), ('fetchone', fetch_one)]:
+        best = max([run(cur, nrows, fetch) for i in range(3)])
+        print '%-16s %10.0f rows/sec' % (name, best)
+    conn.close()
+
+
+if __name__ == '__main__':
+    main()
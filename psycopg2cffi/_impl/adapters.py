@@ -1,6 +1,7 @@
 import datetime
 import decimal
 import math
+import re
 
 from psycopg2cffi._impl.libpq import libpq, ffi
 from psycopg2cffi._impl.encodings import encodings
@@ -9,7 +10,42 @@ from psycopg2cffi._config import PG_VERSION
 from psycopg2cffi.tz import LOCAL as TZ_LOCAL
 
 
-adapters = {}
+def _clearing_cache(name):
+    method = getattr(dict, name)
+    def clearing_cache(self, *args, **kwargs):
+        try:
+            return method(self, *args, **kwargs)
+        finally:
+            _adapters_cache.clear()
+    clearing_cache.__name__ = name
+    return clearing_cache
+
+
+class _AdaptersMap(dict):
+    """The adapters registry: any change empties the adapt() cache."""
+    __setitem__ = _clearing_cache('__setitem__')
+    __delitem__ = _clearing_cache('__delitem__')
+    clear = _clearing_cache('clear')
+    pop = _clearing_cache('pop')
+    popitem = _clearing_cache('popitem')
+    setdefault = _clearing_cache('setdefault')
+    update = _clearing_cache('update')
+
+
+adapters = _AdaptersMap()
+
+# Map (type, proto) -> adapter found for the type in `adapters`, or None
+_adapters_cache = {}
+
+# Map adapter class -> (has prepare(), has getbinding())
+_adapters_methods = {}
+
+# Oids of the types used to send parameters out of the query
+_oids = {
+    'bool': 16, 'bytea': 17, 'int8': 20, 'int4': 23, 'float8': 701,
+    'date': 1082, 'time': 1083, 'timestamp': 1114, 'timestamptz': 1184,
+    'interval': 1186, 'numeric': 1700,
+}
 
 
 class _BaseAdapter(object):
@@ -63,11 +99,19 @@ class Binary(_BaseAdapter):
 
         return r"'%s'::bytea" % data
 
+    def getbinding(self):
+        if self._wrapped is None:
+            return (_oids['bytea'], 1, None)
+        return (_oids['bytea'], 1, str(self._wrapped))
+
 
 class Boolean(_BaseAdapter):
     def getquoted(self):
         return 'true' if self._wrapped else 'false'
 
+    def getbinding(self):
+        return (_oids['bool'], 0, 't' if self._wrapped else 'f')
+
 
 class DateTime(_BaseAdapter):
     def getquoted(self):
@@ -88,6 +132,20 @@ class DateTime(_BaseAdapter):
                 format = 'date'
             return "'%s'::%s" % (str(iso), format)
 
+    def getbinding(self):
+        obj = self._wrapped
+        if isinstance(obj, datetime.timedelta):
+            return (_oids['interval'], 0, '%d days %d.%06d seconds' % (
+                obj.days, obj.seconds, obj.microseconds))
+        elif isinstance(obj, datetime.datetime):
+            if getattr(obj, 'tzinfo', None):
+                return (_oids['timestamptz'], 0, obj.isoformat())
+            return (_oids['timestamp'], 0, obj.isoformat())
+        elif isinstance(obj, datetime.time):
+            return (_oids['time'], 0, obj.isoformat())
+        else:
+            return (_oids['date'], 0, obj.isoformat())
+
 
 def Date(year, month, day):
     date = datetime.date(year, month, day)
@@ -110,6 +168,11 @@ class Decimal(_BaseAdapter):
             return value
         return "'NaN'::numeric"
 
+    def getbinding(self):
+        if self._wrapped.is_finite():
+            return (_oids['numeric'], 0, str(self._wrapped))
+        return (_oids['numeric'], 0, 'NaN')
+
 
 class Float(ISQLQuote):
     def getquoted(self):
@@ -129,6 +192,16 @@ class Float(ISQLQuote):
                 value = ' ' + value
             return value
 
+    def getbinding(self):
+        n = float(self._wrapped)
+        if math.isnan(n):
+            value = 'NaN'
+        elif math.isinf(n):
+            value = n > 0 and 'Infinity' or '-Infinity'
+        else:
+            value = repr(n)
+        return (_oids['float8'], 0, value)
+
 
 class Int(_BaseAdapter):
     def getquoted(self):
@@ -139,6 +212,9 @@ class Int(_BaseAdapter):
             value = ' ' + value
         return value
 
+    def getbinding(self):
+        return _int_binding(self._wrapped)
+
 
 class List(_BaseAdapter):
 
@@ -166,6 +242,19 @@ class Long(_BaseAdapter):
             value = ' ' + value
         return value
 
+    def getbinding(self):
+        return _int_binding(self._wrapped)
+
+
+def _int_binding(value):
+    """Return the binding for an integer, using the smallest fitting type"""
+    if -0x80000000 <= value <= 0x7FFFFFFF:
+        return (_oids['int4'], 0, str(value))
+    elif -0x8000000000000000 <= value <= 0x7FFFFFFFFFFFFFFF:
+        return (_oids['int8'], 0, str(value))
+    else:
+        return (_oids['numeric'], 0, str(value))
+
 
 def Time(hour, minutes, seconds, tzinfo=None):
     time = datetime.time(hour, minutes, seconds, tzinfo=tzinfo)
@@ -227,18 +316,25 @@ class QuotedString(_BaseAdapter):
         libpq.PQfreemem(data_pointer)
         return data
 
+    def getbinding(self):
+        # Sent with unknown type, as a quoted string literal would be
+        obj = self._wrapped
+        if isinstance(obj, unicode):
+            obj = obj.encode(encodings[self.encoding])
+        return (0, 0, str(obj))
+
 
 def adapt(value, proto=ISQLQuote, alt=None):
     """Return the adapter for the given value"""
     obj_type = type(value)
     try:
-        return adapters[(obj_type, proto)](value)
+        adapter = _adapters_cache[(obj_type, proto)]
     except KeyError:
-        for subtype in obj_type.mro()[1:]:
-            try:
-                return adapters[(subtype, proto)](value)
-            except KeyError:
-                pass
+        adapter = _find_adapter(obj_type, proto)
+        _adapters_cache[(obj_type, proto)] = adapter
+
+    if adapter is not None:
+        return adapter(value)
 
     conform = getattr(value, '__conform__', None)
     if conform is not None:
@@ -246,18 +342,109 @@ def adapt(value, proto=ISQLQuote, alt=None):
     raise ProgrammingError("can't adapt type '%s'" % obj_type.__name__)
 
 
+def _find_adapter(obj_type, proto):
+    """Return the adapter registered for a type or its nearest base"""
+    for subtype in obj_type.mro():
+        adapter = adapters.get((subtype, proto))
+        if adapter is not None:
+            return adapter
+
+
+def _get_methods(adapter):
+    """Return if an adapter implements (prepare(), getbinding())"""
+    cls = adapter.__class__
+    try:
+        return _adapters_methods[cls]
+    except KeyError:
+        rv = _adapters_methods[cls] = (
+            hasattr(cls, 'prepare'), hasattr(cls, 'getbinding'))
+        return rv
+
+
 def _getquoted(param, conn):
     """Helper method"""
     if param is None:
         return 'NULL'
     adapter = adapt(param)
-    try:
+    if _get_methods(adapter)[0]:
         adapter.prepare(conn)
-    except AttributeError:
-        pass
     return adapter.getquoted()
 
 
+def _getbinding(param, conn):
+    """Return the (oid, format, value) triple to send `param` to the backend
+    separately from the query.
+
+    If the adapter of the param doesn't implement getbinding() return the
+    quoted param instead, to be merged into the query.
+
+    """
+    if param is None:
+        return (0, 0, None)
+    adapter = adapt(param)
+    prepare, getbinding = _get_methods(adapter)
+    if prepare:
+        adapter.prepare(conn)
+    if getbinding:
+        return adapter.getbinding()
+    return adapter.getquoted()
+
+
+_re_copy_escape = re.compile(r'[\\\t\n\r]')
+_copy_escapes = {'\\': '\\\\', '\t': '\\t', '\n': '\\n', '\r': '\\r'}
+
+
+def _getcopytext(param, conn):
+    """Return the representation of `param` in the COPY text format.
+
+    The value is the one sent by the adapter getbinding() method, so
+    adapters without it are not supported.
+
+    """
+    if param is None:
+        return '\\N'
+    binding = _getbinding(param, conn)
+    if not isinstance(binding, tuple):
+        raise ProgrammingError(
+            "can't copy values of type '%s'" % type(param).__name__)
+
+    value = binding[2]
+    if binding[1]:
+        # binary data: only bytea is sent this way
+        if conn.server_version >= 90000:
+            value = '\\x' + value.encode('hex')
+        else:
+            value = ''.join(['\\%03o' % ord(c) for c in value])
+
+    return _copy_escape(value)
+
+
+def _copy_escape(value):
+    """Escape a string for the COPY text format"""
+    if _re_copy_escape.search(value):
+        value = _re_copy_escape.sub(
+            lambda m: _copy_escapes[m.group()], value)
+    return value
+
+
+def _copy_encoder(obj_type, conn):
+    """Return a function converting the values of `obj_type` (except None)
+    in the COPY text format, as _getcopytext() does.
+
+    The adapter is looked up only once, and the values whose representation
+    can't contain characters to escape skip the escaping.
+
+    """
+    adapter = _find_adapter(obj_type, ISQLQuote)
+    if adapter in (Int, Long) and obj_type in (int, long):
+        return str
+    if adapter in (Boolean, DateTime, Decimal, Float, Int, Long):
+        return lambda value: adapter(value).getbinding()[2]
+    if adapter is QuotedString and issubclass(obj_type, str):
+        return _copy_escape
+    return lambda value: _getcopytext(value, conn)
+
+
 built_in_adapters = {
     bool: Boolean,
     str: QuotedString,
@@ -1,3 +1,5 @@
+import os
+import re
 import threading
 import weakref
 from functools import wraps
@@ -6,10 +8,12 @@ from psycopg2cffi._impl import consts
 from psycopg2cffi._impl import encodings as _enc
 from psycopg2cffi._impl import exceptions
 from psycopg2cffi._impl.libpq import libpq, ffi
+from psycopg2cffi._impl import typecasts
 from psycopg2cffi._impl import util
 from psycopg2cffi._impl.cursor import Cursor
 from psycopg2cffi._impl.lobject import LargeObject
 from psycopg2cffi._impl.notify import Notify
+from psycopg2cffi._impl.prepare import PreparedStatements
 from psycopg2cffi._impl.xid import Xid
 
 
@@ -28,8 +32,112 @@ for k, v in _isolevels.items():
 
 del k, v
 
+# Changes to the session state, from the cheapest to reset.
+SESSION_CLEAN = 0       # nothing to reset
+SESSION_GUC = 1         # configuration parameters changed: RESET ALL
+SESSION_DIRTY = 2       # other state (temp tables, LISTEN...): DISCARD ALL
+
+# Statements which may change the session state, looked for in the queries
+# executed. SET LOCAL or a "set" in a string are false positives: they only
+# cost a needless reset.
+_re_session_guc = re.compile(
+    r'(?:^|;)\s*(?:set|reset|discard)\b|\bset_config\s*\(', re.I)
+_re_session_dirty = re.compile(
+    r'(?:^|;)\s*(?:listen|prepare|declare|load|'
+    r'create\s+(?:(?:global|local)\s+)?temp(?:orary)?)\b'
+    r'|\bpg_advisory_lock', re.I)
+# Settings requested in the startup packet, to avoid setting them with a
+# query after connecting.
+_startup_options = '-c datestyle=ISO'
+
+# The dsns whose server refused the startup options: don't try them again
+_startup_refused_dsns = set()
+
+
+def _startup_dsn(dsn):
+    """Return `dsn` with the `_startup_options` added.
+
+    Return None if the options can't be added without overriding the ones
+    specified by the user in the dsn, in the PGOPTIONS env var or in a
+    service file, if the dsn can't be parsed or if the server refused the
+    options before.
+
+    """
+    if dsn in _startup_refused_dsns:
+        return None
+    if os.environ.get('PGOPTIONS') or os.environ.get('PGSERVICE'):
+        return None
+    params = _parse_dsn(dsn)
+    if params is None or 'options' in params or 'service' in params:
+        return None
+    if dsn.startswith('postgresql://') or dsn.startswith('postgres://'):
+        return '%s%soptions=%s' % (dsn, '?' in dsn and '&' or '?',
+            _startup_options.replace(' ', '%20').replace('=', '%3D'))
+    return "%s options='%s'" % (dsn, _startup_options)
+
+
+def _parse_dsn(dsn):
+    """Return the dict of the parameters specified in a dsn, None if the dsn
+    is not valid."""
+    errmsg = ffi.new('char **')
+    options = libpq.PQconninfoParse(dsn, errmsg)
+    if not options:
+        if errmsg[0]:
+            libpq.PQfreemem(errmsg[0])
+        return None
+
+    try:
+        params = {}
+        i = 0
+        while options[i].keyword:
+            if options[i].val:
+                params[ffi.string(options[i].keyword)] = \
+                    ffi.string(options[i].val)
+            i += 1
+        return params
+    finally:
+        libpq.PQconninfoFree(options)
+
+
+# Fields of the notices passed to Connection.notice_hook
+_notice_fields = [
+    ('severity', libpq.PG_DIAG_SEVERITY),
+    ('sqlstate', libpq.PG_DIAG_SQLSTATE),
+    ('message_primary', libpq.PG_DIAG_MESSAGE_PRIMARY),
+    ('message_detail', libpq.PG_DIAG_MESSAGE_DETAIL),
+    ('message_hint', libpq.PG_DIAG_MESSAGE_HINT),
+    ('context', libpq.PG_DIAG_CONTEXT),
+]
+
+
+@ffi.callback('void(void *, const PGresult *)')
+def _notice_receiver(arg, pgres):
+    """Dispatch a notice to the connection it was received on.
+
+    A single callback is shared by all the connections: `arg` is the handle
+    of a weak reference to the connection.
+
+    """
+    conn = ffi.from_handle(arg)()
+    if conn is not None:
+        conn._process_notice(pgres)
+
 _green_callback = None
 
+# Max number of values converted by a query in Connection._binary_to_text()
+_binary_to_text_batch = 10000
+
+
+def _onoff(value):
+    """Return the value of a boolean configuration parameter.
+
+    The string 'default' is accepted too.
+    """
+    if isinstance(value, basestring) and value.lower() == 'default':
+        return 'default'
+    else:
+        return value and 'on' or 'off'
+
 
 def check_closed(func):
     @wraps(func)
@@ -84,6 +192,17 @@ class Connection(object):
     ProgrammingError = exceptions.ProgrammingError
     Warning = exceptions.Warning
 
+    #: If set, a callable receiving a dict with the fields of every notice
+    #: (severity, sqlstate, message_primary...) and the complete `message`.
+    notice_hook = None
+
+    #: If true, the BEGIN starting a transaction is sent together with the
+    #: first query of the transaction, when possible, instead of in a
+    #: roundtrip of its own. It is not possible if the query has parameters
+    #: bound by the server, requests binary results or is executed using a
+    #: statement of the `prepared_statements` cache.
+    deferred_begin = False
+
     def __init__(self, dsn, async=False):
 
         self.dsn = dsn
@@ -95,24 +214,41 @@ class Connection(object):
         self._typecasts = {}
         self._tpc_xid = None
         self._notifies = []
+        self._notice_handle = ffi.new_handle(weakref.ref(self))
         self._autocommit = False
         self._pgconn = None
         self._equote = False
         self._lock = threading.RLock()
+        #: The last notices received. If it's a list it is trimmed to the
+        #: last 50 notices; it can be replaced by any object with an
+        #: append() method, e.g. a collections.deque with a maxlen.
         self.notices = []
 
+        #: The statements prepared automatically on the connection. Set its
+        #: `maxsize` to enable the cache.
+        self.prepared_statements = PreparedStatements()
+
         # The number of commits/rollbacks done so far
         self._mark = 0
 
+        # How much the session was changed since connection or the last reset
+        self._session_state = SESSION_CLEAN
+
+        # The configuration parameters known to the client, as set by the
+        # connection or read from the server. Emptied if the user may have
+        # changed any of them.
+        self._gucs = {}
+
+        # True if the user may have changed configuration parameters in the
+        # current transaction: its end may undo the changes.
+        self._gucs_in_tx = False
+
         self._async = async
         self._async_status = consts.ASYNC_DONE
         self._async_cursor = None
 
-        self_ref = weakref.ref(self)
-        self._notice_callback = ffi.callback(
-            'void(void *, const char *)',
-            lambda arg, message: self_ref()._process_notice(
-                arg, ffi.string(message)))
+        # The cursor whose result is still being received, if any
+        self._stream_cursor = None
 
         if not self._async:
             self._connect_sync()
@@ -120,15 +256,21 @@ class Connection(object):
             self._connect_async()
 
     def _connect_sync(self):
-        self._pgconn = libpq.PQconnectdb(self.dsn)
+        dsn = _startup_dsn(self.dsn)
+        self._pgconn = libpq.PQconnectdb(dsn or self.dsn)
+        if dsn and self._startup_refused():
+            _startup_refused_dsns.add(self.dsn)
+            libpq.PQfinish(self._pgconn)
+            self._pgconn = libpq.PQconnectdb(self.dsn)
+
         if not self._pgconn:
             raise exceptions.OperationalError('PQconnectdb() failed')
         elif libpq.PQstatus(self._pgconn) == libpq.CONNECTION_BAD:
             raise self._create_exception()
 
-        # Register notice processor
-        libpq.PQsetNoticeProcessor(
-                self._pgconn, self._notice_callback, ffi.NULL)
+        # Register notice receiver
+        libpq.PQsetNoticeReceiver(
+                self._pgconn, _notice_receiver, self._notice_handle)
 
         self.status = consts.STATUS_READY
         self._setup()
@@ -142,14 +284,62 @@ class Connection(object):
         of self._setup().
 
         """
-        self._pgconn = libpq.PQconnectStart(self.dsn)
+        self._pgconn = libpq.PQconnectStart(
+            _startup_dsn(self.dsn) or self.dsn)
+        self._connect_started()
+
+    def _connect_started(self):
         if not self._pgconn:
             raise exceptions.OperationalError('PQconnectStart() failed')
         elif libpq.PQstatus(self._pgconn) == libpq.CONNECTION_BAD:
             raise self._create_exception()
 
-        libpq.PQsetNoticeProcessor(
-                self._pgconn, self._notice_callback, ffi.NULL)
+        libpq.PQsetNoticeReceiver(
+                self._pgconn, _notice_receiver, self._notice_handle)
+
+    def _startup_refused(self):
+        """Return True if the connection failed because the server (likely
+        a middleware such as pgbouncer) doesn't accept the startup options.
+
+        The following connections to the same dsn won't send them.
+
+        """
+        if not self._pgconn \
+                or libpq.PQstatus(self._pgconn) != libpq.CONNECTION_BAD:
+            return False
+        options = libpq.PQoptions(self._pgconn)
+        return bool(options) and ffi.string(options) == _startup_options \
+            and 'unsupported startup parameter' in ffi.string(
+                libpq.PQerrorMessage(self._pgconn))
+
+    def _async_to_sync(self):
+        """Turn an asynchronous connection, once set up, into a regular one.
+
+        This allows to establish many connections concurrently polling
+        them, then to use them as if they were created blocking.
+
+        """
+        util.pq_set_non_blocking(self._pgconn, 0, True)
+        self._async = False
+        self._autocommit = False
+
+    def _detach(self):
+        """Close a connection inherited from the parent process after a fork.
+
+        The socket is shared with the parent: it is replaced by /dev/null
+        before PQfinish() so that the Terminate message doesn't reach the
+        server and the parent can keep on using its session.
+
+        """
+        if self._pgconn:
+            fd = libpq.PQsocket(self._pgconn)
+            if fd >= 0:
+                null = os.open(os.devnull, os.O_RDWR)
+                try:
+                    os.dup2(null, fd)
+                finally:
+                    os.close(null)
+        self._close()
 
     def __del__(self):
         self._close()
@@ -173,17 +363,105 @@ class Connection(object):
     @check_closed
     @check_async
     def reset(self):
+        """Return the connection to the state it had after connection.
+
+        Any transaction is aborted and the configuration parameters are
+        reset.
+
+        """
         with self._lock:
+            state = self._session_state
             self._execute_command(
-                "ABORT; RESET ALL; SET SESSION AUTHORIZATION DEFAULT;")
-            self.status = consts.STATUS_READY
-            self._mark += 1
-            self._autocommit = False
-            self._tpc_xid = None
+                "ABORT; RESET ALL; SET SESSION AUTHORIZATION DEFAULT;"
+                + ''.join(['DEALLOCATE "%s";' % name
+                    for name in self.prepared_statements.clear()]))
+            self._gucs.clear()
+            self._set_datestyle()
+            # RESET ALL doesn't undo the other changes
+            if state != SESSION_DIRTY:
+                state = SESSION_CLEAN
+            self._reset_done(state)
+
+    def _reset_session(self):
+        """Undo the changes noticed in the session since connection.
+
+        Only the commands needed are sent: nothing if the connection is idle
+        and was not changed, DISCARD ALL only if something else than the
+        configuration parameters was. The changes made by statements not
+        recognised by _track_session() (e.g. by a function) are not undone.
+
+        """
+        with self._lock:
+            state = self._session_state
+            cmd = ''
+            if libpq.PQtransactionStatus(self._pgconn) != libpq.PQTRANS_IDLE:
+                cmd = 'ABORT;'
+
+            if state == SESSION_DIRTY:
+                # DISCARD ALL can't run in a transaction block
+                if cmd:
+                    self._execute_command(cmd)
+                self._execute_command('DISCARD ALL')
+                self.prepared_statements.clear()
+            elif state == SESSION_GUC:
+                self._execute_command(
+                    cmd + "RESET ALL; SET SESSION AUTHORIZATION DEFAULT")
+            elif cmd:
+                self._execute_command(cmd)
+
+            if state != SESSION_CLEAN:
+                self._gucs.clear()
+                self._set_datestyle()
+            self._reset_done(SESSION_CLEAN)
+
+    def _reset_done(self, state):
+        """Update the connection state after a reset.
+
+        `state` is the state of the session left by the reset.
+
+        """
+        self._session_state = state
+        self.status = consts.STATUS_READY
+        self._end_transaction()
+        self._autocommit = False
+        self._tpc_xid = None
+
+    def _track_session(self, query, hold=False):
+        """Note if a query may change the state to undo in _reset_session().
+
+        `hold` is true if the query declares a cursor WITH HOLD.
+
+        """
+        state = self._session_state
+        guc = _re_session_guc.search(query)
+        if hold:
+            self._session_state = SESSION_DIRTY
+        elif state < SESSION_DIRTY and _re_session_dirty.search(query):
+            self._session_state = SESSION_DIRTY
+        elif state < SESSION_GUC and guc:
+            self._session_state = SESSION_GUC
+
+        if guc:
+            self._gucs.clear()
+            if not self._autocommit:
+                self._gucs_in_tx = True
+
+    def _end_transaction(self):
+        """Note the end of a transaction.
+
+        Forget the configuration parameters possibly changed by the
+        transaction, which may have been undone by its end.
+
+        """
+        self._mark += 1
+        if self._gucs_in_tx:
+            self._gucs.clear()
+            self._gucs_in_tx = False
 
     def _get_guc(self, name):
         """Return the value of a configuration parameter."""
         with self._lock:
+            self._end_stream()
             query = 'SHOW %s' % name
 
             if _green_callback:
@@ -197,22 +475,98 @@ class Connection(object):
             libpq.PQclear(pgres)
             return rv
 
+    def _binary_to_text(self, oid, values):
+        """Convert values of the type `oid` in binary format into their text
+        representation, using the output function of the type on the server.
+
+        None values are left as they are.
+
+        """
+        rv = list(values)
+        items = [(i, v) for i, v in enumerate(values) if v is not None]
+        with self._lock:
+            self._end_stream()
+            for start in xrange(0, len(items), _binary_to_text_batch):
+                batch = items[start:start + _binary_to_text_batch]
+                query = 'SELECT ARRAY[%s]' % ', '.join(
+                    ['$%d::text' % (i + 1) for i in xrange(len(batch))])
+                params = [(oid, 1, v) for i, v in batch]
+
+                if _green_callback:
+                    pgres = self._execute_green(query, 1, params)
+                else:
+                    pgres = util.pq_exec(self._pgconn, query, params, 1)
+                if not pgres:
+                    raise self._create_exception()
+                try:
+                    if libpq.PQresultStatus(pgres) != libpq.PGRES_TUPLES_OK:
+                        raise self._create_exception(pgres=pgres)
+                    texts = typecasts.parse_array_binary(
+                        ffi.buffer(libpq.PQgetvalue(pgres, 0, 0),
+                            libpq.PQgetlength(pgres, 0, 0))[:], None, None)
+                finally:
+                    libpq.PQclear(pgres)
+
+                for (i, v), text in zip(batch, texts):
+                    rv[i] = text
+        return rv
+
+    def _known_guc(self, name):
+        """Return the value of a configuration parameter if known without
+        querying the server, else None.
+
+        The values reported by the server in ParameterStatus messages are
+        preferred to the ones set by the connection.
+
+        """
+        value = libpq.PQparameterStatus(self._pgconn, name)
+        if value:
+            return ffi.string(value)
+        return self._gucs.get(name)
+
+    def _get_cached_guc(self, name):
+        """Return the value of a configuration parameter, querying the
+        server only if the value is not known yet.
+
+        The value read is not cached in a transaction, which may be setting
+        it only until its end.
+
+        """
+        value = self._known_guc(name)
+        if value is None:
+            value = self._get_guc(name)
+            if libpq.PQtransactionStatus(self._pgconn) == libpq.PQTRANS_IDLE:
+                self._gucs[name] = value
+        return value
+
     def _set_guc(self, name, value):
         """Set the value of a configuration parameter."""
-        if value.lower() != 'default':
-            value = util.quote_string(self, value)
-        self._execute_command('SET %s TO %s' % (name, value))
+        self._set_gucs([(name, value)])
 
-    def _set_guc_onoff(self, name, value):
-        """Set the value of a configuration parameter to a boolean.
+    def _set_gucs(self, gucs):
+        """Set the value of several configuration parameters.
+
+        `gucs` is a list of (name, value). The changes are sent in a single
+        statement. They are sent even if the cache says the parameters have
+        the value already: the cache can miss changes made by the queries
+        executed (e.g. in functions or by set_config()).
 
-        The string 'default' is accepted too.
         """
-        if isinstance(value, basestring) and value.lower() == 'default':
-            value = 'default'
-        else:
-            value = value and 'on' or 'off'
-        self._set_guc(name, value)
+        cmds = []
+        for name, value in gucs:
+            if value.lower() == 'default':
+                cmds.append('SET %s TO default' % name)
+            else:
+                cmds.append('SET %s TO %s' % (
+                    name, util.quote_string(self, value)))
+
+        self._execute_command('; '.join(cmds))
+        self._session_state = max(self._session_state, SESSION_GUC)
+        for name, value in gucs:
+            if value.lower() == 'default':
+                self._gucs.pop(name, None)
+            else:
+                self._gucs[name] = value
 
     @property
     @check_closed
@@ -220,7 +574,7 @@ class Connection(object):
         if self._autocommit:
             return consts.ISOLATION_LEVEL_AUTOCOMMIT
         else:
-            name = self._get_guc('default_transaction_isolation')
+            name = self._get_cached_guc('default_transaction_isolation')
             return _isolevels[name.lower()]
 
     @check_async
@@ -228,7 +582,12 @@ class Connection(object):
         if level < 0 or level > 4:
             raise ValueError('isolation level must be between 0 and 4')
 
-        prev = self.isolation_level
+        # Don't trust the cache to skip the change
+        if self._autocommit:
+            prev = consts.ISOLATION_LEVEL_AUTOCOMMIT
+        else:
+            prev = _isolevels[
+                self._get_guc('default_transaction_isolation').lower()]
         if prev == level:
             return
 
@@ -242,6 +601,7 @@ class Connection(object):
     @check_notrans
     def set_session(self, isolation_level=None, readonly=None, deferrable=None,
                     autocommit=None):
+        gucs = []
         if isolation_level is not None:
             if isinstance(isolation_level, int):
                 if isolation_level < 1 or isolation_level > 4:
@@ -255,13 +615,17 @@ class Connection(object):
             else:
                 raise TypeError("bad isolation level: '%r'" % isolation_level)
 
-            self._set_guc("default_transaction_isolation", isolation_level)
+            gucs.append(('default_transaction_isolation', isolation_level))
 
         if readonly is not None:
-            self._set_guc_onoff('default_transaction_read_only', readonly)
+            gucs.append(('default_transaction_read_only', _onoff(readonly)))
 
         if deferrable is not None:
-            self._set_guc_onoff('default_transaction_deferrable', deferrable)
+            gucs.append(
+                ('default_transaction_deferrable', _onoff(deferrable)))
+
+        if gucs:
+            self._set_gucs(gucs)
 
         if autocommit is not None:
             self._autocommit = bool(autocommit)
@@ -431,6 +795,9 @@ class Connection(object):
                 return self._poll_setup_async()
             return res
 
+        if self.status == consts.STATUS_DATESTYLE and self._async:
+            return self._poll_setup_async()
+
         if self.status in (consts.STATUS_READY, consts.STATUS_BEGIN,
                            consts.STATUS_PREPARED):
             res = self._poll_query()
@@ -447,6 +814,7 @@ class Connection(object):
                 libpq.PQclear(curs._pgres)
 
                 curs._pgres = util.pq_get_last_result(self._pgconn)
+                self.prepared_statements.check_result(None, curs._pgres)
                 try:
                     curs._pq_fetch()
                 finally:
@@ -472,6 +840,13 @@ class Connection(object):
         if res is None:
             return consts.POLL_ERROR
         elif res == consts.POLL_ERROR:
+            if self._startup_refused():
+                # Try again without the startup options
+                _startup_refused_dsns.add(self.dsn)
+                libpq.PQfinish(self._pgconn)
+                self._pgconn = libpq.PQconnectStart(self.dsn)
+                self._connect_started()
+                return consts.POLL_WRITE
             raise self._create_exception()
         return res
 
@@ -584,23 +959,72 @@ class Connection(object):
             raise exceptions.OperationalError("can't get cancellation key")
 
         with self._lock:
-            # If the current datestyle is not compatible (not ISO) then
-            # force it to ISO
-            datestyle = ffi.string(
-                    libpq.PQparameterStatus(self._pgconn, 'DateStyle'))
-            if not datestyle or not datestyle.startswith('ISO'):
-                self.status = consts.STATUS_DATESTYLE
-                self._set_guc('datestyle', 'ISO')
-
+            self._set_datestyle()
             self._closed = False
 
-    def _begin_transaction(self):
+    def _set_datestyle(self):
+        # If the current datestyle is not compatible (not ISO) then
+        # force it to ISO
+        datestyle = ffi.string(
+                libpq.PQparameterStatus(self._pgconn, 'DateStyle'))
+        if not datestyle or not datestyle.startswith('ISO'):
+            self.status = consts.STATUS_DATESTYLE
+            self._set_guc('datestyle', 'ISO')
+            self._session_state = SESSION_CLEAN
+
+    def _begin_transaction(self, defer=False):
+        """Start a transaction if required.
+
+        If `defer` is true and `deferred_begin` is set return True instead
+        of sending the BEGIN: the caller will run the query with
+        _execute_with_begin().
+
+        """
         if self.status == consts.STATUS_READY and not self._autocommit:
+            if defer and self.deferred_begin:
+                return True
             self._execute_command('BEGIN')
             self.status = consts.STATUS_BEGIN
+        return False
+
+    def _execute_with_begin(self, query, all_results=False):
+        """Start a transaction and execute a query in the same roundtrip.
+
+        Return the last result of the query, or the list of all its results
+        if `all_results` is true. If the BEGIN fails, or if the query is
+        rejected by the parser (in which case the BEGIN is not executed
+        either) the error is the only result.
+
+        """
+        query = 'BEGIN;' + query
+        if self._have_wait_callback():
+            results = self._execute_green(query, all_results=True)
+        elif libpq.PQsendQuery(self._pgconn, query):
+            results = util.pq_get_results(self._pgconn)
+        else:
+            results = None
+        if not results:
+            return all_results and results or ffi.NULL
+
+        if libpq.PQtransactionStatus(self._pgconn) != libpq.PQTRANS_IDLE:
+            self.status = consts.STATUS_BEGIN
+
+        if libpq.PQresultStatus(results[0]) == libpq.PGRES_COMMAND_OK:
+            libpq.PQclear(results.pop(0))
+            if not results:
+                raise exceptions.ProgrammingError(
+                    "can't execute an empty query")
+
+        if all_results:
+            return results
+        for pgres in results[:-1]:
+            self.prepared_statements.check_result(None, pgres)
+            libpq.PQclear(pgres)
+        return results[-1]
 
     def _execute_command(self, command):
         with self._lock:
+            self._end_stream()
             if _green_callback:
                 pgres = self._execute_green(command)
             else:
@@ -615,20 +1039,69 @@ class Connection(object):
             finally:
                 libpq.PQclear(pgres)
 
+    def _end_stream(self):
+        """Let the cursor receiving a result finish with it, to make the
+        connection available for a new command."""
+        if self._stream_cursor is None:
+            return
+
+        cursor = self._stream_cursor()
+        self._stream_cursor = None
+        if cursor is not None:
+            cursor._end_stream()
+        else:
+            util.pq_clear_async(self._pgconn)
+
+    def _get_prepared(self, query, params):
+        """Return the (key, name) of the statement to execute a query.
+
+        The name is None if the query should not be executed as a prepared
+        statement. The statement is created if it is not prepared yet.
+
+        """
+        prepared = self.prepared_statements
+        key, name, prepare = prepared.lookup(query, params)
+        if not prepare:
+            return key, name
+
+        if libpq.PQtransactionStatus(self._pgconn) != libpq.PQTRANS_INERROR:
+            cmd = prepared.get_deallocate()
+            if cmd is not None:
+                self._execute_command(cmd)
+
+        pgres = util.pq_prepare(self._pgconn, name, query, params)
+        if not pgres:
+            prepared.forget(key)
+            raise self._create_exception()
+        try:
+            if libpq.PQresultStatus(pgres) != libpq.PGRES_COMMAND_OK:
+                prepared.forget(key)
+                raise self._create_exception(pgres=pgres)
+        finally:
+            libpq.PQclear(pgres)
+
+        return key, name
+
     def _execute_tpc_command(self, command, xid):
         cmd = '%s %s' % (command, util.quote_string(self, str(xid)))
         self._execute_command(cmd)
-        self._mark += 1
+        self._end_transaction()
+
+    def _execute_green(self, query, result_format=0, params=None,
+            all_results=False):
+        """Execute version for green threads
 
-    def _execute_green(self, query):
-        """Execute version for green threads"""
+        Return the last result, or the list of all the results of the query
+        if `all_results` is true.
+
+        """
         if self._async_cursor:
             raise exceptions.ProgrammingError(
                 "a single async query can be executed on the same connection")
 
         self._async_cursor = True
 
-        if not libpq.PQsendQuery(self._pgconn, query):
+        if not util.pq_send_query(self._pgconn, query, params, result_format):
             self._async_cursor = None
             return
 
@@ -636,6 +1109,8 @@ class Connection(object):
 
         try:
             _green_callback(self)
+            if all_results:
+                return util.pq_get_results(self._pgconn)
             return util.pq_get_last_result(self._pgconn)
         except:
             util.pq_clear_async(self._pgconn)
@@ -688,7 +1163,7 @@ class Connection(object):
             return
 
         with self._lock:
-            self._mark += 1
+            self._end_transaction()
             try:
                 self._execute_command('COMMIT')
             finally:
@@ -697,7 +1172,7 @@ class Connection(object):
     def _rollback(self):
         if self._autocommit or self.status != consts.STATUS_BEGIN:
             return
-        self._mark += 1
+        self._end_transaction()
         self._execute_command('ROLLBACK')
         self.status = consts.STATUS_READY
 
@@ -721,17 +1196,28 @@ class Connection(object):
             self._process_notifies()
             return res
 
-    def _process_notice(self, arg, message):
-        """Store the given message in `self.notices`
+    def _process_notice(self, pgres):
+        """Store the message of a notice in `self.notices`
 
-        Also delete older entries to make sure there are no more then 50
-        entries in the list.
+        If `notices` is a list, delete older entries to make sure there are
+        no more then 50 entries in it. Pass the notice to `notice_hook`, if
+        set.
 
         """
-        self.notices.append(message)
-        length = len(self.notices)
-        if length > 50:
-            del self.notices[:length - 50]
+        message = ffi.string(libpq.PQresultErrorMessage(pgres))
+        notices = self.notices
+        notices.append(message)
+        if isinstance(notices, list):
+            length = len(notices)
+            if length > 50:
+                del notices[:length - 50]
+
+        if self.notice_hook is not None:
+            diag = {'message': message}
+            for name, code in _notice_fields:
+                value = libpq.PQresultErrorField(pgres, code)
+                diag[name] = value and ffi.string(value) or None
+            self.notice_hook(diag)
 
     def _process_notifies(self):
         while True:
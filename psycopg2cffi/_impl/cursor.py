@@ -9,7 +9,8 @@ from psycopg2cffi._impl import exceptions
 from psycopg2cffi._impl.libpq import libpq, ffi
 from psycopg2cffi._impl import typecasts
 from psycopg2cffi._impl import util
-from psycopg2cffi._impl.adapters import _getquoted
+from psycopg2cffi._impl.adapters import _getquoted, _getbinding
+from psycopg2cffi._impl.adapters import _copy_encoder
 from psycopg2cffi._impl.exceptions import InterfaceError, ProgrammingError
 
 
@@ -50,6 +51,11 @@ def check_async(func):
 Column = namedtuple('Column', ['name', 'type_code', 'display_size',
     'internal_size', 'precision', 'scale', 'null_ok'])
 
+# Status of the results carrying part of the rows of a streamed query
+_stream_statuses = tuple([getattr(libpq, name)
+    for name in ('PGRES_SINGLE_TUPLE', 'PGRES_TUPLES_CHUNK')
+    if hasattr(libpq, name)])
+
 
 class Cursor(object):
     """These objects represent a database cursor, which is used to manage
@@ -82,6 +88,57 @@ class Cursor(object):
         #: cursor. The default is 10000
         self.itersize = 10000
 
+        #: Read/write attribute specifying if a named cursor fetches at
+        #: least `itersize` rows at a time from the backend, keeping the
+        #: rows not consumed yet for the following .fetchone()/.fetchmany()
+        #: calls. By default every fetch method call sends a FETCH. Once a
+        #: batch of rows is received the FETCH of the next one is sent at
+        #: once, and its result is read only when the rows are needed, so
+        #: that the backend works while the rows are processed. Rows are
+        #: read from the backend before they are requested, so don't use
+        #: it if this matters, e.g. for SELECT ... FOR UPDATE queries.
+        self.prefetch = False
+
+        #: Read/write attribute specifying if the results of the queries
+        #: are requested to the backend in binary format, which is cheaper
+        #: to convert. It can be overridden by the `binary` parameter of
+        #: .execute(). Queries executed in binary mode must contain a single
+        #: statement. The typecasters registered by the user are applied to
+        #: the string, json, jsonb and uuid columns; if one is registered
+        #: for another type the results are requested in text format. The
+        #: values of the types without a binary typecaster are converted to
+        #: text by the server, with an extra query, and returned as in text
+        #: mode; this is not possible for streamed results.
+        self.binary = False
+
+        #: Read/write attribute specifying if the query parameters are sent
+        #: to the backend separately from the query (using $n placeholders)
+        #: instead of being quoted and merged into the query string. Values
+        #: whose adapter can't be sent this way are still merged. Queries
+        #: with bound parameters must contain a single statement.
+        self.server_binding = False
+
+        #: Read/write attribute specifying the number of statements sent
+        #: to the backend in a single roundtrip by .executemany(). The
+        #: default is 1: every statement is executed on its own, which is
+        #: also the behaviour of named cursors and of cursors using
+        #: `server_binding`. The statements of a page are executed as a
+        #: single query string: in autocommit mode an error rolls back the
+        #: whole page it belongs to, while the previous pages stay
+        #: committed.
+        self.pagesize = 1
+
+        #: Read/write attribute specifying if the rows of the queries are
+        #: received while they are fetched, instead of all together by
+        #: .execute(), so that the memory used doesn't depend on the size
+        #: of the result. No other command can run on the connection until
+        #: the rows are all fetched: if one is executed, the rows not
+        #: received yet are discarded. The rowcount is -1 until the last
+        #: row is fetched. Queries streamed must contain a single statement.
+        #: Not used by named cursors. It requires libpq 9.2; with libpq 17
+        #: the rows are received in chunks of `itersize`.
+        self.stream = False
+
         self.tzinfo_factory = tz.FixedOffsetTimezone
         self.row_factory = row_factory
 
@@ -97,13 +154,27 @@ class Cursor(object):
         self._statusmessage = None
         self._typecasts = {}
         self._pgres = ffi.NULL
+        self._result_format = 0
+        self._binary_result = False
+        # Columns of a binary result without a binary typecaster:
+        # index -> their values converted to text, once requested
+        self._server_text = {}
         self._copyfile = None
         self._copysize = None
+        self._copyiter = False
+        self._stream_pos = None
+        self._streaming = False
+        self._mark = 0
+        self._buf_start = 0
+        self._buf_exhausted = False
+        self._fetch_pending = None
+        self._next_fetch = None
 
     def __del__(self):
         if self._pgres:
             libpq.PQclear(self._pgres)
             self._pgres = ffi.NULL
+        self._clear_next_fetch()
 
     @property
     def closed(self):
@@ -178,11 +249,15 @@ class Cursor(object):
         """
         if self._name is not None:
             self._pq_execute('CLOSE "%s"' % self._name)
+            self._clear_next_fetch()
+        elif self._streaming:
+            with self._conn._lock:
+                self._conn._end_stream()
 
         self._closed = True
 
     @check_closed
-    def execute(self, query, parameters=None):
+    def execute(self, query, parameters=None, binary=None):
         """Prepare and execute a database operation (query or command).
 
         Parameters may be provided as sequence or mapping and will be bound to
@@ -206,12 +281,20 @@ class Cursor(object):
         multiple rows in a single operation, but this kind of usage is
         deprecated: .executemany() should be used instead.
 
+        If `binary` is specified it overrides the cursor .binary attribute
+        for this query.
+
         Return values are not defined.
 
         """
         self._description = None
+        self._stream_pos = None
         conn = self._conn
 
+        if binary is None:
+            binary = self.binary
+        self._result_format = binary and self._binary_casts_ok() and 1 or 0
+
         if self._name:
             if self._query:
                 raise ProgrammingError(
@@ -222,22 +305,35 @@ class Cursor(object):
 
         if isinstance(query, unicode):
             query = query.encode(self._conn._py_enc)
+        conn._track_session(query, self._withhold)
 
-        if parameters is not None:
-            self._query = _combine_cmd_params(query, parameters, conn)
-        else:
+        params = None
+        if parameters is None:
             self._query = query
+        elif self.server_binding:
+            self._query, params = _bind_cmd_params(query, parameters, conn)
+        else:
+            self._query = _combine_cmd_params(query, parameters, conn)
 
-        conn._begin_transaction()
+        begin = conn._begin_transaction(
+            defer=params is None and not self._result_format)
         self._clear_pgres()
 
         if self._name:
+            self._mark = conn._mark
+            self._buf_start = 0
+            self._buf_exhausted = False
             self._query = 'DECLARE "%s" CURSOR %s HOLD FOR %s' % (
                 self._name,
                 self._withhold and "WITH" or "WITHOUT", # youuuuu
                 self._query)
 
-        self._pq_execute(self._query, conn._async)
+        if self.stream and not self._name:
+            self._pq_execute_stream(
+                self._query, self._result_format, params, begin)
+        else:
+            self._pq_execute(self._query, conn._async, self._result_format,
+                params, prepare=not self._name, begin=begin)
 
 
     @check_closed
@@ -259,17 +355,43 @@ class Cursor(object):
         The same comments as for .execute() also apply accordingly to this
         method.
 
+        If .pagesize is greater than 1 the statements are sent to the backend
+        in pages of .pagesize statements, each page in a single roundtrip. In
+        autocommit mode every page is executed in its own transaction.
+
         Return values are not defined.
 
         """
         self._rowcount = -1
         rowcount = 0
+
+        if self._name or self.server_binding or self.pagesize <= 1:
+            for params in paramlist:
+                self.execute(query, params)
+                if self.rowcount == -1:
+                    rowcount = -1
+                else:
+                    rowcount += self.rowcount
+            self._rowcount = rowcount
+            return
+
+        self._description = None
+        conn = self._conn
+        if isinstance(query, unicode):
+            query = query.encode(conn._py_enc)
+        conn._track_session(query)
+
+        page = []
         for params in paramlist:
-            self.execute(query, params)
-            if self.rowcount == -1:
-                rowcount = -1
+            if params is None:
+                page.append(query)
             else:
-                rowcount += self.rowcount
+                page.append(_combine_cmd_params(query, params, conn))
+            if len(page) >= self.pagesize:
+                rowcount = self._pq_execute_many('\n;'.join(page), rowcount)
+                del page[:]
+        if page:
+            rowcount = self._pq_execute_many('\n;'.join(page), rowcount)
         self._rowcount = rowcount
 
     @check_closed
@@ -283,9 +405,18 @@ class Cursor(object):
         .execute*() did not produce any result set or no call was issued yet.
 
         """
-        if self._name is not None:
-            self._pq_execute(
-                'FETCH FORWARD 1 FROM "%s"' % self._name)
+        if self._name is not None and self.prefetch:
+            rows = self._fetch_buffered(1)
+            if rows:
+                return rows[0]
+            return None
+        elif self._name is not None:
+            self._pq_fetch_named(1)
+        elif self._stream_pos is not None:
+            rows = self._fetch_stream(1)
+            if rows:
+                return rows[0]
+            return None
 
         if self._rownumber >= self._rowcount:
             return None
@@ -321,9 +452,14 @@ class Cursor(object):
         if size is None:
             size = self.arraysize
 
-        if self._name is not None:
-            self._pq_execute(
-                'FETCH FORWARD %d FROM "%s"' % (size, self._name))
+        if self._name is not None and self.prefetch:
+            if size < 0:
+                size = None
+            return self._fetch_buffered(size)
+        elif self._name is not None:
+            self._pq_fetch_named(size)
+        elif self._stream_pos is not None:
+            return self._fetch_stream(size)
 
         if size > self._rowcount - self._rownumber or size < 0:
             size = self._rowcount - self._rownumber
@@ -331,10 +467,8 @@ class Cursor(object):
         if size <= 0:
             return []
 
-        rows = []
-        for i in xrange(size):
-            rows.append(self._build_row(self._rownumber))
-            self._rownumber += 1
+        rows = self._build_rows(self._rownumber, self._rownumber + size)
+        self._rownumber += size
         return rows
 
     @check_closed
@@ -350,18 +484,68 @@ class Cursor(object):
         .execute*() did not produce any result set or no call was issued yet.
 
         """
-        if self._name is not None:
-            self._pq_execute('FETCH FORWARD ALL FROM "%s"' % self._name)
+        if self._name is not None and self.prefetch:
+            return self._fetch_buffered(None)
+        elif self._name is not None:
+            self._pq_fetch_named('ALL')
+        elif self._stream_pos is not None:
+            return self._fetch_stream(-1)
 
         size = self._rowcount - self._rownumber
         if size <= 0:
             return []
 
-        result = []
-        for row in xrange(size):
-            result.append(self._build_row(self._rownumber))
-            self._rownumber += 1
-        return result
+        rows = self._build_rows(self._rownumber, self._rowcount)
+        self._rownumber = self._rowcount
+        return rows
+
+    @check_closed
+    @check_no_tuples
+    def fetchnumpy(self):
+        """Fetch all (remaining) rows of a query result, returning them as a
+        dict mapping the columns names to NumPy masked arrays, with the null
+        values masked.
+
+        bool, int2/4/8, oid, float4/8, date, timestamp and timestamptz
+        columns are returned as arrays of the matching NumPy type, without
+        creating a Python object per value: they are copied as they are if
+        the query was executed with `binary` results, else parsed from the
+        text (in this case the typecasters registered by the user for these
+        types are honoured). Columns of other types are converted by the
+        cursor typecasters into arrays of objects. The columns must have
+        distinct names.
+
+        This method requires NumPy.
+
+        """
+        from psycopg2cffi._impl import numpy_fetch
+
+        if self._stream_pos is not None:
+            raise exceptions.NotSupportedError(
+                "fetchnumpy() is not available on streaming cursors")
+
+        if self._name is None:
+            start = max(self._rownumber, 0)
+            end = max(self._rowcount, start)
+            arrays = numpy_fetch.build_arrays(self, start, end)
+            self._rownumber = end
+            return arrays
+
+        # Join the rows left in the buffer by prefetch to the ones fetched
+        arrays = None
+        while 1:
+            if self._rownumber < self._rowcount or \
+                    arrays is None and self._buf_exhausted:
+                start = max(self._rownumber, 0)
+                part = numpy_fetch.build_arrays(self, start, self._rowcount)
+                self._rownumber = self._rowcount
+                if arrays is None:
+                    arrays = part
+                else:
+                    arrays = numpy_fetch.concatenate(arrays, part)
+            if self._buf_exhausted:
+                return arrays
+            self._pq_fetch_named('ALL')
 
     def nextset(self):
         """This method will make the cursor skip to the next available set,
@@ -476,6 +660,65 @@ class Cursor(object):
             self._copyfile = None
             self._copysize = None
 
+    @check_closed
+    @check_async
+    def copy_records(self, table, records, columns=None, size=8192):
+        """Append a sequence of records to a database table (COPY table FROM
+        STDIN syntax).
+
+        Every record is a sequence of values, converted in the COPY format
+        by the same adapters used for the query parameters (adapters without
+        a getbinding() method are not supported). The data is sent to the
+        backend in chunks of about `size` bytes.
+
+        """
+        if columns:
+            columns_str = '(%s)' % ','.join([column for column in columns])
+        else:
+            columns_str = ''
+
+        query = "COPY %s%s FROM stdin" % (table, columns_str)
+
+        self._copysize = size
+        self._copyfile = _CopyRecordsReader(records, self._conn)
+        try:
+            self._pq_execute(query)
+        finally:
+            self._copyfile = None
+            self._copysize = None
+
+    @check_closed
+    @check_async
+    def copy_to_iter(self, sql, size=8192, wait=True):
+        """Execute a COPY ... TO STDOUT statement and return an iterator on
+        the data produced.
+
+        The rows are joined in strings of at least `size` bytes (except the
+        last one), each made of whole rows.
+
+        If `wait` is false the iterator doesn't block waiting for data from
+        the backend: it returns an empty string when no data is available,
+        then the connection fileno() should be waited for reading before
+        asking for more data.
+
+        No other command can run on the connection until the iterator is
+        consumed: if one is executed, or if the iterator is closed or
+        discarded early, the remaining data is read and thrown away.
+
+        """
+        self._copyiter = True
+        try:
+            self._pq_execute(sql)
+        finally:
+            self._copyiter = False
+
+        if not self._pgres or \
+                libpq.PQresultStatus(self._pgres) != libpq.PGRES_COPY_OUT:
+            raise ProgrammingError(
+                "copy_to_iter() requires a COPY ... TO STDOUT statement")
+
+        return _CopyOutIterator(self, size, wait)
+
     @check_closed
     def setinputsizes(self, sizes):
         """This can be used before a call to .execute*() to predefine memory
@@ -611,6 +854,9 @@ class Cursor(object):
 
     @check_closed
     def scroll(self, value, mode='relative'):
+        if self._stream_pos is not None:
+            raise ProgrammingError("can't scroll a streaming cursor")
+
         if not self._name:
             if mode == 'relative':
                 new_pos = self._rownumber + value
@@ -635,19 +881,46 @@ class Cursor(object):
             # This should also raise a ProgrammingError if the mode is
             # not absolute or relative. But mimic psycopg for now.
             if mode == 'absolute':
-                cmd = 'MOVE ABSOLUTE %d FROM "%s"' % (value, self._name)
+                new_pos = value
             else:
-                cmd = 'MOVE %d FROM "%s"' % (value, self._name)
-            self._pq_execute(cmd)
-            self._pq_fetch()  # XXX: should be prefetch?
+                new_pos = self._buf_start + max(self._rownumber, 0) + value
+
+            # Move in the rows buffered if possible, else move the backend
+            # cursor, which is positioned on the last row buffered, or
+            # after the last row of the result if a FETCH got to its end.
+            if 0 <= new_pos - self._buf_start < self._rowcount:
+                self._rownumber = new_pos - self._buf_start
+                return
+
+            server_pos = self._buf_start + max(self._rowcount, 0)
+            if self._buf_exhausted:
+                server_pos += 1
+            server_pos += self._drop_next_fetch()
+            self._pq_execute('MOVE %d FROM "%s"' % (
+                new_pos - server_pos, self._name))
+            self._buf_start = new_pos
+            self._buf_exhausted = False
+            self._rowcount = self._rownumber = 0
 
     def _clear_pgres(self):
         if self._pgres:
             libpq.PQclear(self._pgres)
             self._pgres = ffi.NULL
+        for i in self._server_text:
+            self._server_text[i] = None
 
-    def _pq_execute(self, query, async=False):
-        """Execute the query"""
+    def _pq_execute(self, query, async=False, result_format=0, params=None,
+            prepare=False, begin=False):
+        """Execute the query
+
+        Results in binary format are requested using the extended query
+        protocol if `result_format` is 1. `params` is an optional sequence of
+        (oid, format, value) triples to bind to the query $n placeholders.
+        If `prepare` is true the query may be executed using the connection
+        prepared statements cache. If `begin` is true the transaction is
+        started by this query (see Connection._begin_transaction()).
+
+        """
         pgconn = self._conn._pgconn
 
         # Check the status of the connection
@@ -656,10 +929,30 @@ class Cursor(object):
 
         if not async:
             with self._conn._lock:
-                if not self._conn._have_wait_callback():
-                    self._pgres = libpq.PQexec(pgconn, query)
+                self._conn._end_stream()
+                self._clear_pgres()
+                key = name = None
+                green = self._conn._have_wait_callback()
+                if prepare and not green:
+                    key, name = self._conn._get_prepared(query, params)
+                # A prepared statement can't be sent together with the BEGIN
+                if begin and name is None:
+                    self._pgres = self._conn._execute_with_begin(query)
+                elif green:
+                    if begin:
+                        self._conn._begin_transaction()
+                    self._pgres = self._conn._execute_green(
+                        query, result_format, params)
                 else:
-                    self._pgres = self._conn._execute_green(query)
+                    if begin:
+                        self._conn._begin_transaction()
+                    if name is None:
+                        self._pgres = util.pq_exec(
+                            pgconn, query, params, result_format)
+                    else:
+                        self._pgres = util.pq_exec_prepared(
+                            pgconn, name, params, result_format)
+                self._conn.prepared_statements.check_result(key, self._pgres)
                 if not self._pgres:
                     raise self._conn._create_exception(pgres=self._pgres)
                 self._conn._process_notifies()
@@ -667,7 +960,7 @@ class Cursor(object):
 
         else:
             with self._conn._lock:
-                ret = libpq.PQsendQuery(pgconn, query)
+                ret = util.pq_send_query(pgconn, query, params, result_format)
                 if not ret:
 
                     # XXX: check if this is correct, seems like a hack.
@@ -689,7 +982,307 @@ class Cursor(object):
             self._conn._async_status = async_status
             self._conn._async_cursor = weakref.ref(self)
 
+    def _pq_execute_many(self, query, rowcount):
+        """Execute a query made of several statements
+
+        Return `rowcount` increased by the number of rows affected by every
+        statement.
+
+        """
+        conn = self._conn
+        pgconn = conn._pgconn
+        self._query = query
+        begin = conn._begin_transaction(defer=True)
+        self._clear_pgres()
+
+        if libpq.PQstatus(pgconn) != libpq.CONNECTION_OK:
+            raise conn._create_exception()
+
+        with conn._lock:
+            conn._end_stream()
+            if begin:
+                results = conn._execute_with_begin(query, all_results=True)
+            elif conn._have_wait_callback():
+                results = conn._execute_green(query, all_results=True)
+            elif libpq.PQsendQuery(pgconn, query):
+                results = util.pq_get_results(pgconn)
+            else:
+                results = None
+            if not results:
+                raise conn._create_exception()
+            conn._process_notifies()
+
+        try:
+            for i, pgres in enumerate(results):
+                conn.prepared_statements.check_result(None, pgres)
+                self._clear_pgres()
+                self._pgres = pgres
+                results[i] = None
+                self._pq_fetch()
+                if self._rowcount == -1:
+                    rowcount = -1
+                else:
+                    rowcount += self._rowcount
+        finally:
+            for pgres in results:
+                if pgres:
+                    libpq.PQclear(pgres)
+
+        return rowcount
+
+    def _pq_fetch_named(self, count):
+        """Fetch the next `count` rows ('ALL' for all of them) of a named
+        cursor, replacing the rows fetched before.
+
+        If a FETCH was sent in advance its rows are used instead, whatever
+        their number. With `prefetch` the FETCH of the next `itersize` rows
+        is sent in advance.
+
+        """
+        self._buf_start += max(self._rowcount, 0)
+        with self._conn._lock:
+            if self._fetch_pending is not None:
+                self._receive_fetch()
+
+        if self._next_fetch is not None:
+            count, pgres = self._next_fetch
+            self._next_fetch = None
+            self._clear_pgres()
+            self._pgres = pgres
+            if not self._pgres:
+                raise self._conn._create_exception()
+            self._pq_fetch()
+        else:
+            self._pq_execute(
+                'FETCH FORWARD %s FROM "%s"' % (count, self._name),
+                result_format=self._result_format)
+        self._buf_exhausted = count == 'ALL' or self._rowcount < count
+
+        if self.prefetch and count != 'ALL' and not self._buf_exhausted:
+            self._send_fetch(max(self.itersize, 1))
+
+    def _send_fetch(self, count):
+        """Send the FETCH of the next `count` rows without waiting for its
+        result, which is read by _receive_fetch()."""
+        conn = self._conn
+        if conn._have_wait_callback():
+            return
+
+        with conn._lock:
+            conn._end_stream()
+            if not util.pq_send_query(conn._pgconn,
+                    'FETCH FORWARD %d FROM "%s"' % (count, self._name),
+                    None, self._result_format):
+                raise conn._create_exception()
+            self._fetch_pending = count
+            conn._stream_cursor = weakref.ref(self)
+
+    def _receive_fetch(self):
+        """Read the result of the FETCH sent in advance into _next_fetch.
+
+        Must be called holding the connection lock.
+
+        """
+        conn = self._conn
+        conn._stream_cursor = None
+        pgres = util.pq_get_last_result(conn._pgconn)
+        self._next_fetch = (self._fetch_pending, pgres or ffi.NULL)
+        self._fetch_pending = None
+        conn._process_notifies()
+
+    def _drop_next_fetch(self):
+        """Discard the rows fetched in advance, if any.
+
+        Return the number of positions the FETCH moved the backend cursor.
+
+        """
+        with self._conn._lock:
+            if self._fetch_pending is not None:
+                self._receive_fetch()
+        if self._next_fetch is None:
+            return 0
+
+        count, pgres = self._next_fetch
+        try:
+            if libpq.PQresultStatus(pgres) != libpq.PGRES_TUPLES_OK:
+                raise self._conn._create_exception(pgres=pgres)
+            rows = libpq.PQntuples(pgres)
+        finally:
+            self._clear_next_fetch()
+
+        # A FETCH getting fewer rows than requested goes past the end
+        return rows < count and rows + 1 or rows
+
+    def _clear_next_fetch(self):
+        if self._next_fetch is not None:
+            if self._next_fetch[1]:
+                libpq.PQclear(self._next_fetch[1])
+            self._next_fetch = None
+
+    def _end_stream(self):
+        """Finish receiving the current result, before the connection runs
+        another command: keep the rows fetched in advance, discard the rest
+        of a streamed result.
+
+        Called by the connection holding its lock.
+
+        """
+        if self._fetch_pending is not None:
+            self._receive_fetch()
+        else:
+            self._streaming = False
+            util.pq_clear_async(self._conn._pgconn)
+
+    def _fetch_buffered(self, size):
+        """Return up to `size` rows of a named cursor (all the remaining
+        ones if `size` is None), fetching at least `itersize` rows from the
+        backend when the rows buffered are not enough."""
+        rows = []
+        while size is None or len(rows) < size:
+            if self._rownumber >= self._rowcount:
+                if self._buf_exhausted:
+                    break
+                if size is None:
+                    self._pq_fetch_named('ALL')
+                else:
+                    self._pq_fetch_named(max(size - len(rows), self.itersize))
+                continue
+
+            end = self._rowcount
+            if size is not None:
+                end = min(end, self._rownumber + size - len(rows))
+            rows.extend(self._build_rows(self._rownumber, end))
+            self._rownumber = end
+
+        return rows
+
+    def _pq_execute_stream(self, query, result_format=0, params=None,
+            begin=False):
+        """Execute the query receiving its rows one by one (or in chunks)
+
+        The first result is read: if it's not a row (e.g. the query
+        returned no row, or it's not a select, or it failed) it is
+        processed as the result of a regular query. Otherwise the following
+        rows are read by _fetch_stream().
+
+        """
+        conn = self._conn
+        pgconn = conn._pgconn
+
+        if conn._async:
+            raise ProgrammingError(
+                "asynchronous connections cannot stream results")
+        if not _stream_statuses:
+            raise exceptions.NotSupportedError(
+                "streaming results requires libpq 9.2 or later")
+        if conn._have_wait_callback():
+            raise exceptions.NotSupportedError(
+                "streaming results is not supported with a wait callback")
+
+        if libpq.PQstatus(pgconn) != libpq.CONNECTION_OK:
+            raise conn._create_exception()
+
+        with conn._lock:
+            conn._end_stream()
+            self._streaming = False
+            if begin:
+                conn._begin_transaction()
+            if not util.pq_send_query(pgconn, query, params, result_format):
+                raise conn._create_exception()
+
+            if hasattr(libpq, 'PQsetChunkedRowsMode'):
+                libpq.PQsetChunkedRowsMode(pgconn, max(self.itersize, 1))
+            else:
+                libpq.PQsetSingleRowMode(pgconn)
+
+            self._pgres = libpq.PQgetResult(pgconn)
+            if self._pgres and \
+                    libpq.PQresultStatus(self._pgres) in _stream_statuses:
+                conn._stream_cursor = weakref.ref(self)
+                self._streaming = True
+            else:
+                # Keep the last result, as PQexec would
+                for pgres in util.pq_get_results(pgconn):
+                    conn.prepared_statements.check_result(None, self._pgres)
+                    self._clear_pgres()
+                    self._pgres = pgres
+                conn.prepared_statements.check_result(None, self._pgres)
+            conn._process_notifies()
+
+        if not self._pgres:
+            raise conn._create_exception()
+
+        if not self._streaming:
+            return self._pq_fetch()
+
+        self._pq_fetch_tuples()
+        self._statusmessage = None
+        self._rowcount = -1
+        self._rownumber = 0
+        self._stream_pos = 0
+
+    def _fetch_stream(self, size):
+        """Return up to `size` rows of a streamed result (all the remaining
+        ones if `size` is negative), receiving them as needed."""
+        rows = []
+        with self._conn._lock:
+            while size < 0 or len(rows) < size:
+                end = self._pgres and libpq.PQntuples(self._pgres) or 0
+                if self._stream_pos >= end:
+                    if self._streaming and self._stream_next():
+                        continue
+                    break
+
+                if size >= 0:
+                    end = min(end, self._stream_pos + size - len(rows))
+                if end - self._stream_pos == 1:
+                    # single-row mode: skip the columns machinery
+                    rows.append(self._build_row(self._stream_pos))
+                else:
+                    rows.extend(self._build_rows(self._stream_pos, end))
+                self._rownumber += end - self._stream_pos
+                self._stream_pos = end
+
+        return rows
+
+    def _stream_next(self):
+        """Receive the next rows of a streamed result into self._pgres.
+
+        Must be called holding the connection lock.
+
+        Return False if there are no more rows: in this case the final
+        results of the query are consumed, setting the rowcount and the
+        status message, or raising the error of the query.
+
+        """
+        conn = self._conn
+        self._clear_pgres()
+        self._stream_pos = 0
+        self._pgres = libpq.PQgetResult(conn._pgconn)
+        if self._pgres and \
+                libpq.PQresultStatus(self._pgres) in _stream_statuses:
+            return True
+
+        self._streaming = False
+        conn._stream_cursor = None
+        results = util.pq_get_results(conn._pgconn)
+        conn._process_notifies()
+
+        for pgres in results:
+            libpq.PQclear(pgres)
+
+        self._rowcount = self._rownumber
+        if not self._pgres:
+            return False
+
+        if libpq.PQresultStatus(self._pgres) != libpq.PGRES_TUPLES_OK:
+            raise conn._create_exception(pgres=self._pgres)
+        self._statusmessage = ffi.string(libpq.PQcmdStatus(self._pgres))
+        self._clear_pgres()
+        return False
+
     def _pq_fetch(self):
+        self._stream_pos = None
         pgstatus = libpq.PQresultStatus(self._pgres)
         self._statusmessage = ffi.string(libpq.PQcmdStatus(self._pgres))
 
@@ -725,8 +1318,12 @@ class Cursor(object):
         with self._conn._lock:
             self._nfields = libpq.PQnfields(self._pgres)
             self._no_tuples = False
+            self._binary_result = bool(self._nfields) and \
+                libpq.PQfformat(self._pgres, 0) == 1
             description = []
             casts = []
+            column_casts = []
+            self._server_text = {}
             for i in xrange(self._nfields):
                 ftype = libpq.PQftype(self._pgres, i)
                 fsize = libpq.PQfsize(self._pgres, i)
@@ -748,7 +1345,16 @@ class Cursor(object):
                 else:
                     prec = scale = None
 
-                casts.append(self._get_cast(ftype))
+                cast = None
+                if self._binary_result:
+                    cast = self._get_binary_cast(ftype)
+                    if cast is None:
+                        # The values are converted to text by the server
+                        self._server_text[i] = None
+                if cast is None:
+                    cast = self._get_cast(ftype)
+                casts.append(cast)
+                column_casts.append(typecasts.column_caster(cast))
                 description.append(Column(
                     name=ffi.string(libpq.PQfname(self._pgres, i)),
                     type_code=ftype,
@@ -761,15 +1367,22 @@ class Cursor(object):
 
             self._description = tuple(description)
             self._casts = casts
+            self._column_casts = column_casts
 
     def _pq_fetch_copy_in(self):
         pgconn = self._conn._pgconn
         size = self._copysize
         error = 0
         while True:
-            data = self._copyfile.read(size)
-            if isinstance(self._copyfile, TextIOBase):
-                data = data.encode(self._conn._py_enc)
+            try:
+                data = self._copyfile.read(size)
+                if isinstance(self._copyfile, TextIOBase):
+                    data = data.encode(self._conn._py_enc)
+            except Exception:
+                libpq.PQputCopyEnd(pgconn, 'error in .read() call')
+                self._clear_pgres()
+                util.pq_clear_async(pgconn)
+                raise
 
             if not data:
                 break
@@ -785,30 +1398,19 @@ class Cursor(object):
 
         libpq.PQputCopyEnd(pgconn, errmsg)
         self._clear_pgres()
-        util.pq_clear_async(pgconn)
+        self._pgres = util.pq_get_last_result(pgconn)
+        self._pq_fetch()
 
     def _pq_fetch_copy_out(self):
-        is_text = isinstance(self._copyfile, TextIOBase)
-        pgconn = self._conn._pgconn
-        while True:
-            buf = ffi.new('char **')
-            length = libpq.PQgetCopyData(pgconn, buf, 0)
-
-            if length > 0:
-                if buf[0] == ffi.NULL:
-                    return
-                value = ffi.buffer(buf[0], length)
-                if is_text:
-                    value = typecasts.parse_unicode(value[:], length, self)
-
-                self._copyfile.write(value)
-            elif length == -2:
-                raise self._conn._create_exception()
-            else:
-                break
+        if self._copyiter:
+            # copy_to_iter() will read the data
+            return
 
-        self._clear_pgres()
-        util.pq_clear_async(pgconn)
+        is_text = isinstance(self._copyfile, TextIOBase)
+        for data in _CopyOutIterator(self, self._copysize or 8192, True):
+            if is_text:
+                data = typecasts.parse_unicode(data, len(data), self)
+            self._copyfile.write(data)
 
     def _build_row(self, row_num):
 
@@ -821,25 +1423,96 @@ class Cursor(object):
             is_tuple = True
 
         # Fill it
-        n = self._nfields
-        for i in xrange(n):
+        pgres = self._pgres
+        for i in xrange(self._nfields):
+            if i in self._server_text:
+                val = self._get_server_text(i)[row_num]
+                if val is not None:
+                    val = typecasts.typecast(
+                        self._casts[i], val, len(val), self)
+                row[i] = val
+                continue
+
+            if self._binary_result:
+                val = ffi.buffer(libpq.PQgetvalue(pgres, row_num, i),
+                    libpq.PQgetlength(pgres, row_num, i))[:]
+            else:
+                val = ffi.string(libpq.PQgetvalue(pgres, row_num, i))
 
             # PQgetvalue will return an empty string for null values,
             # so check with PQgetisnull if the value is really null
-            length = libpq.PQgetlength(self._pgres, row_num, i)
-            val = ffi.buffer(libpq.PQgetvalue(self._pgres, row_num, i),
-                    length)[:]
-            if not val and libpq.PQgetisnull(self._pgres, row_num, i):
+            if not val and libpq.PQgetisnull(pgres, row_num, i):
                 val = None
             else:
-                caster = self._casts[i]
-                val = typecasts.typecast(caster, val, length, self)
+                val = typecasts.typecast(self._casts[i], val, len(val), self)
             row[i] = val
 
         if is_tuple:
             return tuple(row)
         return row
 
+    def _build_rows(self, start, end):
+        """Build the rows from `start` to `end` (excluded) of the result.
+
+        The result is walked one column at a time by _build_columns(), then
+        the columns are zipped into rows.
+
+        """
+        columns = self._build_columns(start, end)
+        if not columns:
+            return [()] * (end - start)
+
+        if not self.row_factory:
+            return zip(*columns)
+
+        rows = []
+        for values in zip(*columns):
+            row = self.row_factory(self)
+            for i, val in enumerate(values):
+                row[i] = val
+            rows.append(row)
+        return rows
+
+    def _build_columns(self, start, end, columns=None):
+        """Return the values of the rows from `start` to `end` (excluded)
+        of the result as a list of columns.
+
+        The values of a column are read and then converted all together by
+        the function chosen for the column in _pq_fetch_tuples(). Only the
+        columns whose index is in `columns` are returned, if specified.
+
+        """
+        pgres = self._pgres
+        getvalue = libpq.PQgetvalue
+        getlength = libpq.PQgetlength
+        getisnull = libpq.PQgetisnull
+        string = ffi.string
+        buf = ffi.buffer
+        rows_range = xrange(start, end)
+
+        if columns is None:
+            columns = xrange(self._nfields)
+
+        rv = []
+        for i in columns:
+            cast_column = self._column_casts[i]
+            # PQgetvalue will return an empty string for null values,
+            # so check with PQgetisnull if the value is really null
+            if i in self._server_text:
+                values = self._get_server_text(i)[start:end]
+            elif self._binary_result:
+                values = [buf(getvalue(pgres, row_num, i),
+                        getlength(pgres, row_num, i))[:]
+                    or (None if getisnull(pgres, row_num, i) else '')
+                    for row_num in rows_range]
+            else:
+                values = [string(getvalue(pgres, row_num, i))
+                    or (None if getisnull(pgres, row_num, i) else '')
+                    for row_num in rows_range]
+            rv.append(cast_column(values, self))
+
+        return rv
+
     def _get_cast(self, oid):
         try:
             return self._typecasts[oid]
@@ -852,6 +1525,211 @@ class Cursor(object):
                 except KeyError:
                     return typecasts.string_types[705]
 
+    def _get_binary_cast(self, oid):
+        """Return the typecaster for the values of a type in binary format,
+        None if the type has none."""
+        cast = self._get_user_cast(oid)
+        if cast is not None and oid in typecasts.binary_to_text:
+            return typecasts.binary_text_caster(
+                cast, typecasts.binary_to_text[oid])
+        return typecasts.binary_types.get(oid)
+
+    def _get_server_text(self, col):
+        """Return the text representation of all the values of a column of a
+        binary result whose type has no binary typecaster.
+
+        The values are converted by the server, in a query executed the first
+        time the column is read: this is not possible while the results are
+        being streamed or on an asynchronous connection.
+
+        """
+        values = self._server_text[col]
+        if values is not None:
+            return values
+
+        oid = libpq.PQftype(self._pgres, col)
+        if self._streaming or self._conn._async:
+            raise exceptions.NotSupportedError(
+                "the type %s has no binary typecaster: "
+                "fetch its values in text format" % oid)
+
+        pgres = self._pgres
+        values = [None if libpq.PQgetisnull(pgres, row_num, col)
+                else ffi.buffer(libpq.PQgetvalue(pgres, row_num, col),
+                    libpq.PQgetlength(pgres, row_num, col))[:]
+            for row_num in xrange(libpq.PQntuples(pgres))]
+        values = self._conn._binary_to_text(oid, values)
+        self._server_text[col] = values
+        return values
+
+    def _get_user_cast(self, oid):
+        """Return the typecaster registered by the user for a type, if any.
+        """
+        try:
+            return self._typecasts[oid]
+        except KeyError:
+            try:
+                return self._conn._typecasts[oid]
+            except KeyError:
+                if oid in typecasts.user_types:
+                    return typecasts.string_types.get(oid)
+
+    def _binary_casts_ok(self):
+        """Return False if a typecaster registered by the user couldn't be
+        applied to a result in binary format: in this case the results are
+        requested in text format."""
+        for casts in (self._typecasts, self._conn._typecasts,
+                typecasts.user_types):
+            for oid in casts:
+                if oid not in typecasts.binary_to_text:
+                    return False
+        return True
+
+
+class _CopyRecordsReader(object):
+    """File-like object reading a sequence of records in COPY text format"""
+
+    def __init__(self, records, conn):
+        self._records = iter(records)
+        self._conn = conn
+        self._encoders = {type(None): lambda value: '\\N'}
+
+    def read(self, size):
+        encoders = self._encoders
+        rows = []
+        length = 0
+        for record in self._records:
+            values = []
+            for value in record:
+                try:
+                    values.append(encoders[type(value)](value))
+                except KeyError:
+                    encoder = encoders[type(value)] = _copy_encoder(
+                        type(value), self._conn)
+                    values.append(encoder(value))
+            row = '\t'.join(values) + '\n'
+            rows.append(row)
+            length += len(row)
+            if length >= size:
+                break
+        return ''.join(rows)
+
+
+class _CopyOutIterator(object):
+    """Iterator on the data of a COPY OUT: see Cursor.copy_to_iter()
+
+    At the end of the copy the final result of the command is fetched.
+
+    """
+
+    def __init__(self, cursor, size, wait):
+        self._cursor = cursor
+        self._size = size
+        self._wait = wait
+        self._buf = ffi.new('char **')
+        self._consume = False   # input to read before the next data
+        self._eof = False       # all the data received
+        self._done = False      # final result fetched or data discarded
+        cursor._conn._stream_cursor = weakref.ref(self)
+
+    def __iter__(self):
+        return self
+
+    def next(self):
+        if self._done:
+            raise StopIteration
+
+        conn = self._cursor._conn
+        with conn._lock:
+            data = self._read()
+            if data is None:
+                self._finish()
+                raise StopIteration
+            return data
+
+    __next__ = next
+
+    def close(self):
+        """Throw away the data not read yet."""
+        if self._done:
+            return
+        conn = self._cursor._conn
+        with conn._lock:
+            conn._stream_cursor = None
+            self._end_stream()
+
+    def __del__(self):
+        self.close()
+
+    def _read(self):
+        """Return the next chunk of data, '' if none is available in
+        non-blocking mode, None at the end of the data."""
+        conn = self._cursor._conn
+        pgconn = conn._pgconn
+        if self._eof:
+            return None
+        if self._consume:
+            self._consume = False
+            if not libpq.PQconsumeInput(pgconn):
+                raise conn._create_exception()
+
+        getcopydata = libpq.PQgetCopyData
+        freemem = libpq.PQfreemem
+        buffer = ffi.buffer
+        buf = self._buf
+        size = self._size
+        chunk = []
+        chunk_len = 0
+        while True:
+            length = getcopydata(pgconn, buf, not self._wait)
+            if length > 0:
+                try:
+                    chunk.append(buffer(buf[0], length)[:])
+                finally:
+                    freemem(buf[0])
+                chunk_len += length
+                if chunk_len >= size:
+                    return ''.join(chunk)
+
+            elif length == 0:
+                # no data available yet in non-blocking mode
+                if not chunk:
+                    self._consume = True
+                return ''.join(chunk)
+
+            elif length == -1:
+                self._eof = True
+                return chunk and ''.join(chunk) or None
+
+            else:
+                raise conn._create_exception()
+
+    def _finish(self):
+        """Fetch the final result of the command."""
+        cursor = self._cursor
+        conn = cursor._conn
+        self._done = True
+        conn._stream_cursor = None
+        cursor._clear_pgres()
+        cursor._pgres = util.pq_get_last_result(conn._pgconn)
+        cursor._pq_fetch()
+
+    def _end_stream(self):
+        """Throw away the data not read yet, before the connection runs
+        another command.
+
+        Called holding the connection lock.
+
+        """
+        self._done = True
+        pgconn = self._cursor._conn._pgconn
+        if not pgconn:
+            return
+        if not self._eof:
+            util.pq_drain_copy_out(pgconn)
+        self._cursor._clear_pgres()
+        util.pq_clear_async(pgconn)
+
 
 def _combine_cmd_params(cmd, params, conn):
     """Combine the command string and params"""
@@ -861,78 +1739,163 @@ def _combine_cmd_params(cmd, params, conn):
     if '%' not in cmd:
         return cmd
 
-    idx = 0
-    param_num = 0
-    arg_values = None
-    named_args_format = None
+    chunks, keys, named, template = _parse_cmd(cmd)
+    if named is None:
+        return chunks[0]
 
-    def check_format_char(format_char, pos):
-        """Raise an exception when the format_char is unsupported"""
-        if format_char not in 's ':
-            raise ValueError(
-                "unsupported format character '%s' (0x%x) at index %d" %
-                (format_char, ord(format_char), pos))
+    if named:
+        arg_values = {}
+        for key in keys:
+            if key not in arg_values:
+                arg_values[key] = _getquoted(params[key], conn)
+        return template % tuple([arg_values[key] for key in keys])
+
+    arg_values = tuple([_getquoted(params[i], conn) for i in keys])
+    if len(arg_values) != len(params):
+        raise TypeError(
+            "not all arguments converted during string formatting")
+    return template % arg_values
 
+
+def _split_cmd(cmd):
+    """Split the command string on its placeholders.
+
+    Return a tuple (chunks, keys, named): `chunks` are the literal parts of
+    the command (with the '%%' escapes already resolved) found around the
+    placeholders, `keys` contains for each placeholder the parameter name or
+    position, `named` tells if the placeholders are in the %(name)s format
+    (it is None if there are no placeholders).
+
+    """
+    chunks = []
+    keys = []
+    named = None
+    literal = []
+    pos = 0
     cmd_length = len(cmd)
-    while idx < cmd_length:
+    while pos < cmd_length:
+        idx = cmd.find('%', pos)
+        if idx < 0:
+            break
+        literal.append(cmd[pos:idx])
 
         # Escape
-        if cmd[idx] == '%' and cmd[idx + 1] == '%':
-            idx += 1
+        if cmd.startswith('%%', idx):
+            literal.append('%')
+            pos = idx + 2
+            continue
 
         # Named parameters
-        elif cmd[idx] == '%' and cmd[idx + 1] == '(':
+        if cmd.startswith('%(', idx):
 
             # Validate that we don't mix formats
-            if named_args_format is False:
+            if named is False:
                 raise ValueError("argument formats can't be mixed")
-            elif named_args_format is None:
-                named_args_format = True
+            named = True
 
             # Check for incomplate placeholder
             max_lookahead = cmd.find('%', idx + 2)
+            if max_lookahead < 0:
+                max_lookahead = cmd_length
             end = cmd.find(')', idx + 2, max_lookahead)
             if end < 0:
                 raise ProgrammingError(
                     "incomplete placeholder: '%(' without ')'")
 
-            key = cmd[idx + 2:end]
-            if arg_values is None:
-                arg_values = {}
-            if key not in arg_values:
-                arg_values[key] = _getquoted(params[key], conn)
-
-            check_format_char(cmd[end + 1], idx)
+            keys.append(cmd[idx + 2:end])
+            pos = end + 1
 
         # Indexed parameters
-        elif cmd[idx] == '%':
+        else:
 
             # Validate that we don't mix formats
-            if named_args_format is True:
+            if named is True:
                 raise ValueError("argument formats can't be mixed")
-            elif named_args_format is None:
-                named_args_format = False
+            named = False
 
-            check_format_char(cmd[idx + 1], idx)
+            keys.append(len(keys))
+            pos = idx + 1
+
+        if cmd.startswith('s', pos):
+            pos += 1
+        elif cmd.startswith(' s', pos):
+            pos += 2
+        elif pos < cmd_length:
+            raise ValueError(
+                "unsupported format character '%s' (0x%x) at index %d" %
+                (cmd[pos], ord(cmd[pos]), idx))
+        else:
+            raise ValueError("incomplete format")
+
+        chunks.append(''.join(literal))
+        literal = []
+
+    literal.append(cmd[pos:])
+    chunks.append(''.join(literal))
+    return chunks, keys, named
 
-            if arg_values is None:
-                arg_values = []
 
-            value = _getquoted(params[param_num], conn)
-            arg_values.append(value)
+# The commands already parsed by _parse_cmd(), emptied when it grows larger
+# than _cmd_cache_size items.
+_cmd_cache = {}
+_cmd_cache_size = 1000
 
-            param_num += 1
-            idx += 1
 
-        idx += 1
+def _parse_cmd(cmd):
+    """Return the placeholders layout of a command string.
+
+    Return a tuple (chunks, keys, named, template): the first items are
+    the result of _split_cmd(), `template` is the command with the
+    placeholders replaced by '%s', to be used with the % operator with the
+    tuple of the values matching `keys`.
+
+    The layout is computed only once per command string.
+
+    """
+    rv = _cmd_cache.get(cmd)
+    if rv is None:
+        chunks, keys, named = _split_cmd(cmd)
+        template = '%s'.join([c.replace('%', '%%') for c in chunks])
+        rv = (chunks, keys, named, template)
+        if len(_cmd_cache) >= _cmd_cache_size:
+            _cmd_cache.clear()
+        _cmd_cache[cmd] = rv
+    return rv
 
-    if named_args_format is False:
-        if len(arg_values) != len(params):
+
+def _bind_cmd_params(cmd, params, conn):
+    """Prepare the command and params to be sent separately to the backend.
+
+    Return the command with the placeholders converted to $n and the list of
+    (oid, format, value) params bindings, or None if there is nothing to
+    bind. The params whose adapter doesn't support binding are merged into
+    the command as in _combine_cmd_params().
+
+    """
+    if '%' not in cmd:
+        return cmd, None
+
+    chunks, keys, named, template = _parse_cmd(cmd)
+    if named is False and len(keys) != len(params):
+        if len(keys) < len(params):
             raise TypeError(
                 "not all arguments converted during string formatting")
-        arg_values = tuple(arg_values)
-
-    if not arg_values:
-        return cmd % tuple()  # Required to unescape % chars
-    return cmd % arg_values
+        raise IndexError("tuple index out of range")
+
+    parts = [chunks[0]]
+    bindings = []
+    placeholders = {}
+    for key, chunk in zip(keys, chunks[1:]):
+        placeholder = placeholders.get(key)
+        if placeholder is None:
+            binding = _getbinding(params[key], conn)
+            if isinstance(binding, tuple):
+                bindings.append(binding)
+                placeholder = '$%d' % len(bindings)
+            else:
+                placeholder = binding
+            placeholders[key] = placeholder
+        parts.append(placeholder)
+        parts.append(chunk)
 
+    return ''.join(parts), bindings or None
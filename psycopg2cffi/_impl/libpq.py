@@ -91,12 +91,21 @@ typedef struct pgNotify
     ...;
 } PGnotify;
 
+typedef struct _PQconninfoOption
+{
+    char       *keyword;  /* The keyword of the option */
+    char       *val;      /* Option's current value, or NULL */
+    ...;
+} PQconninfoOption;
+
 // Database connection control functions
 
 extern PGconn *PQconnectdb(const char *conninfo);
 extern PGconn *PQconnectStart(const char *conninfo);
 extern /*PostgresPollingStatusType*/ int PQconnectPoll(PGconn *conn);
 extern void PQfinish(PGconn *conn);
+extern PQconninfoOption *PQconninfoParse(const char *conninfo, char **errmsg);
+extern void PQconninfoFree(PQconninfoOption *connOptions);
 
 // Connection status functions
 
@@ -106,12 +115,33 @@ extern const char *PQparameterStatus(const PGconn *conn, const char *paramName);
 extern int PQprotocolVersion(const PGconn *conn);
 extern int PQserverVersion(const PGconn *conn);
 extern char *PQerrorMessage(const PGconn *conn);
+extern char *PQoptions(const PGconn *conn);
 extern int PQsocket(const PGconn *conn);
 extern int PQbackendPID(const PGconn *conn);
 
 // Command execution functions
 
 extern PGresult *PQexec(PGconn *conn, const char *query);
+extern PGresult *PQexecParams(PGconn *conn,
+    const char *command,
+    int nParams,
+    const Oid *paramTypes,
+    const char *const * paramValues,
+    const int *paramLengths,
+    const int *paramFormats,
+    int resultFormat);
+extern PGresult *PQprepare(PGconn *conn,
+    const char *stmtName,
+    const char *query,
+    int nParams,
+    const Oid *paramTypes);
+extern PGresult *PQexecPrepared(PGconn *conn,
+    const char *stmtName,
+    int nParams,
+    const char *const * paramValues,
+    const int *paramLengths,
+    const int *paramFormats,
+    int resultFormat);
 extern /*ExecStatusType*/ int PQresultStatus(const PGresult *res);
 extern char *PQresultErrorMessage(const PGresult *res);
 extern char *PQresultErrorField(const PGresult *res, int fieldcode);
@@ -125,6 +155,7 @@ extern char *PQfname(const PGresult *res, int field_num);
 extern Oid PQftype(const PGresult *res, int field_num);
 extern int PQfsize(const PGresult *res, int field_num);
 extern int PQfmod(const PGresult *res, int field_num);
+extern int PQfformat(const PGresult *res, int field_num);
 extern int PQgetisnull(const PGresult *res, int tup_num, int field_num);
 extern int PQgetlength(const PGresult *res, int tup_num, int field_num);
 extern char *PQgetvalue(const PGresult *res, int tup_num, int field_num);
@@ -143,6 +174,20 @@ if PG_VERSION >= 0x090000:
 extern char *PQescapeLiteral(PGconn *conn, const char *str, size_t len);
     ''')
 
+if PG_VERSION >= 0x090200:
+    ffi.cdef('''
+// Retrieving query results row-by-row
+#define PGRES_SINGLE_TUPLE ...
+extern int PQsetSingleRowMode(PGconn *conn);
+    ''')
+
+if PG_VERSION >= 0x110000:
+    ffi.cdef('''
+// Retrieving query results in chunks
+#define PGRES_TUPLES_CHUNK ...
+extern int PQsetChunkedRowsMode(PGconn *conn, int chunkSize);
+    ''')
+
 ffi.cdef('''
 // Escaping string for inclusion in sql commands
 extern size_t PQescapeStringConn(PGconn *conn,
@@ -160,6 +205,14 @@ extern unsigned char *PQunescapeBytea(const unsigned char *strtext,
 // Asynchronous Command Processing
 
 extern int PQsendQuery(PGconn *conn, const char *query);
+extern int PQsendQueryParams(PGconn *conn,
+    const char *command,
+    int nParams,
+    const Oid *paramTypes,
+    const char *const * paramValues,
+    const int *paramLengths,
+    const int *paramFormats,
+    int resultFormat);
 extern PGresult *PQgetResult(PGconn *conn);
 extern int PQconsumeInput(PGconn *conn);
 extern int PQisBusy(PGconn *conn);
@@ -189,6 +242,10 @@ typedef void (*PQnoticeProcessor) (void *arg, const char *message);
 extern PQnoticeProcessor PQsetNoticeProcessor(PGconn *conn,
     PQnoticeProcessor proc,
     void *arg);
+typedef void (*PQnoticeReceiver) (void *arg, const PGresult *res);
+extern PQnoticeReceiver PQsetNoticeReceiver(PGconn *conn,
+    PQnoticeReceiver proc,
+    void *arg);
 extern PGnotify *PQnotifies(PGconn *conn);
 
 // Large object
@@ -204,11 +261,205 @@ extern int lo_unlink(PGconn *conn, Oid lobjId);
 extern int lo_export(PGconn *conn, Oid lobjId, const char *filename);
 extern int lo_truncate(PGconn *conn, int fd, size_t len);
 
+// Helpers defined below
+
+int psyco_copy_column(const PGresult *res, int col, int start, int end,
+    int size, char *dest, char *mask);
+int psyco_parse_column(const PGresult *res, int col, int start, int end,
+    int kind, char *dest, char *mask);
+
 ''')
 
 libpq = ffi.verify('''
+#include <errno.h>
+#include <limits.h>
+#include <stdlib.h>
+#include <string.h>
 #include <postgres_ext.h>
 #include <libpq-fe.h>
+
+/* Copy the values of the rows from `start` to `end` (excluded) of a column
+ * of a binary result into `dest`, if all of them are `size` bytes long.
+ * Null values are zeroed and flagged in `mask`. Return -1 if a value has
+ * the wrong size. */
+int psyco_copy_column(const PGresult *res, int col, int start, int end,
+    int size, char *dest, char *mask)
+{
+    int i;
+    for (i = start; i < end; i++, dest += size, mask++) {
+        if (PQgetisnull(res, i, col)) {
+            memset(dest, 0, size);
+            *mask = 1;
+        }
+        else if (PQgetlength(res, i, col) == size) {
+            memcpy(dest, PQgetvalue(res, i, col), size);
+            *mask = 0;
+        }
+        else {
+            return -1;
+        }
+    }
+    return 0;
+}
+
+/* Read from 2 to `max` digits from `*s` into `*out`, advancing `*s`. */
+static int psyco_digits(const char **s, int max, long long *out)
+{
+    const char *p = *s;
+    long long v = 0;
+    int n = 0;
+    while (*p >= '0' && *p <= '9' && n < max) {
+        v = v * 10 + (*p++ - '0');
+        n++;
+    }
+    if (n < 2) {
+        return -1;
+    }
+    *s = p;
+    *out = v;
+    return 0;
+}
+
+/* Number of days from 1970-01-01 to a date of the proleptic Gregorian
+ * calendar. */
+static long long psyco_days(long long y, long long m, long long d)
+{
+    long long era, yoe, doy;
+    y -= m <= 2;
+    era = (y >= 0 ? y : y - 399) / 400;
+    yoe = y - era * 400;
+    doy = (153 * (m > 2 ? m - 3 : m + 9) + 2) / 5 + d - 1;
+    return era * 146097 + yoe * 365 + yoe / 4 - yoe / 100 + doy - 719468;
+}
+
+/* Parse a date or a timestamp in ISO format into days (if `days`) or
+ * microseconds from 1970-01-01 UTC. Infinities become LLONG_MIN. */
+static int psyco_parse_datetime(const char *s, int days, long long *out)
+{
+    long long y, m, d, hh, mm, ss, usec = 0, offset = 0, v;
+    int n, sign;
+
+    if (!strcmp(s, "infinity") || !strcmp(s, "-infinity")) {
+        *out = LLONG_MIN;
+        return 0;
+    }
+    if (psyco_digits(&s, 9, &y) < 0 || *s++ != '-'
+            || psyco_digits(&s, 2, &m) < 0 || *s++ != '-'
+            || psyco_digits(&s, 2, &d) < 0
+            || m < 1 || m > 12 || d < 1 || d > 31) {
+        return -1;
+    }
+    if (days) {
+        if (*s) {
+            return -1;      /* BC dates, other datestyles */
+        }
+        *out = psyco_days(y, m, d);
+        return 0;
+    }
+
+    if (*s++ != ' ' || psyco_digits(&s, 2, &hh) < 0 || *s++ != ':'
+            || psyco_digits(&s, 2, &mm) < 0 || *s++ != ':'
+            || psyco_digits(&s, 2, &ss) < 0) {
+        return -1;
+    }
+    if (*s == '.') {
+        s++;
+        for (n = 0; n < 6; n++) {
+            usec *= 10;
+            if (*s >= '0' && *s <= '9') {
+                usec += *s++ - '0';
+            }
+        }
+        if (*s >= '0' && *s <= '9') {
+            return -1;
+        }
+    }
+    if (*s == '+' || *s == '-') {
+        sign = *s++ == '-' ? -1 : 1;
+        if (psyco_digits(&s, 2, &v) < 0) {
+            return -1;
+        }
+        offset = v * 3600;
+        if (*s == ':') {
+            s++;
+            if (psyco_digits(&s, 2, &v) < 0) {
+                return -1;
+            }
+            offset += v * 60;
+            if (*s == ':') {
+                s++;
+                if (psyco_digits(&s, 2, &v) < 0) {
+                    return -1;
+                }
+                offset += v;
+            }
+        }
+        offset *= sign;
+    }
+    if (*s) {
+        return -1;
+    }
+
+    *out = ((psyco_days(y, m, d) * 86400 + hh * 3600 + mm * 60 + ss
+        - offset) * 1000000 + usec);
+    return 0;
+}
+
+/* Parse the values of the rows from `start` to `end` (excluded) of a column
+ * of a text result into `dest`, an array of 8 bytes items. `kind` is:
+ * 0: integer (long long), 1: float (double), 2: bool (long long),
+ * 3: ISO date (days from the epoch), 4: ISO timestamp, with or without time
+ * zone (microseconds from the epoch, in UTC). Null values are zeroed and
+ * flagged in `mask`. Return -1 if a value can't be parsed. */
+int psyco_parse_column(const PGresult *res, int col, int start, int end,
+    int kind, char *dest, char *mask)
+{
+    int i;
+    const char *value;
+    char *endptr;
+    long long *ll = (long long *)dest;
+    double *dbl = (double *)dest;
+
+    for (i = start; i < end; i++, ll++, dbl++, mask++) {
+        if (PQgetisnull(res, i, col)) {
+            *ll = 0;
+            *mask = 1;
+            continue;
+        }
+        *mask = 0;
+        value = PQgetvalue(res, i, col);
+        switch (kind) {
+        case 0:
+            errno = 0;
+            *ll = strtoll(value, &endptr, 10);
+            if (errno || endptr == value || *endptr) {
+                return -1;
+            }
+            break;
+        case 1:
+            *dbl = strtod(value, &endptr);
+            if (endptr == value || *endptr) {
+                return -1;
+            }
+            break;
+        case 2:
+            if ((value[0] != 't' && value[0] != 'f') || value[1]) {
+                return -1;
+            }
+            *ll = value[0] == 't';
+            break;
+        case 3:
+        case 4:
+            if (psyco_parse_datetime(value, kind == 3, ll) < 0) {
+                return -1;
+            }
+            break;
+        default:
+            return -1;
+        }
+    }
+    return 0;
+}
         ''', 
         libraries=['pq'],
         library_dirs=[
@@ -0,0 +1,174 @@
+"""Conversion of query results into NumPy arrays.
+
+This module requires NumPy: it is only imported by Cursor.fetchnumpy().
+"""
+
+import numpy
+
+from psycopg2cffi._impl.exceptions import InterfaceError, ProgrammingError
+from psycopg2cffi._impl.libpq import libpq, ffi
+
+
+# PostgreSQL epoch (2000-01-01) in days and microseconds from 1970-01-01
+_PG_EPOCH_DAYS = 10957
+_PG_EPOCH_USECS = _PG_EPOCH_DAYS * 86400 * 1000000
+
+# Types converted from their binary representation without creating Python
+# objects: oid -> (binary dtype, array dtype, offset of the epoch). The
+# date/time types values equal to their min or max are the infinities and
+# become NaT.
+_types = {
+    16: ('?', '?', None),                           # bool
+    21: ('>i2', 'i2', None),                        # int2
+    23: ('>i4', 'i4', None),                        # int4
+    20: ('>i8', 'i8', None),                        # int8
+    26: ('>u4', 'u4', None),                        # oid
+    700: ('>f4', 'f4', None),                       # float4
+    701: ('>f8', 'f8', None),                       # float8
+    1082: ('>i4', 'M8[D]', _PG_EPOCH_DAYS),         # date
+    1114: ('>i8', 'M8[us]', _PG_EPOCH_USECS),       # timestamp
+    1184: ('>i8', 'M8[us]', _PG_EPOCH_USECS),       # timestamptz (UTC)
+}
+
+# Kind of parsing of the same types in text results (see psyco_parse_column)
+_TEXT_INT, _TEXT_FLOAT, _TEXT_BOOL, _TEXT_DATE, _TEXT_TIMESTAMP = range(5)
+
+_text_kinds = {
+    16: _TEXT_BOOL,
+    21: _TEXT_INT,
+    23: _TEXT_INT,
+    20: _TEXT_INT,
+    26: _TEXT_INT,
+    700: _TEXT_FLOAT,
+    701: _TEXT_FLOAT,
+    1082: _TEXT_DATE,
+    1114: _TEXT_TIMESTAMP,
+    1184: _TEXT_TIMESTAMP,
+}
+
+
+def build_arrays(cursor, start, end):
+    """Return the rows from `start` to `end` (excluded) of the cursor result
+    as a dict of masked arrays, one per column.
+
+    In binary results the columns of the types in `_types` are copied into
+    the arrays as they are; in text results they are parsed in C, unless
+    the user registered a typecaster for their type or a value is not in
+    the expected format. The other columns are converted by the cursor
+    typecasters and stored in arrays of objects, unless their type is in
+    `_types`.
+
+    Raise ProgrammingError if two columns have the same name.
+
+    """
+    names = set()
+    for column in cursor.description:
+        if column.name in names:
+            raise ProgrammingError(
+                "more than one column named '%s': use AS to rename them"
+                % column.name)
+        names.add(column.name)
+
+    arrays = {}
+    others = []
+    for i, column in enumerate(cursor.description):
+        spec = _types.get(column.type_code)
+        array = None
+        if spec is None:
+            pass
+        elif cursor._binary_result:
+            array = _copy_column(cursor._pgres, i, start, end, *spec)
+        elif cursor._get_user_cast(column.type_code) is None:
+            array = _parse_column(cursor._pgres, i, start, end,
+                _text_kinds[column.type_code], spec[1])
+
+        if array is not None:
+            arrays[column.name] = array
+        else:
+            others.append(i)
+
+    if others:
+        columns = cursor._build_columns(start, end, others)
+        for i, values in zip(others, columns):
+            column = cursor.description[i]
+            spec = _types.get(column.type_code)
+            if column.type_code == 1184:
+                # NumPy is not happy with tz-aware datetimes
+                values = [_naive_utc(v) for v in values]
+            arrays[column.name] = _convert_column(
+                values, spec and spec[1] or object)
+
+    return arrays
+
+
+def concatenate(first, second):
+    """Join two dicts of arrays returned by build_arrays()"""
+    return dict([(name, numpy.ma.concatenate([first[name], second[name]]))
+        for name in first])
+
+
+def _copy_column(pgres, col, start, end, wire_dtype, dtype, epoch):
+    """Build a masked array from a column in binary format"""
+    data = numpy.empty(end - start, dtype=wire_dtype)
+    mask = numpy.empty(end - start, dtype='?')
+    if libpq.psyco_copy_column(pgres, col, start, end, data.itemsize,
+            ffi.cast('char *', data.ctypes.data),
+            ffi.cast('char *', mask.ctypes.data)) < 0:
+        raise InterfaceError(
+            "unexpected value size in column %d of binary result" % col)
+
+    if epoch is None:
+        data = data.astype(dtype)
+    else:
+        info = numpy.iinfo(data.dtype)
+        infinite = (data == info.max) | (data == info.min)
+        data = data.astype('i8')
+        data += epoch
+        data[infinite] = numpy.iinfo('i8').min    # NaT
+        data = data.view(dtype)
+
+    return numpy.ma.MaskedArray(data, mask=mask)
+
+
+def _parse_column(pgres, col, start, end, kind, dtype):
+    """Build a masked array from a column in text format.
+
+    Return None if a value can't be parsed.
+    """
+    data = numpy.empty(end - start,
+        dtype=kind == _TEXT_FLOAT and 'f8' or 'i8')
+    mask = numpy.empty(end - start, dtype='?')
+    if libpq.psyco_parse_column(pgres, col, start, end, kind,
+            ffi.cast('char *', data.ctypes.data),
+            ffi.cast('char *', mask.ctypes.data)) < 0:
+        return None
+
+    if kind in (_TEXT_DATE, _TEXT_TIMESTAMP):
+        data = data.view(dtype)
+    else:
+        data = data.astype(dtype)
+
+    return numpy.ma.MaskedArray(data, mask=mask)
+
+
+def _naive_utc(value):
+    """Convert a tz-aware datetime into a naive one in UTC.
+
+    Naive datetimes (returned if the cursor has no tzinfo_factory) are
+    left as they are.
+    """
+    if value is None:
+        return None
+    offset = value.utcoffset()
+    if offset is None:
+        return value
+    return (value - offset).replace(tzinfo=None)
+
+
+def _convert_column(values, dtype):
+    """Build a masked array from a list of Python values"""
+    mask = [v is None for v in values]
+    if dtype is not object and True in mask:
+        fill = numpy.zeros(1, dtype=dtype)[0]
+        values = [v if v is not None else fill for v in values]
+    return numpy.ma.MaskedArray(numpy.array(values, dtype=dtype), mask=mask)
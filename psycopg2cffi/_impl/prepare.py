@@ -0,0 +1,153 @@
+import re
+
+from psycopg2cffi._impl.libpq import libpq, ffi
+
+
+# Only the statements starting with these keywords are prepared: other
+# statements (DDL, transaction commands...) can't, or are not worth to.
+_re_preparable = re.compile(
+    r'\s*(?:select|insert|update|delete|values|with)\b', re.I)
+
+
+class PreparedStatements(object):
+    """Cache of the statements prepared automatically on a connection.
+
+    A query is prepared when it is executed more than `threshold` times, and
+    the following executions skip the parse and plan on the server. At most
+    `maxsize` statements are kept: the least recently used one is
+    deallocated to make room for a new one. The cache is disabled if
+    `maxsize` is 0 (the default).
+
+    The queries are looked up by text and parameters types, so only queries
+    executed with `server_binding` (or without parameters) can benefit from
+    the cache: merging parameters in the query makes each query different.
+
+    """
+    def __init__(self):
+        #: Max number of statements prepared on the connection.
+        self.maxsize = 0
+
+        #: Number of executions of a query before it gets prepared.
+        self.threshold = 5
+
+        #: Number of executions using a prepared statement.
+        self.hits = 0
+
+        #: Number of executions of a query not prepared (yet).
+        self.misses = 0
+
+        #: Number of statements deallocated to make room for new ones.
+        self.evictions = 0
+
+        self._names = {}    # key -> [statement name, last use]
+        self._counts = {}   # key -> [executions, last use]
+        self._deallocate = []
+        self._tick = 0
+        self._seq = 0
+
+    def __len__(self):
+        return len(self._names)
+
+    def lookup(self, query, params):
+        """Return the (key, name, prepare) to execute a query.
+
+        `name` is None if the query must not be executed as a prepared
+        statement. If `prepare` is true the statement is new and must be
+        created before using it: call forget() if creating it fails.
+
+        """
+        if not self.maxsize or ';' in query.rstrip().rstrip(';') \
+                or not _re_preparable.match(query):
+            return None, None, False
+
+        key = (query, tuple([p[0] for p in params or ()]))
+        self._tick += 1
+        entry = self._names.get(key)
+        if entry is not None:
+            entry[1] = self._tick
+            self.hits += 1
+            return key, entry[0], False
+
+        self.misses += 1
+        count = self._counts.get(key)
+        if count is None:
+            if len(self._counts) >= self.maxsize:
+                _pop_oldest(self._counts)
+            count = self._counts[key] = [0, 0]
+        count[0] += 1
+        count[1] = self._tick
+        if count[0] <= self.threshold:
+            return key, None, False
+
+        del self._counts[key]
+        while len(self._names) >= self.maxsize:
+            self._deallocate.append(_pop_oldest(self._names))
+            self.evictions += 1
+
+        self._seq += 1
+        name = '_psycopg2cffi_%d' % self._seq
+        self._names[key] = [name, self._tick]
+        return key, name, True
+
+    def forget(self, key):
+        """Drop a statement which couldn't be created."""
+        del self._names[key]
+
+    def invalidate(self, key):
+        """Drop a statement which can't be used anymore."""
+        entry = self._names.pop(key, None)
+        if entry is not None:
+            self._deallocate.append(entry[0])
+
+    def clear(self):
+        """Drop all the statements.
+
+        Return the names of the statements which may exist on the server.
+
+        """
+        names = self._deallocate + [e[0] for e in self._names.itervalues()]
+        self._names.clear()
+        self._counts.clear()
+        del self._deallocate[:]
+        return names
+
+    def get_deallocate(self):
+        """Return the command to deallocate the dropped statements, if any.
+
+        Once the command is returned it is forgotten: it must be executed.
+
+        """
+        if not self._deallocate:
+            return None
+        cmd = ''.join(['DEALLOCATE "%s";' % n for n in self._deallocate])
+        del self._deallocate[:]
+        return cmd
+
+    def check_result(self, key, pgres):
+        """Maintain the cache according to the result of a query.
+
+        The statement `key` is dropped if the server refused to execute it
+        (e.g. "cached plan must not change result type" after a DDL) and
+        the cache is emptied after a DISCARD ALL or DEALLOCATE ALL.
+
+        """
+        if not self._names or not pgres:
+            return
+
+        status = libpq.PQresultStatus(pgres)
+        if status == libpq.PGRES_FATAL_ERROR:
+            if key is not None:
+                code = libpq.PQresultErrorField(pgres, libpq.PG_DIAG_SQLSTATE)
+                if code and ffi.string(code) == '0A000':
+                    self.invalidate(key)
+
+        elif status == libpq.PGRES_COMMAND_OK:
+            cmd = ffi.string(libpq.PQcmdStatus(pgres))
+            if cmd == 'DISCARD ALL' or cmd == 'DEALLOCATE ALL':
+                self.clear()
+
+
+def _pop_oldest(entries):
+    """Remove the least recently used entry from a cache and return it."""
+    key = min(entries, key=lambda k: entries[k][1])
+    return entries.pop(key)[0]
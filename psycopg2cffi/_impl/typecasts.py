@@ -1,6 +1,8 @@
 import datetime
 import decimal
 import math
+import struct
+from functools import partial
 from time import localtime
 
 from psycopg2cffi._impl.libpq import libpq, ffi
@@ -10,6 +12,9 @@ string_types = {}
 
 binary_types = {}
 
+# The oids of the typecasters registered globally by the user
+user_types = set()
+
 
 class Type(object):
     def __init__(self, name, values, caster=None, py_caster=None):
@@ -42,6 +47,8 @@ def register_type(type_obj, scope=None):
 
     for value in type_obj.values:
         typecasts[value] = type_obj
+    if typecasts is string_types:
+        user_types.update(type_obj.values)
 
 
 def new_type(values, name, castobj):
@@ -327,6 +334,258 @@ def parse_interval(value, length, cursor):
     return datetime.timedelta(days, seconds, int(micro))
 
 
+# Binary typecasters: they receive the value in the PostgreSQL binary wire
+# format and return the same objects of the text typecasters.
+
+_PG_EPOCH = datetime.datetime(2000, 1, 1)
+_PG_EPOCH_ORDINAL = _PG_EPOCH.toordinal()
+
+_unpack_int2 = struct.Struct('!h').unpack
+_unpack_int4 = struct.Struct('!i').unpack
+_unpack_uint4 = struct.Struct('!I').unpack
+_unpack_int8 = struct.Struct('!q').unpack
+_unpack_float4 = struct.Struct('!f').unpack
+_unpack_float8 = struct.Struct('!d').unpack
+_unpack_numeric_header = struct.Struct('!hhHH').unpack
+_unpack_interval = struct.Struct('!qii').unpack
+_unpack_array_header = struct.Struct('!iiI').unpack
+_unpack_array_dim = struct.Struct('!ii').unpack
+
+_NUMERIC_NEG = 0x4000
+_NUMERIC_NAN = 0xC000
+_NUMERIC_PINF = 0xD000
+_NUMERIC_NINF = 0xF000
+
+
+def parse_int2_binary(value, length, cursor):
+    return _unpack_int2(value)[0]
+
+
+def parse_int4_binary(value, length, cursor):
+    return _unpack_int4(value)[0]
+
+
+def parse_oid_binary(value, length, cursor):
+    return _unpack_uint4(value)[0]
+
+
+def parse_int8_binary(value, length, cursor):
+    return long(_unpack_int8(value)[0])
+
+
+def parse_float4_binary(value, length, cursor):
+    return _unpack_float4(value)[0]
+
+
+def parse_float8_binary(value, length, cursor):
+    return _unpack_float8(value)[0]
+
+
+def parse_boolean_binary(value, length, cursor):
+    return value != '\x00'
+
+
+def parse_bytea_binary(value, length, cursor):
+    return buffer(value)
+
+
+def parse_uuid_binary(value, length, cursor):
+    """Return the uuid in its canonical text form, as the text typecaster"""
+    h = value.encode('hex')
+    return '%s-%s-%s-%s-%s' % (h[:8], h[8:12], h[12:16], h[16:20], h[20:])
+
+
+def parse_numeric_binary(value, length, cursor):
+    """Typecast a numeric from its binary representation.
+
+    The value is a sequence of base 10000 digits after an header containing
+    the number of digits, the weight of the first digit, the sign and the
+    number of decimal digits to display.
+
+    """
+    ndigits, weight, sign, dscale = _unpack_numeric_header(value[:8])
+    if sign == _NUMERIC_NAN:
+        return decimal.Decimal('NaN')
+    elif sign == _NUMERIC_PINF:
+        return decimal.Decimal('Infinity')
+    elif sign == _NUMERIC_NINF:
+        return decimal.Decimal('-Infinity')
+
+    digits = ''.join(['%04d' % d for d in
+        struct.unpack('!%dH' % ndigits, value[8:8 + ndigits * 2])])
+
+    # position of the decimal point in the digits string
+    point = (weight + 1) * 4
+    if point <= 0:
+        intpart = '0'
+        fracpart = '0' * -point + digits
+    elif point >= len(digits):
+        intpart = digits + '0' * (point - len(digits))
+        fracpart = ''
+    else:
+        intpart = digits[:point]
+        fracpart = digits[point:]
+
+    fracpart = fracpart[:dscale].ljust(dscale, '0')
+    rv = (sign == _NUMERIC_NEG and '-' or '') + intpart
+    if fracpart:
+        rv += '.' + fracpart
+    return decimal.Decimal(rv)
+
+
+def parse_date_binary(value, length, cursor):
+    return datetime.date.fromordinal(
+        _PG_EPOCH_ORDINAL + _unpack_int4(value)[0])
+
+
+def parse_time_binary(value, length, cursor):
+    usecs = _unpack_int8(value)[0]
+    secs, usecs = divmod(usecs, 1000000)
+    mins, secs = divmod(secs, 60)
+    hours, mins = divmod(mins, 60)
+    return datetime.time(hours, mins, secs, usecs)
+
+
+def parse_timestamp_binary(value, length, cursor):
+    return _PG_EPOCH + datetime.timedelta(
+        microseconds=_unpack_int8(value)[0])
+
+
+def parse_timestamptz_binary(value, length, cursor):
+    """Typecast a timestamptz from its binary representation.
+
+    The server sends the value in UTC, so the timestamp returned has a zero
+    offset rather than the offset of the session time zone.
+
+    """
+    dt = parse_timestamp_binary(value, length, cursor)
+    if cursor.tzinfo_factory is not None:
+        dt = dt.replace(tzinfo=cursor.tzinfo_factory(0))
+    return dt
+
+
+def parse_interval_binary(value, length, cursor):
+    usecs, days, months = _unpack_interval(value)
+    years, months = divmod(months, 12)
+    days += years * 365 + months * 30
+    return datetime.timedelta(days, microseconds=usecs)
+
+
+def parse_array_binary(value, length, cursor):
+    """Typecast an array from its binary representation.
+
+    The items are typecasted by the binary typecaster of the array element
+    type. Multidimensional arrays are returned as nested lists.
+
+    """
+    ndim, flags, elemtype = _unpack_array_header(value[:12])
+    if ndim == 0:
+        return []
+
+    dims = []
+    pos = 12
+    for i in xrange(ndim):
+        dims.append(_unpack_array_dim(value[pos:pos + 8])[0])
+        pos += 8
+
+    cast = binary_types.get(elemtype, BINARY_UNKNOWN).cast
+    items = []
+    for i in xrange(reduce(lambda a, b: a * b, dims)):
+        size = _unpack_int4(value[pos:pos + 4])[0]
+        pos += 4
+        if size < 0:
+            items.append(None)
+        else:
+            items.append(cast(value[pos:pos + size], cursor, size))
+            pos += size
+
+    # Reshape the items according to the array dimensions, innermost first
+    for dim in reversed(dims[1:]):
+        items = [items[i:i + dim] for i in xrange(0, len(items), dim)]
+    return items
+
+
+# Casters equivalent to calling a builtin on the string value: a whole column
+# of them can be converted with a single call to map().
+_builtin_casters = {
+    parse_integer: int,
+    parse_longinteger: long,
+    parse_float: float,
+    parse_decimal: decimal.Decimal,
+}
+
+# Binary casters of fixed size values: a whole column of them without NULLs
+# can be unpacked with a single struct.unpack() call.
+_struct_casters = {
+    parse_int2_binary: 'h',
+    parse_int4_binary: 'i',
+    parse_oid_binary: 'I',
+    parse_float4_binary: 'f',
+    parse_float8_binary: 'd',
+}
+
+
+def binary_text_caster(caster, to_text):
+    """Return a typecaster applying the text typecaster `caster` to binary
+    values converted into their text representation by `to_text`.
+
+    `to_text` is an item of `binary_to_text`.
+
+    """
+    if to_text is None:
+        return caster
+
+    def cast(value, length, cursor):
+        value = to_text(value)
+        return caster.cast(value, cursor, len(value))
+
+    return Type(caster.name, caster.values, cast)
+
+
+def column_caster(caster):
+    """Return the function converting the values of a result column.
+
+    The function is called with the list of the column values (None for
+    NULLs) and the cursor and returns the list of casted values. Choosing
+    it once per result avoids inspecting the caster at every fetch.
+
+    """
+    if type(caster) is Type and caster.py_caster is None:
+        if caster.caster is parse_string:
+            return _cast_column_noop
+        if caster.caster in _builtin_casters:
+            return partial(_cast_column_builtin,
+                _builtin_casters[caster.caster])
+        if caster.caster in _struct_casters:
+            return partial(_cast_column_struct,
+                _struct_casters[caster.caster])
+
+    return partial(_cast_column, caster.cast)
+
+
+def _cast_column_noop(values, cursor):
+    return values
+
+
+def _cast_column_builtin(func, values, cursor):
+    if None in values:
+        return [value if value is None else func(value) for value in values]
+    return map(func, values)
+
+
+def _cast_column_struct(code, values, cursor):
+    if None in values:
+        fmt = '!' + code
+        return [value if value is None else struct.unpack(fmt, value)[0]
+            for value in values]
+    return list(struct.unpack('!%d%s' % (len(values), code), ''.join(values)))
+
+
+def _cast_column(cast, values, cursor):
+    return [value if value is None else cast(value, cursor, len(value))
+        for value in values]
+
+
 
 def Date(year, month, day):
     from psycopg2cffi.extensions.adapters import DateTime
@@ -347,7 +606,8 @@ def Binary(obj):
 def _default_type(name, oids, caster):
     """Shortcut to register internal types"""
     type_obj = Type(name, oids, caster)
-    register_type(type_obj)
+    for value in oids:
+        string_types[value] = type_obj
     return type_obj
 
 
@@ -399,3 +659,47 @@ TIMEARRAY = _default_type(
 UNICODE = Type('UNICODE', [19, 18, 25, 1042, 1043], parse_unicode)
 UNICODEARRAY = Type('UNICODEARRAY', [1002, 1003, 1009, 1014, 1015],
     parse_array(UNICODE))
+
+
+def _default_binary_type(name, oids, caster):
+    """Shortcut to register internal binary typecasters"""
+    type_obj = Type(name, oids, caster)
+    for value in oids:
+        binary_types[value] = type_obj
+    return type_obj
+
+
+# Binary typecasters, used for the results of the queries executed by cursors
+# in binary mode. The values of the types without a binary typecaster are
+# converted to text by the server and passed to the text typecasters (see
+# Cursor._get_server_text()); BINARY_UNKNOWN is only used for the items of
+# arrays of unexpected types.
+BINARY_UNKNOWN = Type('UNKNOWN', [], parse_string)
+
+_default_binary_type('BINARY', [17], parse_bytea_binary)
+_default_binary_type('BOOLEAN', [16], parse_boolean_binary)
+_default_binary_type('SMALLINT', [21], parse_int2_binary)
+_default_binary_type('INTEGER', [23], parse_int4_binary)
+_default_binary_type('LONGINTEGER', [20], parse_int8_binary)
+_default_binary_type('ROWID', [26], parse_oid_binary)
+_default_binary_type('FLOAT4', [700], parse_float4_binary)
+_default_binary_type('FLOAT', [701], parse_float8_binary)
+_default_binary_type('DECIMAL', [1700], parse_numeric_binary)
+_default_binary_type('STRING', [19, 18, 25, 705, 1042, 1043], parse_string)
+_default_binary_type('DATE', [1082], parse_date_binary)
+_default_binary_type('TIME', [1083], parse_time_binary)
+_default_binary_type('DATETIME', [1114], parse_timestamp_binary)
+_default_binary_type('DATETIMETZ', [1184], parse_timestamptz_binary)
+_default_binary_type('INTERVAL', [1186], parse_interval_binary)
+_default_binary_type('UUID', [2950], parse_uuid_binary)
+_default_binary_type('ARRAY', [
+    1000, 1001, 1002, 1005, 1007, 1009, 1014, 1015, 1016, 1021, 1022,
+    1028, 1115, 1182, 1183, 1185, 1187, 1231, 2951], parse_array_binary)
+
+# The types whose binary values can be converted into their text
+# representation, so that the text typecasters registered by the user can be
+# applied to the results in binary mode: oid -> function returning the text
+# representation (None if the binary value is already text).
+binary_to_text = dict.fromkeys([18, 19, 25, 114, 705, 1042, 1043])
+binary_to_text[3802] = lambda value: value[1:]     # jsonb: version byte
+binary_to_text[2950] = lambda value: parse_uuid_binary(value, None, None)
@@ -1,5 +1,5 @@
 from psycopg2cffi._impl import exceptions
-from psycopg2cffi._impl.libpq import libpq
+from psycopg2cffi._impl.libpq import libpq, ffi
 from psycopg2cffi._impl.adapters import QuotedString
 
 
@@ -15,7 +15,18 @@ def pq_clear_async(pgconn):
         pgres = libpq.PQgetResult(pgconn)
         if not pgres:
             break
+        status = libpq.PQresultStatus(pgres)
         libpq.PQclear(pgres)
+        if status == libpq.PGRES_COPY_OUT:
+            # PQgetResult() doesn't move past a COPY OUT before its end
+            pq_drain_copy_out(pgconn)
+
+
+def pq_drain_copy_out(pgconn):
+    """Read and throw away the data left of a COPY OUT."""
+    buf = ffi.new('char **')
+    while libpq.PQgetCopyData(pgconn, buf, 0) > 0:
+        libpq.PQfreemem(buf[0])
 
 
 def pq_get_last_result(pgconn):
@@ -36,6 +47,85 @@ def pq_get_last_result(pgconn):
     return pgres
 
 
+def pq_get_results(pgconn):
+    """Return the list of the results of the query sent."""
+    results = []
+    while True:
+        pgres = libpq.PQgetResult(pgconn)
+        if not pgres:
+            return results
+        results.append(pgres)
+
+
+def pq_exec(pgconn, query, params=None, result_format=0):
+    """Execute a query, using the extended protocol if required.
+
+    `params` is a sequence of (oid, format, value) triples, as returned by
+    the adapters getbinding() method, to be sent separately from the query.
+
+    """
+    if params is None and not result_format:
+        return libpq.PQexec(pgconn, query)
+
+    keep = []
+    args = _pq_params_args(params or (), keep)
+    return libpq.PQexecParams(pgconn, query, *args + (result_format,))
+
+
+def pq_send_query(pgconn, query, params=None, result_format=0):
+    """Send a query without waiting for the result: see pq_exec()"""
+    if params is None and not result_format:
+        return libpq.PQsendQuery(pgconn, query)
+
+    keep = []
+    args = _pq_params_args(params or (), keep)
+    return libpq.PQsendQueryParams(pgconn, query, *args + (result_format,))
+
+
+def pq_prepare(pgconn, name, query, params=None):
+    """Create a prepared statement with the types of the given parameters"""
+    types = ffi.NULL
+    if params:
+        types = ffi.new('Oid[]', [p[0] for p in params])
+    return libpq.PQprepare(pgconn, name, query, len(params or ()), types)
+
+
+def pq_exec_prepared(pgconn, name, params=None, result_format=0):
+    """Execute a statement created by pq_prepare(): see pq_exec()"""
+    keep = []
+    nparams, types, values, lengths, formats = \
+        _pq_params_args(params or (), keep)
+    return libpq.PQexecPrepared(
+        pgconn, name, nparams, values, lengths, formats, result_format)
+
+
+def _pq_params_args(params, keep):
+    """Return the parameters arguments for the PQ*Params() functions
+
+    The buffers pointed by the arrays are appended to `keep`, which must be
+    kept alive until the function has been called.
+
+    """
+    nparams = len(params)
+    if not nparams:
+        return (0, ffi.NULL, ffi.NULL, ffi.NULL, ffi.NULL)
+
+    types = ffi.new('Oid[]', nparams)
+    values = ffi.new('char *[]', nparams)
+    lengths = ffi.new('int[]', nparams)
+    formats = ffi.new('int[]', nparams)
+    for i, (oid, format, value) in enumerate(params):
+        types[i] = oid
+        formats[i] = format
+        if value is not None:
+            buf = ffi.new('char[]', value)
+            keep.append(buf)
+            values[i] = buf
+            lengths[i] = len(value)
+
+    return (nparams, types, values, lengths, formats)
+
+
 def quote_string(conn, value):
     obj = QuotedString(value)
     obj.prepare(conn)
@@ -24,8 +24,18 @@ This module implements thread-safe (and not) connection pools.
 # FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Lesser General Public
 # License for more details.
 
+import os
+import time
+import errno
+import bisect
+import hashlib
+import select
+import threading
+from collections import deque
+
 import psycopg2
 import psycopg2.extensions as _ext
+from psycopg2cffi._impl import connection as _connection
 
 try:
     import logging
@@ -56,6 +66,202 @@ class PoolError(psycopg2.Error):
     pass
 
 
+# Serialize the pools cleanup in a forked process
+_fork_lock = threading.Lock()
+
+
+def _conn_alive(conn):
+    """Check if an idle connection is still usable without a round trip.
+
+    An idle connection has nothing to read: if its socket is readable the
+    server has closed it, or has sent something (a notification, the error
+    preceding the end of file of a terminated backend...) which is consumed
+    to know. The end of file is only noticed reading again.
+    """
+    if conn.closed:
+        return False
+    try:
+        for i in range(3):
+            if not select.select([conn], [], [], 0)[0]:
+                break
+            conn.poll()
+    except (psycopg2.Error, select.error, ValueError):
+        return False
+    return not conn.closed and \
+        conn.get_transaction_status() == _ext.TRANSACTION_STATUS_IDLE
+
+
+def _close(conn):
+    """Close a connection ignoring errors (e.g. if it is already closed)."""
+    try:
+        conn.close()
+    except Exception:
+        pass
+
+
+def _connect_timeout(dsn):
+    """Return the 'connect_timeout' of a dsn in seconds, None if not set.
+
+    libpq only applies it to blocking connections, so the connections
+    started asynchronously must enforce it themselves.
+    """
+    params = _connection._parse_dsn(dsn) or {}
+    value = params.get('connect_timeout',
+        os.environ.get('PGCONNECT_TIMEOUT'))
+    try:
+        timeout = int(value)
+    except (TypeError, ValueError):
+        return None
+    if timeout <= 0:
+        return None
+    # libpq doesn't accept less than 2 seconds either
+    return max(timeout, 2)
+
+
+def _connect_many(n, args, kwargs):
+    """Open 'n' connections concurrently.
+
+    The connections are started asynchronously and advanced together by a
+    single select() loop, then switched to blocking mode. Return the list of
+    the connections established and the first error met, if any.
+
+    The connections not established within the 'connect_timeout' of the
+    dsn are closed and reported as an OperationalError.
+    """
+    kwargs = dict(kwargs, async=True)
+    conns = []
+    error = None
+    try:
+        for i in range(n):
+            conns.append(psycopg2.connect(*args, **kwargs))
+    except psycopg2.Error, e:
+        error = e
+
+    deadline = None
+    if conns:
+        timeout = _connect_timeout(conns[0].dsn)
+        if timeout is not None:
+            deadline = time.time() + timeout
+
+    done = []
+    ready = conns
+    reading = []
+    writing = []
+    while ready:
+        for conn in ready:
+            try:
+                state = conn.poll()
+            except psycopg2.Error, e:
+                error = error or e
+                _close(conn)
+                continue
+            if state == _ext.POLL_OK:
+                conn._async_to_sync()
+                done.append(conn)
+            elif state == _ext.POLL_READ:
+                reading.append(conn)
+            elif state == _ext.POLL_WRITE:
+                writing.append(conn)
+            else:
+                error = error or psycopg2.OperationalError(
+                    "bad state from poll: %s" % state)
+                _close(conn)
+
+        if not reading and not writing:
+            break
+        if deadline is None:
+            remaining = None
+        else:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                for conn in reading + writing:
+                    _close(conn)
+                error = error or psycopg2.OperationalError(
+                    "timeout expired")
+                break
+        try:
+            if remaining is None:
+                r, w, x = select.select(reading, writing, [])
+            else:
+                r, w, x = select.select(reading, writing, [], remaining)
+        except select.error, e:
+            if e.args[0] != errno.EINTR:
+                raise
+            r, w = [], []
+        ready = r + w
+        reading = [c for c in reading if c not in r]
+        writing = [c for c in writing if c not in w]
+
+    return done, error
+
+
+class Histogram(object):
+    """Distribution of durations, in seconds.
+
+    'counts[i]' is the number of values not greater than 'bounds[i]'
+    (and greater than the previous bound); the last count is for the values
+    greater than the last bound.
+    """
+    bounds = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)
+
+    def __init__(self):
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    def as_dict(self):
+        return {
+            'count': self.count,
+            'total': self.total,
+            'max': self.max,
+            'buckets': zip(self.bounds + (None,), self.counts),
+        }
+
+
+class PoolStats(object):
+    """Counters and timings of a connection pool."""
+
+    def __init__(self):
+        self.connections_opened = 0
+        # reason -> number of connections closed by the pool
+        self.connections_discarded = {}
+        self.requests = 0               # connections returned by getconn()
+        self.requests_exhausted = 0     # getconn() failed for lack of room
+        self.requests_waiting_max = 0   # longest queue seen
+        self.requests_waited = 0        # getconn() calls which had to wait
+        self.requests_timed_out = 0     # getconn() calls which timed out
+        self.wait_time = 0.0            # total seconds spent waiting
+        self.wait_time_max = 0.0        # longest wait
+        self.returns = 0                # connections put back
+        self.returns_rolled_back = 0    # put back in transaction or error
+        self.returns_reset = 0          # put back with the session changed
+
+        #: Time spent in getconn(), waiting and connecting included.
+        self.checkout_time = Histogram()
+
+        #: Time between getconn() and putconn().
+        self.hold_time = Histogram()
+
+    def discarded(self, reason):
+        self.connections_discarded[reason] = \
+            self.connections_discarded.get(reason, 0) + 1
+
+    def as_dict(self):
+        rv = dict(self.__dict__)
+        rv['connections_discarded'] = dict(self.connections_discarded)
+        rv['checkout_time'] = self.checkout_time.as_dict()
+        rv['hold_time'] = self.hold_time.as_dict()
+        return rv
+
+
 class AbstractConnectionPool(object):
     """Generic key-based pooling code."""
 
@@ -63,12 +269,54 @@ class AbstractConnectionPool(object):
         """Initialize the connection pool.
 
         New 'minconn' connections are created immediately calling 'connfunc'
-        with given parameters. The connection pool will support a maximum of
-        about 'maxconn' connections.        
+        with given parameters: they are established concurrently. The
+        connection pool will support a maximum of about 'maxconn'
+        connections.        
+
+        If 'max_lifetime' is given, connections older than that many seconds
+        are closed instead of being reused. Connections put back beyond
+        'minconn' idle ones are closed, unless 'max_idle' is given: in this
+        case they are kept and closed once unused for longer than that many
+        seconds, while 'minconn' connections are kept anyway. Idle
+        connections are checked before being returned by getconn(): the
+        ones closed by the server are discarded.
+
+        If 'reset_on_return' is true, the connections put back are reset
+        instead of just rolled back, so the session changes made by a user
+        are not seen by the next one. The reset only undoes the changes
+        noticed by the connection in the statements executed: it costs no
+        round trip if the session was not changed, and uses DISCARD ALL
+        only if something else than the configuration parameters was.
+        Changes it can't notice, e.g. a SET after a comment or made by a
+        function, are not undone: call connection.reset() before putconn()
+        if the users may make them.
+
+        The callables 'on_connect', 'on_checkout', 'on_checkin' are called
+        with a connection when it is created, returned by getconn(), put
+        back. 'on_discard' is called with a connection closed by the pool
+        and the reason ('closed', 'lost', 'expired', 'dead', 'surplus').
+        The hooks are called holding the pool lock: they must be quick and
+        must not use the pool.
+
+        If 'lazy' is true the 'minconn' connections are only created on the
+        first getconn(). After a fork, the connections inherited by the child
+        process are dropped, without closing the parent's sessions, and
+        replaced lazily: a pool can be created before forking the workers.
         """
         self.minconn = minconn
         self.maxconn = maxconn
+        self.max_lifetime = kwargs.pop('max_lifetime', None)
+        self.max_idle = kwargs.pop('max_idle', None)
+        self.reset_on_return = kwargs.pop('reset_on_return', False)
+        self.on_connect = kwargs.pop('on_connect', None)
+        self.on_checkout = kwargs.pop('on_checkout', None)
+        self.on_checkin = kwargs.pop('on_checkin', None)
+        self.on_discard = kwargs.pop('on_discard', None)
+        lazy = kwargs.pop('lazy', False)
         self.closed = False
+
+        #: Statistics about the pool usage: see get_stats().
+        self.stats = PoolStats()
         
         self._args = args
         self._kwargs = kwargs
@@ -76,14 +324,32 @@ class AbstractConnectionPool(object):
         self._pool = []
         self._used = {}
         self._rused = {} # id(conn) -> key map
+        # id(conn) -> [creation time, last return time, last checkout time]
+        self._times = {}
         self._keys = 0
 
-        for i in range(self.minconn):
-            self._connect()
+        # The process owning the connections, and whether the 'minconn'
+        # connections are still to be created
+        self._pid = os.getpid()
+        self._fill = lazy
+        if lazy:
+            return
+
+        conns, error = _connect_many(self.minconn, args, kwargs)
+        if error is not None:
+            for conn in conns:
+                _close(conn)
+            raise error
+        for conn in conns:
+            self._add_idle(conn)
 
     def _connect(self, key=None):
         """Create a new connection and assign it to 'key' if not None."""
         conn = psycopg2.connect(*self._args, **self._kwargs)
+        now = time.time()
+        self._times[id(conn)] = [now, now, now]
+        self.stats.connections_opened += 1
+        self._call_hook(self.on_connect, conn)
         if key is not None:
             self._used[key] = conn
             self._rused[id(conn)] = key
@@ -91,54 +357,169 @@ class AbstractConnectionPool(object):
             self._pool.append(conn)
         return conn
 
+    def _add_idle(self, conn):
+        """Add a new connection to the idle ones."""
+        now = time.time()
+        self._times[id(conn)] = [now, now, now]
+        self.stats.connections_opened += 1
+        self._call_hook(self.on_connect, conn)
+        self._pool.append(conn)
+
+    def _call_hook(self, hook, *args):
+        """Call a hook, if set, logging its errors."""
+        if hook is not None:
+            try:
+                hook(*args)
+            except Exception, e:
+                dbg("pool hook failed:", e)
+
+    def _expired(self, conn, now, idle=True):
+        """Return True if a connection is too old or, if 'idle', if it was
+        unused for too long."""
+        created, used = self._times.get(id(conn), (now, now))[:2]
+        return (self.max_lifetime is not None
+                and now - created >= self.max_lifetime) \
+            or (idle and self.max_idle is not None
+                and now - used >= self.max_idle)
+
+    def _discard(self, conn, reason):
+        """Close a connection no more tracked by the pool."""
+        self._times.pop(id(conn), None)
+        self.stats.discarded(reason)
+        self._call_hook(self.on_discard, conn, reason)
+        _close(conn)
+
+    def _check_fork(self):
+        """Drop the connections inherited from the parent after a fork.
+
+        The connections are detached without closing them on the server:
+        they are still in use by the parent. The pool is refilled on the
+        next getconn().
+        """
+        if self._pid == os.getpid():
+            return
+        _fork_lock.acquire()
+        try:
+            if self._pid == os.getpid():
+                return
+            for conn in self._pool + list(self._used.values()):
+                conn._detach()
+            self._pool = []
+            self._used = {}
+            self._rused = {}
+            self._times = {}
+            self.stats = PoolStats()
+            self._fill = True
+            self._after_fork()
+            self._pid = os.getpid()
+        finally:
+            _fork_lock.release()
+
+    def _after_fork(self):
+        """Reinitialize the process-specific state in the child process."""
+        pass
+
     def _getkey(self):
         """Return a new unique key."""
         self._keys += 1
         return self._keys
             
-    def _getconn(self, key=None):
-        """Get a free connection and assign it to 'key' if not None."""
+    def _getconn(self, key=None, start=None):
+        """Get a free connection and assign it to 'key' if not None.
+
+        'start' is the time the request was made, if not now.
+        """
+        self._check_fork()
         if self.closed: raise PoolError("connection pool is closed")
         if key is None: key = self._getkey()
 	
         if key in self._used:
             return self._used[key]
 
-        if self._pool:
-            self._used[key] = conn = self._pool.pop()
+        if self._fill:
+            AbstractConnectionPool._maintain(self)
+            self._fill = False
+
+        now = time.time()
+        if start is None: start = now
+        while self._pool:
+            conn = self._pool.pop()
+            if self._expired(conn, now, idle=len(self._pool) >= self.minconn):
+                self._discard(conn, 'expired')
+                continue
+            if not _conn_alive(conn):
+                self._discard(conn, 'dead')
+                continue
+            self._used[key] = conn
             self._rused[id(conn)] = key
-            return conn
+            break
         else:
             if len(self._used) == self.maxconn:
+                self.stats.requests_exhausted += 1
                 raise PoolError("connection pool exausted")
-            return self._connect(key)
+            conn = self._connect(key)
+
+        now = time.time()
+        times = self._times.get(id(conn))
+        if times is not None:
+            times[2] = now
+        self.stats.requests += 1
+        self.stats.checkout_time.add(now - start)
+        self._call_hook(self.on_checkout, conn)
+        return conn
 		 
     def _putconn(self, conn, key=None, close=False):
         """Put away a connection."""
+        self._check_fork()
         if self.closed: raise PoolError("connection pool is closed")
         if key is None: key = self._rused.get(id(conn))
 
         if not key:
             raise PoolError("trying to put unkeyed connection")
 
-        if len(self._pool) < self.minconn and not close:
+        now = time.time()
+        times = self._times.get(id(conn))
+        self.stats.returns += 1
+        if times is not None:
+            self.stats.hold_time.add(now - times[2])
+        self._call_hook(self.on_checkin, conn)
+
+        if conn.closed:
+            # If the connection is closed, we just discard it.
+            self._discard(conn, 'closed')
+        elif close or (self.max_idle is None
+                and len(self._pool) >= self.minconn):
+            self._discard(conn, 'surplus')
+        elif self._expired(conn, now, idle=False):
+            self._discard(conn, 'expired')
+        else:
             # Return the connection into a consistent state before putting
             # it back into the pool
-            if not conn.closed:
-                status = conn.get_transaction_status()
-                if status == _ext.TRANSACTION_STATUS_UNKNOWN:
-                    # server connection lost
-                    conn.close()
+            status = conn.get_transaction_status()
+            if status == _ext.TRANSACTION_STATUS_UNKNOWN:
+                # server connection lost
+                self._discard(conn, 'lost')
+            elif self.reset_on_return:
+                if conn._session_state:
+                    self.stats.returns_reset += 1
                 elif status != _ext.TRANSACTION_STATUS_IDLE:
-                    # connection in error or in transaction
-                    conn.rollback()
-                    self._pool.append(conn)
+                    self.stats.returns_rolled_back += 1
+                try:
+                    conn._reset_session()
+                except psycopg2.Error:
+                    self._discard(conn, 'lost')
                 else:
-                    # regular idle connection
                     self._pool.append(conn)
-            # If the connection is closed, we just discard it.
-        else:
-            conn.close()
+            else:
+                if status != _ext.TRANSACTION_STATUS_IDLE:
+                    # connection in error or in transaction
+                    self.stats.returns_rolled_back += 1
+                    conn.rollback()
+                # regular idle connection
+                self._pool.append(conn)
+
+            if times is not None:
+                times[1] = now
 
         # here we check for the presence of key because it can happen that a
         # thread tries to put back a connection after a call to close
@@ -146,6 +527,42 @@ class AbstractConnectionPool(object):
             del self._used[key]
             del self._rused[id(conn)]
 
+    def _reap(self):
+        """Close the idle connections expired or lost.
+
+        The connections unused for longer than 'max_idle' are closed only
+        beyond 'minconn' idle ones, the least recently used first.
+
+        Return the number of connections to create to have 'minconn' idle
+        connections again (without exceeding 'maxconn').
+        """
+        self._check_fork()
+        if self.closed: raise PoolError("connection pool is closed")
+        now = time.time()
+        # the connections are put back and taken at the end of the list
+        for conn in self._pool[:]:
+            if self._expired(conn, now, idle=len(self._pool) > self.minconn):
+                self._pool.remove(conn)
+                self._discard(conn, 'expired')
+            elif not _conn_alive(conn):
+                self._pool.remove(conn)
+                self._discard(conn, 'dead')
+
+        return max(0, min(self.minconn - len(self._pool),
+            self.maxconn - len(self._pool) - len(self._used)))
+
+    def _maintain(self):
+        """Close the idle connections expired or lost and refill the pool.
+
+        New connections are created concurrently until 'minconn' are idle
+        (without exceeding 'maxconn').
+        """
+        conns, error = _connect_many(self._reap(), self._args, self._kwargs)
+        for conn in conns:
+            self._add_idle(conn)
+        if error is not None:
+            raise error
+
     def _closeall(self):
         """Close all connections.
 
@@ -153,13 +570,27 @@ class AbstractConnectionPool(object):
         an already closed connection. If you call .closeall() make sure
         your code can deal with it.
         """
+        self._check_fork()
         if self.closed: raise PoolError("connection pool is closed")
         for conn in self._pool + list(self._used.values()):
             try:
                 conn.close()
             except:
                 pass
+        self._times.clear()
         self.closed = True
+
+    def _get_stats(self):
+        """Return a dict with the pool statistics.
+
+        It contains the counters and histograms of the 'stats' object and the
+        number of connections idle and in use right now.
+        """
+        self._check_fork()
+        stats = self.stats.as_dict()
+        stats['connections_idle'] = len(self._pool)
+        stats['connections_used'] = len(self._used)
+        return stats
         
 
 class SimpleConnectionPool(AbstractConnectionPool):
@@ -167,6 +598,8 @@ class SimpleConnectionPool(AbstractConnectionPool):
 
     getconn = AbstractConnectionPool._getconn
     putconn = AbstractConnectionPool._putconn
+    maintain = AbstractConnectionPool._maintain
+    get_stats = AbstractConnectionPool._get_stats
     closeall   = AbstractConnectionPool._closeall
 
 
@@ -174,33 +607,170 @@ class ThreadedConnectionPool(AbstractConnectionPool):
     """A connection pool that works with the threading module."""
 
     def __init__(self, minconn, maxconn, *args, **kwargs):
-        """Initialize the threading lock."""
-        import threading
+        """Initialize the threading lock.
+
+        If 'maintenance_interval' is given, a background thread calls
+        maintain() every that many seconds, until closeall() is called.
+        """
+        self._interval = kwargs.pop('maintenance_interval', None)
         AbstractConnectionPool.__init__(
             self, minconn, maxconn, *args, **kwargs)
+        self._after_fork()
+
+    def _after_fork(self):
+        """Create the lock and the maintenance thread of this process."""
         self._lock = threading.Lock()
 
-    def getconn(self, key=None):
-        """Get a free connection and assign it to 'key' if not None."""
+        # Conditions of the threads waiting for a connection, in order
+        self._waiters = deque()
+
+        self._stop = threading.Event()
+        if self._interval is not None:
+            t = threading.Thread(target=self._maintenance_loop,
+                args=(self._interval,), name="pool maintenance")
+            t.setDaemon(True)
+            t.start()
+
+    def getconn(self, key=None, timeout=None):
+        """Get a free connection and assign it to 'key' if not None.
+
+        If the pool is exhausted and 'timeout' is not None, wait up to
+        'timeout' seconds for a connection to be returned to the pool before
+        failing. The threads waiting are served in arrival order. Without a
+        'timeout' the call never waits: a connection available is returned
+        even if other threads are waiting in line.
+        """
+        start = time.time()
+        self._check_fork()
         self._lock.acquire()
         try:
-            return self._getconn(key)
+            if key in self._used:
+                return self._getconn(key, start)
+            if timeout is None:
+                if not self._has_room():
+                    self.stats.requests_exhausted += 1
+                    raise PoolError("connection pool exausted")
+                return self._getconn(key, start)
+            if not self._waiters and self._has_room():
+                return self._getconn(key, start)
+            return self._wait_conn(key, timeout, start)
         finally:
             self._lock.release()
 
     def putconn(self, conn=None, key=None, close=False):
         """Put away an unused connection."""
+        self._check_fork()
         self._lock.acquire()
         try:
             self._putconn(conn, key, close)
+            self._notify_waiter()
+        finally:
+            self._lock.release()
+
+    def maintain(self):
+        """Close the idle connections expired or lost and refill the pool.
+
+        The new connections are created concurrently, without holding the
+        pool lock.
+        """
+        self._check_fork()
+        self._lock.acquire()
+        try:
+            missing = self._reap()
         finally:
             self._lock.release()
 
+        conns, error = _connect_many(missing, self._args, self._kwargs)
+        self._lock.acquire()
+        try:
+            for conn in conns:
+                if self.closed or len(self._pool) >= self.minconn \
+                        or len(self._pool) + len(self._used) >= self.maxconn:
+                    _close(conn)
+                    continue
+                self._add_idle(conn)
+                self._notify_waiter()
+        finally:
+            self._lock.release()
+        if error is not None:
+            raise error
+
+    def _maintenance_loop(self, interval):
+        """Call maintain() every 'interval' seconds until the pool is closed."""
+        while not self._stop.isSet():
+            self._stop.wait(interval)
+            if self.closed:
+                break
+            try:
+                self.maintain()
+            except Exception, e:
+                if not self.closed:
+                    dbg("pool maintenance failed:", e)
+
+    def get_stats(self):
+        """Return a dict with the pool statistics.
+
+        'requests_waiting' is the number of threads waiting right now.
+        """
+        self._check_fork()
+        self._lock.acquire()
+        try:
+            stats = self._get_stats()
+            stats['requests_waiting'] = len(self._waiters)
+            return stats
+        finally:
+            self._lock.release()
+
+    def _has_room(self):
+        """Return True if getconn() can return a connection now."""
+        return bool(self._pool) or len(self._used) < self.maxconn
+
+    def _notify_waiter(self):
+        """Wake up the first thread waiting, if it can be served."""
+        if self._waiters and self._has_room():
+            self._waiters[0].notify()
+
+    def _wait_conn(self, key, timeout, start):
+        """Wait in line for a connection. Called with the lock held."""
+        waiter = threading.Condition(self._lock)
+        self._waiters.append(waiter)
+        stats = self.stats
+        stats.requests_waited += 1
+        stats.requests_waiting_max = max(
+            stats.requests_waiting_max, len(self._waiters))
+
+        deadline = start + timeout
+        try:
+            while not (self._waiters[0] is waiter and self._has_room()):
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    stats.requests_timed_out += 1
+                    raise PoolError(
+                        "connection pool exausted: timeout expired")
+                waiter.wait(remaining)
+                if self.closed:
+                    raise PoolError("connection pool is closed")
+        finally:
+            self._waiters.remove(waiter)
+            self._notify_waiter()
+            elapsed = time.time() - start
+            stats.wait_time += elapsed
+            stats.wait_time_max = max(stats.wait_time_max, elapsed)
+
+        try:
+            return self._getconn(key, start)
+        finally:
+            self._notify_waiter()
+
     def closeall(self):
         """Close all connections (even the one currently in use.)"""
+        self._check_fork()
         self._lock.acquire()
         try:
             self._closeall()
+            self._stop.set()
+            for waiter in self._waiters:
+                waiter.notify()
         finally:
             self._lock.release()
 
@@ -217,19 +787,23 @@ class PersistentConnectionPool(AbstractConnectionPool):
 
     def __init__(self, minconn, maxconn, *args, **kwargs):
         """Initialize the threading lock."""
-        import threading
         AbstractConnectionPool.__init__(
             self, minconn, maxconn, *args, **kwargs)
-        self._lock = threading.Lock()
+        self._after_fork()
 
         # we we'll need the thread module, to determine thread ids, so we
         # import it here and copy it in an instance variable
         import thread
         self.__thread = thread
 
+    def _after_fork(self):
+        """Create the lock of this process."""
+        self._lock = threading.Lock()
+
     def getconn(self):
         """Generate thread id and return a connection."""
         key = self.__thread.get_ident()
+        self._check_fork()
         self._lock.acquire()
         try:
             return self._getconn(key)
@@ -239,6 +813,7 @@ class PersistentConnectionPool(AbstractConnectionPool):
     def putconn(self, conn=None, close=False):
         """Put away an unused connection."""
         key = self.__thread.get_ident()
+        self._check_fork()
         self._lock.acquire()
         try:
             if not conn: conn = self._used[key]
@@ -246,10 +821,434 @@ class PersistentConnectionPool(AbstractConnectionPool):
         finally:
             self._lock.release()
 
+    def maintain(self):
+        """Close the idle connections expired or lost and refill the pool."""
+        self._check_fork()
+        self._lock.acquire()
+        try:
+            self._maintain()
+        finally:
+            self._lock.release()
+
+    def get_stats(self):
+        """Return a dict with the pool statistics."""
+        self._check_fork()
+        self._lock.acquire()
+        try:
+            return self._get_stats()
+        finally:
+            self._lock.release()
+
     def closeall(self):
         """Close all connections (even the one currently in use.)"""
+        self._check_fork()
         self._lock.acquire()
         try:
             self._closeall()
         finally:
             self._lock.release()
+
+
+def replica_lag_check(max_lag):
+    """Return a replica check failing if a replica is 'max_lag' seconds late.
+
+    The lag is measured as the time since the last transaction replayed: on
+    a quiet primary it grows even if the replica is up to date. A server
+    not in recovery always passes the check.
+    """
+    def check(conn):
+        cur = conn.cursor()
+        cur.execute("""select case when pg_is_in_recovery()
+            then extract(epoch from now() - pg_last_xact_replay_timestamp())
+            else 0 end""")
+        lag = cur.fetchone()[0]
+        return lag is not None and lag <= max_lag
+    return check
+
+
+class RoutingConnectionPool(object):
+    """A pool routing the read-only requests to replicas of the primary.
+
+    A ThreadedConnectionPool is created with 'minconn', 'maxconn' and the
+    other keyword arguments for the 'primary' and for each of the 'replicas'
+    dsn. getconn(readonly=True) returns a connection from the healthy
+    replica with the fewest connections checked out, or from the primary if
+    no replica can serve it.
+
+    A replica is unhealthy if connecting to it fails or if the 'check'
+    callable, called with a connection to it, returns false (see
+    replica_lag_check()). An unhealthy replica is not used again until
+    check_replicas() finds it healthy: it is called on creation (unless
+    'lazy' is true) and every 'check_interval' seconds if given, else it
+    must be called explicitly.
+    """
+
+    def __init__(self, minconn, maxconn, primary, replicas=(),
+            check=None, check_interval=None, **kwargs):
+        self.check = check
+        self.closed = False
+        lazy = kwargs.pop('lazy', False)
+        self.primary = ThreadedConnectionPool(
+            minconn, maxconn, primary, lazy=lazy, **kwargs)
+        self.replicas = []
+        try:
+            for dsn in replicas:
+                self.replicas.append(ThreadedConnectionPool(
+                    minconn, maxconn, dsn, lazy=True, **kwargs))
+        except:
+            self.primary.closeall()
+            raise
+
+        self._interval = check_interval
+        self._after_fork()
+        self._pid = os.getpid()
+        if not lazy:
+            self.check_replicas()
+
+    def _after_fork(self):
+        """Create the process-specific state."""
+        self._lock = threading.Lock()
+        self._healthy = [True] * len(self.replicas)
+        self._used = [0] * len(self.replicas)  # checkouts per replica
+        self._owners = {}   # id(conn) -> owner pool, replica index or None
+
+        self._stop = threading.Event()
+        if self._interval is not None:
+            t = threading.Thread(target=self._check_loop,
+                args=(self._interval,), name="pool replicas check")
+            t.setDaemon(True)
+            t.start()
+
+    def _check_fork(self):
+        if self._pid == os.getpid():
+            return
+        _fork_lock.acquire()
+        try:
+            if self._pid != os.getpid():
+                self._after_fork()
+                self._pid = os.getpid()
+        finally:
+            _fork_lock.release()
+
+    def getconn(self, readonly=False, timeout=None):
+        """Get a free connection, from a replica if 'readonly'.
+
+        'timeout' is only used waiting for the primary.
+        """
+        self._check_fork()
+        if self.closed: raise PoolError("connection pool is closed")
+        if readonly:
+            self._lock.acquire()
+            try:
+                order = [i for i in range(len(self.replicas))
+                    if self._healthy[i]]
+                order.sort(key=lambda i: self._used[i])
+            finally:
+                self._lock.release()
+
+            for i in order:
+                try:
+                    conn = self.replicas[i].getconn()
+                except PoolError:
+                    continue
+                except psycopg2.OperationalError, e:
+                    dbg("replica", i, "unavailable:", e)
+                    self._lock.acquire()
+                    try:
+                        self._healthy[i] = False
+                    finally:
+                        self._lock.release()
+                    continue
+                self._lock.acquire()
+                try:
+                    self._used[i] += 1
+                    self._owners[id(conn)] = i
+                finally:
+                    self._lock.release()
+                return conn
+
+        conn = self.primary.getconn(timeout=timeout)
+        self._lock.acquire()
+        try:
+            self._owners[id(conn)] = None
+        finally:
+            self._lock.release()
+        return conn
+
+    def putconn(self, conn, close=False):
+        """Put away an unused connection."""
+        self._check_fork()
+        self._lock.acquire()
+        try:
+            if id(conn) not in self._owners:
+                raise PoolError("trying to put unkeyed connection")
+            i = self._owners.pop(id(conn))
+            if i is not None:
+                self._used[i] -= 1
+        finally:
+            self._lock.release()
+
+        if i is None:
+            self.primary.putconn(conn, close=close)
+        else:
+            self.replicas[i].putconn(conn, close=close)
+
+    def check_replicas(self):
+        """Check the replicas health and return a list of flags."""
+        self._check_fork()
+        healthy = []
+        for i, pool in enumerate(self.replicas):
+            try:
+                conn = pool.getconn()
+            except PoolError:
+                # all the connections busy: the replica works
+                healthy.append(self._healthy[i])
+                continue
+            except psycopg2.Error, e:
+                dbg("replica", i, "unavailable:", e)
+                healthy.append(False)
+                continue
+
+            try:
+                ok = self.check is None or bool(self.check(conn))
+            except Exception, e:
+                dbg("replica", i, "check failed:", e)
+                ok = False
+            pool.putconn(conn, close=not ok)
+            healthy.append(ok)
+
+        self._lock.acquire()
+        try:
+            self._healthy[:] = healthy
+        finally:
+            self._lock.release()
+        return healthy
+
+    def _check_loop(self, interval):
+        """Call check_replicas() every 'interval' seconds until closed."""
+        while not self._stop.isSet():
+            self._stop.wait(interval)
+            if self.closed:
+                break
+            try:
+                self.check_replicas()
+            except Exception, e:
+                if not self.closed:
+                    dbg("replicas check failed:", e)
+
+    def get_stats(self):
+        """Return a dict with the statistics of the primary and replicas.
+
+        The replicas stats include the 'healthy' flag.
+        """
+        self._check_fork()
+        stats = {'primary': self.primary.get_stats(), 'replicas': []}
+        for i, pool in enumerate(self.replicas):
+            rstats = pool.get_stats()
+            rstats['healthy'] = self._healthy[i]
+            stats['replicas'].append(rstats)
+        return stats
+
+    def closeall(self):
+        """Close all connections of the primary and the replicas."""
+        self._check_fork()
+        if self.closed: raise PoolError("connection pool is closed")
+        self.closed = True
+        self._stop.set()
+        for pool in [self.primary] + self.replicas:
+            pool.closeall()
+
+
+class ShardedConnectionPool(object):
+    """A pool of connections to several databases chosen by a shard key.
+
+    'shards' maps the shard names to their dsn: a ThreadedConnectionPool is
+    created for each of them with 'minconn', 'maxconn' (or the values in
+    'limits', a map from shard names to (minconn, maxconn)) and the other
+    keyword arguments.
+
+    A shard key is looked up in 'shard_map', which can be a dict or a
+    callable returning a shard name (or None). The keys not mapped are
+    assigned by consistent hashing: adding or removing a shard only moves
+    the keys of that shard.
+    """
+
+    # Points on the hash ring for each shard
+    vnodes = 64
+
+    def __init__(self, minconn, maxconn, shards, shard_map=None,
+            limits=None, **kwargs):
+        self.shard_map = shard_map
+        self.closed = False
+        self.pools = {}
+        try:
+            for name, dsn in shards.items():
+                mn, mx = (limits or {}).get(name, (minconn, maxconn))
+                self.pools[name] = ThreadedConnectionPool(
+                    mn, mx, dsn, **kwargs)
+        except:
+            for pool in self.pools.values():
+                pool.closeall()
+            raise
+
+        ring = []
+        for name in self.pools:
+            for i in range(self.vnodes):
+                ring.append((_hash('%s-%d' % (name, i)), name))
+        ring.sort()
+        self._ring_hashes = [h for h, n in ring]
+        self._ring_names = [n for h, n in ring]
+
+        self._after_fork()
+        self._pid = os.getpid()
+
+    def _after_fork(self):
+        """Create the process-specific state."""
+        self._lock = threading.Lock()
+        self._owners = {}   # id(conn) -> shard name
+
+    def _check_fork(self):
+        if self._pid == os.getpid():
+            return
+        _fork_lock.acquire()
+        try:
+            if self._pid != os.getpid():
+                self._after_fork()
+                self._pid = os.getpid()
+        finally:
+            _fork_lock.release()
+
+    def shard_for(self, key):
+        """Return the name of the shard of a key."""
+        name = None
+        if self.shard_map is not None:
+            if callable(self.shard_map):
+                name = self.shard_map(key)
+            else:
+                name = self.shard_map.get(key)
+        if name is None:
+            if not self._ring_hashes:
+                raise PoolError("no shard available")
+            if isinstance(key, unicode):
+                key = key.encode('utf-8')
+            i = bisect.bisect(self._ring_hashes, _hash(str(key)))
+            name = self._ring_names[i % len(self._ring_names)]
+        elif name not in self.pools:
+            raise PoolError("unknown shard: %r" % (name,))
+        return name
+
+    def getconn(self, shard_key, timeout=None):
+        """Get a free connection to the shard of 'shard_key'."""
+        self._check_fork()
+        if self.closed: raise PoolError("connection pool is closed")
+        name = self.shard_for(shard_key)
+        conn = self.pools[name].getconn(timeout=timeout)
+        self._lock.acquire()
+        try:
+            self._owners[id(conn)] = name
+        finally:
+            self._lock.release()
+        return conn
+
+    def putconn(self, conn, close=False):
+        """Put away an unused connection."""
+        self._check_fork()
+        self._lock.acquire()
+        try:
+            name = self._owners.pop(id(conn), None)
+        finally:
+            self._lock.release()
+        if name is None:
+            raise PoolError("trying to put unkeyed connection")
+        self.pools[name].putconn(conn, close=close)
+
+    def scatter(self, query, vars=None, timeout=None):
+        """Execute a query on all the shards concurrently.
+
+        Every shard executes the query in a transaction, committed if it
+        succeeds. Return the list of the rows returned by all the shards,
+        sorted by shard name. If any shard fails, the first error is raised
+        once all the shards are done.
+        """
+        self._check_fork()
+        if self.closed: raise PoolError("connection pool is closed")
+        names = sorted(self.pools)
+        results = [None] * len(names)
+        errors = [None] * len(names)
+
+        def run(i):
+            pool = self.pools[names[i]]
+            try:
+                conn = pool.getconn(timeout=timeout)
+            except Exception, e:
+                errors[i] = e
+                return
+            close = False
+            try:
+                try:
+                    cur = conn.cursor()
+                    cur.execute(query, vars)
+                    results[i] = cur.description and cur.fetchall() or []
+                    conn.commit()
+                except Exception, e:
+                    errors[i] = e
+                    try:
+                        conn.rollback()
+                    except Exception:
+                        # e.g. connection lost: don't reuse it
+                        close = True
+            finally:
+                try:
+                    pool.putconn(conn, close=close)
+                except Exception, e:
+                    errors[i] = errors[i] or e
+
+        threads = [threading.Thread(target=run, args=(i,))
+            for i in range(1, len(names))]
+        for t in threads:
+            t.start()
+        if names:
+            run(0)
+        for t in threads:
+            t.join()
+
+        for e in errors:
+            if e is not None:
+                raise e
+        rows = []
+        for r in results:
+            rows.extend(r)
+        return rows
+
+    def get_stats(self):
+        """Return a dict with the statistics of all the shards.
+
+        The numeric counters are summed (the '*_max' ones maximized) across
+        the shards; 'shards' contains the stats of each shard.
+        """
+        self._check_fork()
+        shards = dict([(name, pool.get_stats())
+            for name, pool in self.pools.items()])
+        stats = {'shards': shards}
+        for s in shards.values():
+            for k, v in s.items():
+                if isinstance(v, bool) or not isinstance(v, (int, long, float)):
+                    continue
+                if k.endswith('_max'):
+                    stats[k] = max(stats.get(k, v), v)
+                else:
+                    stats[k] = stats.get(k, 0) + v
+        return stats
+
+    def closeall(self):
+        """Close all connections of all the shards."""
+        self._check_fork()
+        if self.closed: raise PoolError("connection pool is closed")
+        self.closed = True
+        for pool in self.pools.values():
+            pool.closeall()
+
+
+def _hash(s):
+    """Return the position of a string on a hash ring."""
+    return int(hashlib.md5(s).hexdigest()[:8], 16)
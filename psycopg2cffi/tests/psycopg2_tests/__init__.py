@@ -35,12 +35,16 @@ import test_copy
 import test_cursor
 import test_dates
 import test_extras_dictcursor
+import test_fetch
 import test_green
 import test_lobject
 import test_module
 import test_notify
 import test_psycopg2_dbapi20
+import test_pool
+import test_prepare
 import test_quote
+import test_server_binding
 import test_transaction
 import test_types_basic
 import test_types_extras
@@ -67,12 +71,16 @@ def test_suite():
     suite.addTest(test_cursor.test_suite())
     suite.addTest(test_dates.test_suite())
     suite.addTest(test_extras_dictcursor.test_suite())
+    suite.addTest(test_fetch.test_suite())
     suite.addTest(test_green.test_suite())
     suite.addTest(test_lobject.test_suite())
     suite.addTest(test_module.test_suite())
     suite.addTest(test_notify.test_suite())
     suite.addTest(test_psycopg2_dbapi20.test_suite())
+    suite.addTest(test_pool.test_suite())
+    suite.addTest(test_prepare.test_suite())
     suite.addTest(test_quote.test_suite())
+    suite.addTest(test_server_binding.test_suite())
     suite.addTest(test_transaction.test_suite())
     suite.addTest(test_types_basic.test_suite())
     suite.addTest(test_types_extras.test_suite())
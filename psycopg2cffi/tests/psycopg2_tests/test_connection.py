@@ -77,6 +77,62 @@ class ConnectionTests(unittest.TestCase):
         # now the isolation level should be equal to saved one
         self.assertEqual(conn.isolation_level, level)
 
+    def test_reset_untracked(self):
+        conn = self.conn
+        cur = conn.cursor()
+        cur.execute("-- comment\nset search_path to x")
+        self.assertEqual(conn._session_state, 0)
+        conn.commit()
+        conn.reset()
+        cur.execute("show search_path")
+        self.assertNotEqual(cur.fetchone()[0], 'x')
+
+    def test_reset_session_clean(self):
+        conn = self.conn
+        cur = conn.cursor()
+        cur.execute("select 1")
+        self.assertEqual(conn.get_transaction_status(),
+            psycopg2.extensions.TRANSACTION_STATUS_INTRANS)
+        conn._reset_session()
+        self.assertEqual(conn.get_transaction_status(),
+            psycopg2.extensions.TRANSACTION_STATUS_IDLE)
+        self.assertEqual(conn._session_state, 0)
+
+    def test_reset_session_guc(self):
+        conn = self.conn
+        cur = conn.cursor()
+        cur.execute("update pg_class set relname = relname where false")
+        self.assertEqual(conn._session_state, 0)
+        cur.execute("set search_path to x")
+        self.assertEqual(conn._session_state, 1)
+        conn.commit()
+        conn._reset_session()
+        self.assertEqual(conn._session_state, 0)
+        cur.execute("show search_path")
+        self.assertNotEqual(cur.fetchone()[0], 'x')
+        conn.rollback()
+        self.assertEqual(conn.get_parameter_status('DateStyle')[:3], 'ISO')
+
+    def test_reset_session_dirty(self):
+        conn = self.conn
+        cur = conn.cursor()
+        cur.execute("select 1; create temporary table reset_dirty (x int)")
+        self.assertEqual(conn._session_state, 2)
+        conn.commit()
+        cur.execute("select 1")
+        conn._reset_session()
+        cur.execute("""select count(*) from pg_class
+            where relname = 'reset_dirty'""")
+        self.assertEqual(cur.fetchone()[0], 0)
+
+    def test_reset_session_set_session(self):
+        conn = self.conn
+        conn.set_session(readonly=True)
+        conn._reset_session()
+        cur = conn.cursor()
+        cur.execute("show default_transaction_read_only")
+        self.assertEqual(cur.fetchone()[0], 'off')
+
     def test_notices(self):
         conn = self.conn
         cur = conn.cursor()
@@ -95,6 +151,106 @@ class ConnectionTests(unittest.TestCase):
         self.assert_('table3' in conn.notices[2])
         self.assert_('table4' in conn.notices[3])
 
+    def raise_notices(self, conn, n):
+        cur = conn.cursor()
+        cur.execute("""do $$begin
+            for i in 1..%d loop
+                raise notice 'hello %%', i using hint = 'hint';
+            end loop;
+            end$$""" % n)
+
+    def test_notices_raised(self):
+        conn = self.conn
+        self.raise_notices(conn, 60)
+        self.assertEqual(len(conn.notices), 50)
+        self.assert_('hello 11' in conn.notices[0], conn.notices[0])
+        self.assert_('hello 60' in conn.notices[-1], conn.notices[-1])
+
+    def test_notices_deque(self):
+        from collections import deque
+        conn = self.conn
+        conn.notices = deque(maxlen=3)
+        self.raise_notices(conn, 5)
+        self.assertEqual(len(conn.notices), 3)
+        self.assert_('hello 5' in conn.notices[-1])
+
+    def test_notice_hook(self):
+        conn = self.conn
+        diags = []
+        conn.notice_hook = diags.append
+        self.raise_notices(conn, 2)
+        self.assertEqual(len(diags), 2)
+        self.assertEqual(diags[1]['severity'], 'NOTICE')
+        self.assertEqual(diags[1]['sqlstate'], '00000')
+        self.assertEqual(diags[1]['message_primary'], 'hello 2')
+        self.assertEqual(diags[1]['message_hint'], 'hint')
+        self.assertEqual(diags[1]['message_detail'], None)
+        self.assertEqual(diags[1]['message'], conn.notices[-1])
+
+    def test_startup_dsn(self):
+        from psycopg2cffi._impl.connection import _startup_dsn
+        self.assertEqual(_startup_dsn('dbname=x'),
+            "dbname=x options='-c datestyle=ISO'")
+        self.assertEqual(_startup_dsn('postgresql://h/x?port=5'),
+            'postgresql://h/x?port=5&options=-c%20datestyle%3DISO')
+        self.assertEqual(_startup_dsn("dbname=x options='-c geqo=off'"),
+            None)
+        self.assertEqual(_startup_dsn("dbname=options password=options"),
+            "dbname=options password=options options='-c datestyle=ISO'")
+        self.assertEqual(_startup_dsn("service=x dbname=x"), None)
+        self.assertEqual(_startup_dsn("dbname='x"), None)
+
+    def test_startup_refused(self):
+        from psycopg2cffi._impl import connection as _connection
+        attempts = []
+        def _startup_refused(conn):
+            attempts.append(conn.dsn)
+            return True
+        mydsn = dsn + " connect_timeout=30"
+        orig = _connection.Connection._startup_refused
+        _connection.Connection._startup_refused = _startup_refused
+        try:
+            conn = psycopg2.connect(mydsn)
+            conn.close()
+            self.assertEqual(attempts, [mydsn])
+            self.assertEqual(_connection._startup_dsn(mydsn), None)
+
+            # The options are not tried again
+            conn = psycopg2.connect(mydsn)
+            self.assertEqual(attempts, [mydsn])
+            self.assertEqual(
+                conn.get_parameter_status('DateStyle')[:3], 'ISO')
+            conn.close()
+        finally:
+            _connection.Connection._startup_refused = orig
+            _connection._startup_refused_dsns.discard(mydsn)
+
+    def test_startup_datestyle(self):
+        conn = self.conn
+        self.assertEqual(conn.get_parameter_status('DateStyle')[:3], 'ISO')
+        cur = conn.cursor()
+        cur.execute("select setting from pg_settings "
+            "where name = 'DateStyle' and source = 'client'")
+        self.assert_(cur.fetchone())
+
+    def test_user_options(self):
+        conn = psycopg2.connect(dsn + " options='-c geqo=off'")
+        cur = conn.cursor()
+        cur.execute("show geqo")
+        self.assertEqual(cur.fetchone()[0], 'off')
+        self.assertEqual(conn.get_parameter_status('DateStyle')[:3], 'ISO')
+        conn.close()
+
+    def test_notices_connection_collected(self):
+        import gc
+        import weakref
+        conn = psycopg2.connect(dsn)
+        self.raise_notices(conn, 1)
+        ref = weakref.ref(conn)
+        del conn
+        gc.collect()
+        self.assert_(ref() is None)
+
     def test_notices_limited(self):
         conn = self.conn
         cur = conn.cursor()
@@ -364,6 +520,108 @@ class IsolationLevelsTestCase(unittest.TestCase):
             cnn.set_isolation_level, 1)
 
 
+    def count_commands(self, conn):
+        cmds = []
+        execute = conn._execute_command
+        def _execute_command(command):
+            cmds.append(command)
+            return execute(command)
+        conn._execute_command = _execute_command
+        return cmds
+
+    def test_set_session_batched(self):
+        conn = self.connect()
+        cmds = self.count_commands(conn)
+        conn.set_session('serializable', readonly=True, deferrable=True)
+        self.assertEqual(len(cmds), 1)
+        cur = conn.cursor()
+        cur.execute("show default_transaction_isolation")
+        self.assertEqual(cur.fetchone()[0], 'serializable')
+        cur.execute("show default_transaction_read_only")
+        self.assertEqual(cur.fetchone()[0], 'on')
+        cur.execute("show default_transaction_deferrable")
+        self.assertEqual(cur.fetchone()[0], 'on')
+        conn.rollback()
+
+        del cmds[:]
+        conn.set_session(readonly=False)
+        self.assertEqual(len(cmds), 1)
+
+    @skip_before_postgres(9, 0)
+    def test_set_session_not_cached(self):
+        conn = self.connect()
+        conn.set_session('serializable')
+        cur = conn.cursor()
+        cur.execute("do $$begin execute "
+            "'set default_transaction_isolation to ''read committed'''; "
+            "end$$")
+        conn.commit()
+
+        # The change is not seen by the cache, but the setting is sent
+        conn.set_session('serializable')
+        cur.execute("show default_transaction_isolation")
+        self.assertEqual(cur.fetchone()[0], 'serializable')
+        conn.rollback()
+
+        cur.execute("/* comment */ set default_transaction_isolation "
+            "to 'read committed'")
+        conn.commit()
+        conn.set_isolation_level(
+            psycopg2.extensions.ISOLATION_LEVEL_SERIALIZABLE)
+        cur.execute("show default_transaction_isolation")
+        self.assertEqual(cur.fetchone()[0], 'serializable')
+        conn.rollback()
+
+    def test_isolation_level_cached(self):
+        conn = self.connect()
+        conn.set_isolation_level(
+            psycopg2.extensions.ISOLATION_LEVEL_SERIALIZABLE)
+        cmds = []
+        get_guc = conn._get_guc
+        conn._get_guc = lambda name: cmds.append(name) or get_guc(name)
+        self.assertEqual(conn.isolation_level,
+            psycopg2.extensions.ISOLATION_LEVEL_SERIALIZABLE)
+        self.assertEqual(cmds, [])
+
+        cur = conn.cursor()
+        cur.execute("set default_transaction_isolation to 'read committed'")
+        conn.commit()
+        self.assertEqual(conn.isolation_level,
+            psycopg2.extensions.ISOLATION_LEVEL_READ_COMMITTED)
+        self.assertEqual(cmds, ['default_transaction_isolation'])
+        self.assertEqual(conn.isolation_level,
+            psycopg2.extensions.ISOLATION_LEVEL_READ_COMMITTED)
+        self.assertEqual(len(cmds), 1)
+
+    def test_isolation_level_set_in_transaction(self):
+        conn = self.connect()
+        cur = conn.cursor()
+        for query, end in [
+                ("set local default_transaction_isolation = 'serializable'",
+                    conn.commit),
+                ("set default_transaction_isolation = 'serializable'",
+                    conn.rollback)]:
+            cur.execute(query)
+            self.assertEqual(conn.isolation_level,
+                psycopg2.extensions.ISOLATION_LEVEL_SERIALIZABLE)
+            end()
+            self.assertEqual(conn.isolation_level,
+                psycopg2.extensions.ISOLATION_LEVEL_READ_COMMITTED)
+
+            conn.set_session('serializable')
+            cur.execute("show default_transaction_isolation")
+            self.assertEqual(cur.fetchone()[0], 'serializable')
+            conn.rollback()
+            conn.set_session('read committed')
+
+    def test_isolation_level_after_reset(self):
+        conn = self.connect()
+        conn.set_session('serializable')
+        conn.reset()
+        self.assertEqual(conn.isolation_level,
+            psycopg2.extensions.ISOLATION_LEVEL_READ_COMMITTED)
+
+
 class ConnectionTwoPhaseTests(unittest.TestCase):
     def setUp(self):
         self._conns = []
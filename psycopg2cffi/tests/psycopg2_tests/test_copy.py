@@ -285,6 +285,147 @@ class CopyTests(unittest.TestCase):
         curs.execute("select count(*) from manycols;")
         self.assertEqual(curs.fetchone()[0], 2)
 
+    def test_copy_records(self):
+        import datetime
+        from decimal import Decimal
+        self.conn.set_client_encoding('UTF8')
+        curs = self.conn.cursor()
+        curs.execute("""create temp table trecords (
+            i int, t text, b bytea, d date, ts timestamp, n numeric,
+            f float8, bo bool)""")
+        records = [
+            (1, "tab\there\nnewline\\back\rcr", psycopg2.Binary('\x00\t\\'),
+                datetime.date(2012, 1, 2), datetime.datetime(2012, 1, 2, 3, 4),
+                Decimal('1.50'), 0.5, True),
+            (None, None, None, None, None, None, None, None),
+            (3, u"\xe8", psycopg2.Binary(''), datetime.date(1, 1, 1),
+                datetime.datetime(2000, 1, 1, 0, 0, 0, 1), Decimal('-1e10'),
+                float('inf'), False),
+        ]
+        curs.copy_records("trecords", iter(records), size=10)
+        self.assertEqual(curs.rowcount, 3)
+
+        curs.execute("select * from trecords order by i")
+        rows = curs.fetchall()
+        self.assertEqual(rows[0][:2], records[0][:2])
+        self.assertEqual(str(rows[0][2]), '\x00\t\\')
+        self.assertEqual(rows[0][3:], records[0][3:])
+        self.assertEqual(rows[1][:2], (3, "\xc3\xa8"))
+        self.assertEqual(str(rows[1][2]), '')
+        self.assertEqual(rows[1][3:], records[2][3:])
+        self.assertEqual(rows[2], records[1])
+
+    def test_copy_records_columns(self):
+        curs = self.conn.cursor()
+        curs.copy_records("tcopy", [(1,), (2,)], columns=['id'])
+        curs.execute("select id, data from tcopy order by id")
+        self.assertEqual(curs.fetchall(), [(1, None), (2, None)])
+
+    def test_copy_records_errors(self):
+        self.conn.commit()
+        curs = self.conn.cursor()
+        self.assertRaises(psycopg2.ProgrammingError,
+            curs.copy_records, "tcopy", [(1, [1, 2])])
+        self.conn.rollback()
+
+        def records():
+            yield (1, 'a')
+            raise ZeroDivisionError
+        self.assertRaises(ZeroDivisionError,
+            curs.copy_records, "tcopy", records())
+        self.conn.rollback()
+
+        self.assertRaises(psycopg2.DataError,
+            curs.copy_records, "tcopy", [('a', 'b')])
+        self.conn.rollback()
+
+        curs.execute("select count(*) from tcopy")
+        self.assertEqual(curs.fetchone(), (0,))
+
+    def test_copy_to_error(self):
+        curs = self.conn.cursor()
+        self.assertRaises(psycopg2.DataError, curs.copy_expert,
+            "copy (select 1 / (x - 500) from generate_series(1, 1000) x) "
+            "to stdout", StringIO())
+
+    def test_copy_to_rowcount(self):
+        curs = self.conn.cursor()
+        curs.copy_expert("copy (select generate_series(1, 7)) to stdout",
+            StringIO())
+        self.assertEqual(curs.rowcount, 7)
+
+    def test_copy_to_iter(self):
+        curs = self.conn.cursor()
+        chunks = list(curs.copy_to_iter(
+            "copy (select x, repeat('x', x) from generate_series(1, 1000) x)"
+            " to stdout", size=10000))
+        self.assert_(len(chunks) > 1)
+        for chunk in chunks[:-1]:
+            self.assert_(len(chunk) >= 10000)
+            self.assert_(chunk.endswith('\n'))
+
+        f = StringIO()
+        curs.copy_expert(
+            "copy (select x, repeat('x', x) from generate_series(1, 1000) x)"
+            " to stdout", f)
+        self.assertEqual(''.join(chunks), f.getvalue())
+        self.assertEqual(curs.rowcount, 1000)
+
+    def test_copy_to_iter_nowait(self):
+        import select
+        curs = self.conn.cursor()
+        chunks = []
+        for chunk in curs.copy_to_iter(
+                "copy (select generate_series(1, 100000)) to stdout",
+                size=65536, wait=False):
+            if chunk:
+                chunks.append(chunk)
+            else:
+                select.select([self.conn.fileno()], [], [])
+        data = ''.join(chunks)
+        self.assertEqual(data,
+            ''.join(['%d\n' % i for i in range(1, 100001)]))
+        self.assertEqual(curs.rowcount, 100000)
+
+    def test_copy_to_iter_discard(self):
+        curs = self.conn.cursor()
+        it = curs.copy_to_iter(
+            "copy (select generate_series(1, 100000)) to stdout")
+        self.assert_(it.next())
+        del it
+        curs.execute("select 42")
+        self.assertEqual(curs.fetchone(), (42,))
+
+    def test_copy_to_iter_discard_unstarted(self):
+        curs = self.conn.cursor()
+        curs.copy_to_iter("copy (select generate_series(1, 100000)) to stdout")
+        curs.execute("select 42")
+        self.assertEqual(curs.fetchone(), (42,))
+
+    def test_copy_to_iter_close(self):
+        curs = self.conn.cursor()
+        it = curs.copy_to_iter(
+            "copy (select generate_series(1, 100000)) to stdout")
+        it.close()
+        self.assertEqual(list(it), [])
+        curs.execute("select 42")
+        self.assertEqual(curs.fetchone(), (42,))
+
+    def test_copy_to_iter_query_while_iterating(self):
+        curs = self.conn.cursor()
+        it = curs.copy_to_iter(
+            "copy (select generate_series(1, 100000)) to stdout")
+        self.assert_(it.next())
+        curs2 = self.conn.cursor()
+        curs2.execute("select 42")
+        self.assertEqual(curs2.fetchone(), (42,))
+        self.assertEqual(list(it), [])
+
+    def test_copy_to_iter_not_copy(self):
+        curs = self.conn.cursor()
+        self.assertRaises(psycopg2.ProgrammingError,
+            curs.copy_to_iter, "select 1")
+
 
 decorate_all_tests(CopyTests, skip_if_green)
 
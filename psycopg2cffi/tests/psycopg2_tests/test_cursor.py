@@ -55,6 +55,59 @@ class CursorTests(unittest.TestCase):
             cur.executemany, "insert into test_exc values (%s)", buggygen())
         cur.close()
 
+    def test_executemany_pages(self):
+        cur = self.conn.cursor()
+        cur.execute("create temp table test_pages (data int)")
+        for pagesize in (1, 3, 100):
+            cur.pagesize = pagesize
+            cur.executemany("insert into test_pages values (%s)",
+                [(i,) for i in range(10)])
+            self.assertEqual(cur.rowcount, 10)
+            cur.executemany("update test_pages set data = data "
+                "where data = %(x)s or data = %(x)s + 1 -- comment",
+                [{'x': 0}, {'x': 2}, {'x': 20}])
+            self.assertEqual(cur.rowcount, 4)
+            cur.execute("delete from test_pages")
+        cur.executemany(u"insert into test_pages values (%s)", [])
+        self.assertEqual(cur.rowcount, 0)
+
+    def test_executemany_pages_error(self):
+        cur = self.conn.cursor()
+        cur.pagesize = 3
+        cur.execute("create temp table test_pages (data int primary key)")
+        self.conn.commit()
+        self.assertRaises(psycopg2.IntegrityError, cur.executemany,
+            "insert into test_pages values (%s)", [(1,), (2,), (1,), (3,)])
+        self.assertEqual(self.conn.get_transaction_status(),
+            psycopg2.extensions.TRANSACTION_STATUS_INERROR)
+        self.conn.rollback()
+        cur.executemany("insert into test_pages values (%s)",
+            [(1,), (2,), (3,), (4,)])
+        self.assertEqual(cur.rowcount, 4)
+        self.assert_(cur.query.startswith("insert into test_pages values (4)"))
+
+    def test_executemany_autocommit_error(self):
+        cur = self.conn.cursor()
+        self.assertEqual(cur.pagesize, 1)
+        cur.execute("create temp table test_pages (data int primary key)")
+        self.conn.commit()
+        self.conn.autocommit = True
+        self.assertRaises(psycopg2.IntegrityError, cur.executemany,
+            "insert into test_pages values (%s)", [(1,), (2,), (1,), (3,)])
+        cur.execute("select data from test_pages order by data")
+        self.assertEqual(cur.fetchall(), [(1,), (2,)])
+
+    def test_mogrify_repeated(self):
+        cur = self.conn.cursor()
+        for i in range(3):
+            self.assertEqual(cur.mogrify("select %s, '%%'", (i,)),
+                "select %d, '%%'" % i)
+            self.assertEqual(
+                cur.mogrify("select %(a)s, %(b)s, %(a)s", {'a': i, 'b': 'x'}),
+                "select %d, 'x', %d" % (i, i))
+            self.assertRaises(TypeError, cur.mogrify, "select %s", (i, i))
+            self.assertRaises(ValueError, cur.mogrify, "select %s %(a)s", (i,))
+
     def test_mogrify_unicode(self):
         conn = self.conn
         cur = conn.cursor()
@@ -337,6 +390,97 @@ class CursorTests(unittest.TestCase):
         self.assertRaises((IndexError, psycopg2.ProgrammingError),
             cur.scroll, 10, mode='absolute')
 
+    @skip_before_postgres(8, 0)
+    def test_scroll_named_cursor(self):
+        cur = self.conn.cursor('tmp')
+        cur.execute("select x from generate_series(0,9) x")
+        cur.scroll(2)
+        self.assertEqual(cur.fetchone(), (2,))
+        cur.scroll(2)
+        self.assertEqual(cur.fetchone(), (5,))
+        cur.scroll(-2)
+        self.assertEqual(cur.fetchone(), (4,))
+        cur.scroll(8, mode='absolute')
+        self.assertEqual(cur.fetchmany(2), [(8,), (9,)])
+        self.assertEqual(cur.fetchone(), None)
+
+    @skip_before_postgres(8, 0)
+    def test_named_cursor_prefetch(self):
+        curs = self.conn.cursor('tmp')
+        curs.prefetch = True
+        curs.itersize = 4
+        curs.execute('select generate_series(1,10)')
+        self.assertEqual(curs.fetchone(), (1,))
+        self.assertEqual(curs.fetchmany(2), [(2,), (3,)])
+        self.assertEqual(curs.fetchmany(3), [(4,), (5,), (6,)])
+        self.assertEqual(curs.fetchmany(0), [])
+        self.assertEqual(curs.fetchall(), [(7,), (8,), (9,), (10,)])
+        self.assertEqual(curs.fetchone(), None)
+        self.assertEqual(curs.fetchmany(2), [])
+
+    @skip_before_postgres(8, 0)
+    def test_named_cursor_prefetch_roundtrips(self):
+        curs = self.conn.cursor('tmp')
+        curs.prefetch = True
+        curs.itersize = 3
+        curs.execute("select clock_timestamp() from generate_series(1,4)")
+        t1 = curs.fetchone()[0]
+        time.sleep(0.2)
+        t2 = curs.fetchone()[0]
+        t3 = curs.fetchone()[0]
+        time.sleep(0.2)
+        t4 = curs.fetchone()[0]
+        self.assert_((t3 - t1).microseconds * 1e-6 < 0.1)
+        # the next batch was fetched in advance too
+        self.assert_((t4 - t3).microseconds * 1e-6 < 0.1)
+
+    @skip_before_postgres(8, 0)
+    def test_named_cursor_fetch_ahead(self):
+        curs = self.conn.cursor('tmp')
+        curs.prefetch = True
+        curs.itersize = 2
+        curs.execute("select x from generate_series(1, 7) x")
+        rows = []
+        for row in curs:
+            rows.append(row[0])
+            if row[0] == 3:
+                # the connection can be used while a FETCH is in flight
+                other = self.conn.cursor()
+                other.execute("select 42")
+                self.assertEqual(other.fetchone(), (42,))
+        self.assertEqual(rows, range(1, 8))
+
+    @skip_before_postgres(8, 0)
+    def test_named_cursor_fetch_ahead_scroll(self):
+        curs = self.conn.cursor('tmp')
+        curs.prefetch = True
+        curs.itersize = 3
+        curs.execute("select x from generate_series(0, 9) x")
+        self.assertEqual(curs.fetchone(), (0,))
+        curs.scroll(4)
+        self.assertEqual(curs.fetchmany(2), [(5,), (6,)])
+        curs.scroll(-6)
+        self.assertEqual(curs.fetchall(), [(i,) for i in range(1, 10)])
+        curs.close()
+
+    @skip_before_postgres(8, 0)
+    def test_named_cursor_prefetch_scroll(self):
+        curs = self.conn.cursor('tmp')
+        curs.prefetch = True
+        curs.itersize = 4
+        curs.execute('select x from generate_series(0,9) x')
+        self.assertEqual(curs.fetchone(), (0,))
+        curs.scroll(2)
+        self.assertEqual(curs.fetchone(), (3,))
+        curs.scroll(-3)
+        self.assertEqual(curs.fetchone(), (1,))
+        curs.scroll(5)
+        self.assertEqual(curs.fetchone(), (7,))
+        curs.scroll(-7)
+        self.assertEqual(curs.fetchmany(2), [(1,), (2,)])
+        curs.scroll(9, mode='absolute')
+        self.assertEqual(curs.fetchall(), [(9,)])
+
 
 def test_suite():
     return unittest.TestLoader().loadTestsFromName(__name__)
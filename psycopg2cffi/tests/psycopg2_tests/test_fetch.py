@@ -0,0 +1,511 @@
+#!/usr/bin/env python
+
+# test_fetch.py - unit test for the rows materialization
+#
+# psycopg2 is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Lesser General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# psycopg2 is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Lesser General Public
+# License for more details.
+
+import datetime
+from decimal import Decimal
+
+import psycopg2
+import psycopg2.extensions
+import psycopg2.extras
+from testconfig import dsn
+from testutils import unittest, decorate_all_tests
+from testutils import skip_if_no_numpy, skip_if_no_stream
+from testutils import skip_before_postgres
+
+
+class FetchTests(unittest.TestCase):
+
+    def setUp(self):
+        self.conn = psycopg2.connect(dsn)
+
+    def tearDown(self):
+        self.conn.close()
+
+    def test_nulls_builtin_casts(self):
+        cur = self.conn.cursor()
+        cur.execute("""
+            select x, x::float8 / 2, x::numeric, x::int8, x::text
+            from (values (1), (null), (3)) as t (x)""")
+        self.assertEqual(cur.fetchall(), [
+            (1, 0.5, Decimal('1'), 1L, '1'),
+            (None, None, None, None, None),
+            (3, 1.5, Decimal('3'), 3L, '3')])
+
+    def test_nulls_and_empty_strings(self):
+        cur = self.conn.cursor()
+        cur.execute("select * from (values ('a'), (''), (null), ('')) as t")
+        self.assertEqual(cur.fetchall(), [('a',), ('',), (None,), ('',)])
+
+    def test_nulls_and_empty_strings_py_caster(self):
+        cur = self.conn.cursor()
+        seen = []
+        def cast(value, cur):
+            seen.append(value)
+            return value.upper()
+        t = psycopg2.extensions.new_type((25,), "UPPER", cast)
+        psycopg2.extensions.register_type(t, cur)
+        cur.execute(
+            "select * from (values ('a'::text), (''), (null), ('b')) as t")
+        self.assertEqual(cur.fetchall(), [('A',), ('',), (None,), ('B',)])
+        self.assertEqual(seen, ['a', '', 'b'])
+
+    def test_nulls_generic_caster(self):
+        cur = self.conn.cursor()
+        cur.execute("select * from (values (true), (null), (false)) as t")
+        self.assertEqual(cur.fetchall(), [(True,), (None,), (False,)])
+
+    def test_no_columns(self):
+        cur = self.conn.cursor()
+        cur.execute("select from generate_series(1, 3)")
+        self.assertEqual(cur.fetchone(), ())
+        self.assertEqual(cur.fetchmany(5), [(), ()])
+        cur.execute("select from generate_series(1, 3)")
+        self.assertEqual(cur.fetchall(), [(), (), ()])
+
+    def test_fetchmany_past_end(self):
+        cur = self.conn.cursor()
+        cur.execute("select generate_series(1, 5)")
+        self.assertEqual(cur.fetchmany(2), [(1,), (2,)])
+        self.assertEqual(cur.fetchmany(10), [(3,), (4,), (5,)])
+        self.assertEqual(cur.rownumber, 5)
+        self.assertEqual(cur.fetchmany(10), [])
+        self.assertEqual(cur.fetchone(), None)
+
+    def test_dict_cursor(self):
+        cur = self.conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
+        cur.execute("select 1 as a, null::text as b union all select 2, ''")
+        rows = cur.fetchall()
+        self.assertEqual(rows[0]['a'], 1)
+        self.assertEqual(rows[0]['b'], None)
+        self.assertEqual(rows[1]['a'], 2)
+        self.assertEqual(rows[1]['b'], '')
+
+    def test_real_dict_cursor(self):
+        cur = self.conn.cursor(
+            cursor_factory=psycopg2.extras.RealDictCursor)
+        cur.execute("select 1 as a, 'x' as b union all select 2, 'y'")
+        self.assertEqual(cur.fetchmany(2),
+            [{'a': 1, 'b': 'x'}, {'a': 2, 'b': 'y'}])
+
+    def test_namedtuple_cursor(self):
+        cur = self.conn.cursor(
+            cursor_factory=psycopg2.extras.NamedTupleCursor)
+        cur.execute("select 1 as a, 'x' as b union all select 2, 'y'")
+        rows = cur.fetchall()
+        self.assertEqual([(r.a, r.b) for r in rows], [(1, 'x'), (2, 'y')])
+
+    def test_named_cursor(self):
+        cur = self.conn.cursor('test_fetch')
+        cur.execute("""
+            select x, case when x % 2 = 0 then null else x::text end
+            from generate_series(1, 7) x""")
+        self.assertEqual(cur.fetchone(), (1, '1'))
+        self.assertEqual(cur.fetchmany(2), [(2, None), (3, '3')])
+        self.assertEqual(cur.fetchall(),
+            [(4, None), (5, '5'), (6, None), (7, '7')])
+        self.assertEqual(cur.fetchall(), [])
+
+
+class StreamFetchTests(unittest.TestCase):
+
+    def setUp(self):
+        self.conn = psycopg2.connect(dsn)
+        self.curs = self.conn.cursor()
+        self.curs.stream = True
+
+    def tearDown(self):
+        self.conn.close()
+
+    def test_fetch(self):
+        cur = self.curs
+        cur.execute("select x, x::text from generate_series(1, 6) x")
+        self.assertEqual(cur.description[1].name, 'x')
+        self.assertEqual(cur.rowcount, -1)
+        self.assertEqual(cur.fetchone(), (1, '1'))
+        self.assertEqual(cur.fetchmany(2), [(2, '2'), (3, '3')])
+        self.assertEqual(cur.rownumber, 3)
+        self.assertEqual(cur.rowcount, -1)
+        self.assertEqual(cur.fetchall(), [(4, '4'), (5, '5'), (6, '6')])
+        self.assertEqual(cur.rowcount, 6)
+        self.assertEqual(cur.statusmessage, 'SELECT 6')
+        self.assertEqual(cur.fetchone(), None)
+        self.assertEqual(cur.fetchall(), [])
+
+    def test_iter(self):
+        cur = self.curs
+        cur.itersize = 3
+        cur.execute("select generate_series(1, 10)")
+        self.assertEqual([r[0] for r in cur], range(1, 11))
+        self.assertEqual(cur.rowcount, 10)
+
+    def test_no_rows(self):
+        cur = self.curs
+        cur.execute("select 1 where false")
+        self.assertEqual(cur.fetchall(), [])
+        self.assertEqual(cur.rowcount, 0)
+        cur.execute("create temp table stream (id int)")
+        self.assertEqual(cur.statusmessage, 'CREATE TABLE')
+        self.assertRaises(psycopg2.ProgrammingError, cur.fetchone)
+
+    def test_error(self):
+        cur = self.curs
+        self.assertRaises(psycopg2.ProgrammingError,
+            cur.execute, "select nosuchcolumn")
+        self.conn.rollback()
+        cur.execute("select 1 / (3 - x) from generate_series(1, 5) x")
+        self.assertEqual(cur.fetchmany(2), [(0,), (1,)])
+        self.assertRaises(psycopg2.DataError, cur.fetchone)
+
+    def test_other_command(self):
+        cur = self.curs
+        cur.execute("select generate_series(1, 1000)")
+        self.assertEqual(cur.fetchone(), (1,))
+        cur2 = self.conn.cursor()
+        cur2.execute("select 42")
+        self.assertEqual(cur2.fetchone(), (42,))
+        self.assertEqual(cur.fetchall(), [])
+        self.conn.commit()
+
+        cur.execute("select generate_series(1, 1000)")
+        self.assertEqual(cur.fetchone(), (1,))
+        self.conn.commit()
+        cur.execute("select 2")
+        self.assertEqual(cur.fetchall(), [(2,)])
+
+    def test_close(self):
+        cur = self.curs
+        cur.execute("select generate_series(1, 1000)")
+        self.assertEqual(cur.fetchone(), (1,))
+        cur.close()
+        self.assertEqual(self.conn.get_transaction_status(),
+            psycopg2.extensions.TRANSACTION_STATUS_INTRANS)
+
+    def test_binary(self):
+        cur = self.curs
+        cur.execute("select generate_series(1, 3), 'a'::text", binary=True)
+        self.assert_(cur._binary_result)
+        self.assertEqual(cur.fetchall(), [(1, 'a'), (2, 'a'), (3, 'a')])
+
+    def test_scroll(self):
+        cur = self.curs
+        cur.execute("select generate_series(1, 3)")
+        self.assertRaises(psycopg2.ProgrammingError, cur.scroll, 1)
+
+decorate_all_tests(StreamFetchTests, skip_if_no_stream)
+
+
+class BinaryFetchTests(unittest.TestCase):
+
+    def setUp(self):
+        self.conn = psycopg2.connect(dsn)
+
+    def tearDown(self):
+        self.conn.close()
+
+    def assertSameAsText(self, query):
+        cur = self.conn.cursor()
+        cur.execute(query)
+        text = cur.fetchall()
+        cur.execute(query, binary=True)
+        self.assert_(cur._binary_result)
+        self.assertEqual(cur.fetchall(), text)
+        return text
+
+    def test_numbers(self):
+        self.assertSameAsText("""
+            select x::int2, x::int4, x::int8, x::oid, x::float4 / 2,
+                x::float8 / 3
+            from (values (1), (null), (-32768), (32767)) as t (x)
+            where x is null or x >= 0""")
+
+    def test_numeric(self):
+        rows = self.assertSameAsText("""
+            select x::numeric from (values ('0'), ('1.5000'), ('-12345.678'),
+                ('0.00001234'), ('100000000'), ('123456789012345678901234.5'),
+                ('-0.1'), (null)) as t (x)""")
+        self.assertEqual(str(rows[1][0]), '1.5000')
+        self.assertEqual(str(rows[3][0]), '0.00001234')
+
+        cur = self.conn.cursor()
+        cur.execute("select 'NaN'::numeric", binary=True)
+        self.assert_(cur.fetchone()[0].is_nan())
+
+    @skip_before_postgres(14)
+    def test_numeric_infinity(self):
+        self.assertSameAsText(
+            "select 'Infinity'::numeric, '-Infinity'::numeric")
+
+    def test_strings(self):
+        self.assertSameAsText("""
+            select x, x::varchar, x::bpchar, x::name
+            from (values ('hello'), (''), (null)) as t (x)""")
+
+    def test_bool(self):
+        self.assertSameAsText(
+            "select * from (values (true), (false), (null)) as t")
+
+    def test_bytea(self):
+        cur = self.conn.cursor()
+        cur.execute("select decode('00ff0a', 'hex'), ''::bytea",
+            binary=True)
+        row = cur.fetchone()
+        self.assertEqual(str(row[0]), '\x00\xff\x0a')
+        self.assertEqual(str(row[1]), '')
+
+    def test_dates(self):
+        self.assertSameAsText("""
+            select '2012-03-04'::date, '1970-01-01 12:34:56.789'::timestamp,
+                '1999-12-31 23:59:59'::timestamp, '13:14:15.5'::time,
+                '1 year 2 mons 3 days 04:05:06.5'::interval""")
+
+    def test_timestamptz(self):
+        cur = self.conn.cursor()
+        cur.execute("set timezone to 'UTC'")
+        self.assertSameAsText(
+            "select '2012-03-04 05:06:07.5+00'::timestamptz")
+
+    def test_uuid(self):
+        self.assertSameAsText(
+            "select 'a0eebc99-9c0b-4ef8-bb6d-6bb9bd380a11'::uuid")
+
+    def test_arrays(self):
+        self.assertSameAsText("""
+            select '{1,2,3}'::int4[], '{{1,2},{3,4}}'::int8[],
+                '{a,"b c",NULL}'::text[], '{1.5}'::numeric[],
+                '{2012-01-01}'::date[]""")
+
+        cur = self.conn.cursor()
+        cur.execute("select '{}'::int4[], '{1,NULL}'::int4[]", binary=True)
+        self.assertEqual(cur.fetchone(), ([], [1, None]))
+
+    def test_unknown_type(self):
+        # Returned as in text mode, converted by the server
+        cur = self.conn.cursor()
+        query = """select '(1,2)'::point as p, x::inet as i
+            from (values ('10.0.0.1'), (null), ('::1')) as v (x)"""
+        cur.execute(query)
+        expected = cur.fetchall()
+        cur.execute(query, binary=True)
+        self.assertEqual(cur.fetchone(), expected[0])
+        self.assertEqual(cur.fetchall(), expected[1:])
+        self.assertEqual(expected[0], ('(1,2)', '10.0.0.1'))
+        self.assertEqual(expected[1], ('(1,2)', None))
+
+    def test_enum(self):
+        cur = self.conn.cursor()
+        cur.execute("create type test_mood as enum ('sad', 'happy')")
+        cur.execute("""select x::test_mood, array[x::test_mood] from
+            (values ('happy'), ('sad')) as v (x)""", binary=True)
+        self.assertEqual(cur.fetchall(),
+            [('happy', '{happy}'), ('sad', '{sad}')])
+
+    def test_unknown_type_named_cursor(self):
+        cur = self.conn.cursor('test_unknown')
+        cur.itersize = 2
+        cur.execute("""select ('10.0.0.' || x)::inet
+            from generate_series(1, 5) as x""", binary=True)
+        self.assertEqual([r[0] for r in cur],
+            ['10.0.0.%d' % i for i in range(1, 6)])
+
+    @skip_if_no_stream
+    def test_unknown_type_stream(self):
+        cur = self.conn.cursor()
+        cur.stream = True
+        cur.execute("select '10.0.0.1'::inet", binary=True)
+        self.assertRaises(psycopg2.NotSupportedError, cur.fetchall)
+
+    def test_user_caster(self):
+        psycopg2.extensions.register_type(
+            psycopg2.extensions.UNICODE, self.conn)
+        import uuid
+        UUID = psycopg2.extensions.new_type((2950,), 'UUID',
+            lambda s, cur: s and uuid.UUID(s))
+        psycopg2.extensions.register_type(UUID, self.conn)
+        rows = self.assertSameAsText("""select 'hello'::text,
+            'a0eebc99-9c0b-4ef8-bb6d-6bb9bd380a11'::uuid""")
+        self.assertEqual(type(rows[0][0]), unicode)
+        self.assertEqual(rows[0][1],
+            uuid.UUID('a0eebc99-9c0b-4ef8-bb6d-6bb9bd380a11'))
+
+    @skip_before_postgres(9, 4)
+    def test_user_caster_jsonb(self):
+        import json
+        JSONB = psycopg2.extensions.new_type((3802,), 'JSONB',
+            lambda s, cur: s is not None and json.loads(s) or None)
+        psycopg2.extensions.register_type(JSONB, self.conn)
+        cur = self.conn.cursor()
+        cur.execute("""select '{"a": [1, 2]}'::jsonb""", binary=True)
+        self.assert_(cur._binary_result)
+        self.assertEqual(cur.fetchone(), ({'a': [1, 2]},))
+
+    def test_user_caster_text_fallback(self):
+        cur = self.conn.cursor()
+        POINT = psycopg2.extensions.new_type((600,), 'POINT',
+            lambda s, cur: s and tuple(map(float, s[1:-1].split(','))))
+        psycopg2.extensions.register_type(POINT, cur)
+        cur.execute("select '(1,2)'::point", binary=True)
+        self.assert_(not cur._binary_result)
+        self.assertEqual(cur.fetchone(), ((1.0, 2.0),))
+
+    def test_cursor_attribute(self):
+        cur = self.conn.cursor()
+        cur.binary = True
+        cur.execute("select 1")
+        self.assert_(cur._binary_result)
+        self.assertEqual(cur.fetchone(), (1,))
+        cur.execute("select 1", binary=False)
+        self.assert_(not cur._binary_result)
+
+    def test_named_cursor(self):
+        cur = self.conn.cursor('test_binary')
+        cur.execute("select generate_series(1, 5)", binary=True)
+        self.assertEqual(cur.fetchone(), (1,))
+        self.assert_(cur._binary_result)
+        self.assertEqual(cur.fetchmany(2), [(2,), (3,)])
+        self.assertEqual(cur.fetchall(), [(4,), (5,)])
+
+
+class NumpyFetchTests(unittest.TestCase):
+
+    def setUp(self):
+        self.conn = psycopg2.connect(dsn)
+
+    def tearDown(self):
+        self.conn.close()
+
+    def check_columns(self, binary):
+        import numpy
+        cur = self.conn.cursor()
+        cur.execute("set timezone to 'UTC'")
+        cur.execute("""
+            select x::int2 as i2, x::int4 as i4, x::int8 as i8,
+                x::float4 / 2::float4 as f4, x::float8 / 4 as f8, x % 2 = 0 as b,
+                '2012-01-01'::date + x as d,
+                '2012-01-01 00:00:01.5'::timestamp + x * '1 hour'::interval
+                    as ts,
+                '2012-01-01 00:00:00+00'::timestamptz + x * '1 day'::interval
+                    as tstz,
+                x::text as t
+            from (values (1), (null), (2)) as v (x)""", binary=binary)
+        self.assertEqual(cur.fetchone()[0], 1)
+
+        # Only the text column is converted by the typecasters
+        built = []
+        build_columns = cur._build_columns
+        def _build_columns(start, end, columns=None):
+            built.append(columns)
+            return build_columns(start, end, columns)
+        cur._build_columns = _build_columns
+
+        arrays = cur.fetchnumpy()
+        self.assertEqual(cur.rownumber, 3)
+        self.assertEqual(built, [[9]])
+
+        for name, dtype in [('i2', 'i2'), ('i4', 'i4'), ('i8', 'i8'),
+                ('f4', 'f4'), ('f8', 'f8'), ('b', '?'), ('d', 'M8[D]'),
+                ('ts', 'M8[us]'), ('tstz', 'M8[us]'), ('t', object)]:
+            self.assertEqual(arrays[name].dtype, numpy.dtype(dtype))
+            self.assertEqual(list(arrays[name].mask), [True, False])
+
+        self.assertEqual(arrays['i8'][1], 2)
+        self.assertEqual(arrays['f4'][1], 1.0)
+        self.assertEqual(arrays['f8'][1], 0.5)
+        self.assertEqual(arrays['b'][1], True)
+        self.assertEqual(arrays['d'][1], numpy.datetime64('2012-01-03'))
+        self.assertEqual(arrays['ts'][1],
+            numpy.datetime64('2012-01-01T02:00:01.500000'))
+        self.assertEqual(arrays['tstz'][1],
+            numpy.datetime64('2012-01-03T00:00:00'))
+        self.assertEqual(arrays['t'][1], '2')
+
+    @skip_if_no_numpy
+    def test_text(self):
+        self.check_columns(False)
+
+    @skip_if_no_numpy
+    def test_binary(self):
+        self.check_columns(True)
+
+    @skip_if_no_numpy
+    def test_infinity(self):
+        import numpy
+        cur = self.conn.cursor()
+        for binary in (False, True):
+            cur.execute("""select 'infinity'::timestamp as ts,
+                '-infinity'::date as d""", binary=binary)
+            arrays = cur.fetchnumpy()
+            self.assert_(numpy.isnat(arrays['ts'][0]))
+            self.assert_(numpy.isnat(arrays['d'][0]))
+
+    @skip_if_no_numpy
+    def test_text_user_caster(self):
+        import numpy
+        cur = self.conn.cursor()
+        double = psycopg2.extensions.new_type((23,), "DOUBLE",
+            lambda s, cur: s is not None and int(s) * 2 or None)
+        psycopg2.extensions.register_type(double, cur)
+        cur.execute("select 21 as x")
+        arrays = cur.fetchnumpy()
+        self.assertEqual(arrays['x'].dtype, numpy.dtype('i4'))
+        self.assertEqual(arrays['x'][0], 42)
+
+    @skip_if_no_numpy
+    def test_duplicate_names(self):
+        cur = self.conn.cursor()
+        cur.execute("select 1, 2")
+        self.assertRaises(psycopg2.ProgrammingError, cur.fetchnumpy)
+
+    @skip_if_no_numpy
+    def test_naive_timestamptz(self):
+        import numpy
+        cur = self.conn.cursor()
+        cur.tzinfo_factory = None
+        cur.execute("set timezone to 'UTC'")
+        cur.execute("select '2012-01-01 00:00:00+00'::timestamptz as tstz")
+        arrays = cur.fetchnumpy()
+        self.assertEqual(arrays['tstz'][0],
+            numpy.datetime64('2012-01-01T00:00:00'))
+
+    @skip_if_no_numpy
+    def test_empty(self):
+        cur = self.conn.cursor()
+        cur.execute("select 1 as x where false", binary=True)
+        arrays = cur.fetchnumpy()
+        self.assertEqual(len(arrays['x']), 0)
+        cur.execute("select 1 as x")
+        cur.fetchall()
+        self.assertEqual(len(cur.fetchnumpy()['x']), 0)
+
+    @skip_if_no_numpy
+    def test_named_cursor(self):
+        cur = self.conn.cursor('test_numpy')
+        cur.execute("select generate_series(1, 5) as x", binary=True)
+        self.assertEqual(cur.fetchmany(2), [(1,), (2,)])
+        self.assertEqual(list(cur.fetchnumpy()['x']), [3, 4, 5])
+
+    @skip_if_no_numpy
+    def test_named_cursor_prefetch(self):
+        cur = self.conn.cursor('test_numpy')
+        cur.prefetch = True
+        cur.itersize = 3
+        cur.execute("select generate_series(1, 5) as x")
+        self.assertEqual(cur.fetchone(), (1,))
+        self.assertEqual(list(cur.fetchnumpy()['x']), [2, 3, 4, 5])
+
+
+def test_suite():
+    return unittest.TestLoader().loadTestsFromName(__name__)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -94,6 +94,16 @@ class GreenTests(unittest.TestCase):
         curs.execute("select 2")
         self.assertEqual(2, curs.fetchone()[0])
 
+    def test_executemany(self):
+        curs = self.conn.cursor()
+        curs.pagesize = 2
+        curs.execute("create temp table test_many (data int)")
+        curs.executemany("insert into test_many values (%s)",
+            [(1,), (2,), (3,)])
+        self.assertEqual(curs.rowcount, 3)
+        curs.execute("select sum(data) from test_many")
+        self.assertEqual(curs.fetchone()[0], 6)
+
 
 def test_suite():
     return unittest.TestLoader().loadTestsFromName(__name__)
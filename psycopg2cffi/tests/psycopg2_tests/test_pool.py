@@ -0,0 +1,705 @@
+#!/usr/bin/env python
+
+# test_pool.py - unit test for the connection pools
+#
+# psycopg2 is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Lesser General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# psycopg2 is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Lesser General Public
+# License for more details.
+
+import os
+import socket
+import threading
+import time
+
+import psycopg2
+import psycopg2.extensions
+import psycopg2.pool
+from testconfig import dsn
+from testutils import unittest
+
+
+class ThreadedPoolTests(unittest.TestCase):
+
+    def setUp(self):
+        self.pool = psycopg2.pool.ThreadedConnectionPool(1, 1, dsn)
+
+    def tearDown(self):
+        if not self.pool.closed:
+            self.pool.closeall()
+
+    def wait_queue(self, n):
+        for i in range(500):
+            if self.pool.get_stats()['requests_waiting'] == n:
+                return
+            time.sleep(0.01)
+        self.fail("no thread waiting")
+
+    def test_exhausted(self):
+        self.pool.getconn()
+        self.assertRaises(psycopg2.pool.PoolError, self.pool.getconn)
+        self.assertEqual(self.pool.get_stats()['requests_waited'], 0)
+
+    def test_wait(self):
+        conn = self.pool.getconn()
+        t = threading.Timer(0.1, self.pool.putconn, (conn,))
+        t.start()
+        self.assert_(self.pool.getconn(timeout=5) is conn)
+        t.join()
+        stats = self.pool.get_stats()
+        self.assertEqual(stats['requests_waited'], 1)
+        self.assertEqual(stats['requests_waiting'], 0)
+        self.assert_(0.05 < stats['wait_time'] < 5)
+
+    def test_timeout(self):
+        self.pool.getconn()
+        start = time.time()
+        self.assertRaises(psycopg2.pool.PoolError,
+            self.pool.getconn, timeout=0.2)
+        self.assert_(time.time() - start >= 0.2)
+        stats = self.pool.get_stats()
+        self.assertEqual(stats['requests_timed_out'], 1)
+        self.assertEqual(stats['requests_waiting'], 0)
+
+    def test_fifo(self):
+        conn = self.pool.getconn()
+        served = []
+        def worker(n):
+            c = self.pool.getconn(timeout=10)
+            served.append(n)
+            self.pool.putconn(c)
+
+        threads = []
+        for i in range(5):
+            t = threading.Thread(target=worker, args=(i,))
+            t.start()
+            threads.append(t)
+            self.wait_queue(i + 1)
+
+        self.assertEqual(self.pool.get_stats()['requests_waiting_max'], 5)
+        self.pool.putconn(conn)
+        for t in threads:
+            t.join()
+        self.assertEqual(served, range(5))
+
+    def test_no_timeout_with_waiters(self):
+        conn = self.pool.getconn()
+        got = []
+        def worker():
+            c = self.pool.getconn(timeout=10)
+            got.append(c)
+            self.pool.putconn(c)
+
+        t = threading.Thread(target=worker)
+        t.start()
+        self.wait_queue(1)
+
+        # Return the connection without waking up the waiter yet
+        self.pool._lock.acquire()
+        try:
+            self.pool._putconn(conn)
+        finally:
+            self.pool._lock.release()
+
+        self.assert_(self.pool.getconn() is conn)
+        self.assertEqual(self.pool.get_stats()['requests_waiting'], 1)
+        self.pool.putconn(conn)
+        t.join()
+        self.assertEqual(got, [conn])
+
+    def test_closeall_wakes_waiters(self):
+        self.pool.getconn()
+        errors = []
+        def worker():
+            try:
+                self.pool.getconn(timeout=10)
+            except psycopg2.pool.PoolError, e:
+                errors.append(e)
+
+        t = threading.Thread(target=worker)
+        t.start()
+        self.wait_queue(1)
+        self.pool.closeall()
+        t.join()
+        self.assertEqual(len(errors), 1)
+
+
+class WarmupTests(unittest.TestCase):
+
+    def test_connections(self):
+        pool = psycopg2.pool.SimpleConnectionPool(5, 5, dsn)
+        try:
+            self.assertEqual(len(pool._pool), 5)
+            pids = set()
+            for conn in pool._pool:
+                self.assert_(not conn.async)
+                self.assert_(not conn.autocommit)
+                cur = conn.cursor()
+                cur.execute("select pg_backend_pid()")
+                pids.add(cur.fetchone()[0])
+                self.assertEqual(conn.get_transaction_status(),
+                    psycopg2.extensions.TRANSACTION_STATUS_INTRANS)
+                conn.rollback()
+            self.assertEqual(len(pids), 5)
+        finally:
+            pool.closeall()
+
+    def test_error(self):
+        self.assertRaises(psycopg2.OperationalError,
+            psycopg2.pool.SimpleConnectionPool, 3, 3,
+            dsn + " dbname=nosuchdatabase")
+
+    def test_connect_timeout(self):
+        # A server accepting the connection but never answering
+        sock = socket.socket()
+        try:
+            sock.bind(('127.0.0.1', 0))
+            sock.listen(5)
+            port = sock.getsockname()[1]
+            start = time.time()
+            self.assertRaises(psycopg2.OperationalError,
+                psycopg2.pool.SimpleConnectionPool, 2, 2,
+                "host=127.0.0.1 port=%d connect_timeout=2" % port)
+            self.assert_(time.time() - start < 10)
+        finally:
+            sock.close()
+
+    def test_refill(self):
+        pool = psycopg2.pool.SimpleConnectionPool(3, 3, dsn)
+        try:
+            pool._pool[0].close()
+            pool._pool[2].close()
+            pool.maintain()
+            self.assertEqual(len(pool._pool), 3)
+            for conn in pool._pool:
+                self.assert_(not conn.closed)
+                self.assert_(not conn.async)
+        finally:
+            pool.closeall()
+
+
+class StatsTests(unittest.TestCase):
+
+    def setUp(self):
+        self.events = []
+        def hook(name):
+            return lambda *args: self.events.append((name,) + args)
+        self.pool = psycopg2.pool.SimpleConnectionPool(1, 2, dsn,
+            on_connect=hook('connect'), on_checkout=hook('checkout'),
+            on_checkin=hook('checkin'), on_discard=hook('discard'))
+
+    def tearDown(self):
+        if not self.pool.closed:
+            self.pool.closeall()
+
+    def test_counters(self):
+        pool = self.pool
+        conn1 = pool.getconn()
+        conn2 = pool.getconn()
+        self.assertRaises(psycopg2.pool.PoolError, pool.getconn)
+        conn1.cursor().execute("select 1")
+        pool.putconn(conn1)
+        pool.putconn(conn2)
+
+        stats = pool.get_stats()
+        self.assertEqual(stats['connections_opened'], 2)
+        self.assertEqual(stats['connections_discarded'], {'surplus': 1})
+        self.assertEqual(stats['requests'], 2)
+        self.assertEqual(stats['requests_exhausted'], 1)
+        self.assertEqual(stats['returns'], 2)
+        self.assertEqual(stats['returns_rolled_back'], 1)
+        self.assertEqual(stats['connections_idle'], 1)
+        self.assertEqual(stats['connections_used'], 0)
+        self.assertEqual(stats['checkout_time']['count'], 2)
+        self.assertEqual(stats['hold_time']['count'], 2)
+        self.assertEqual(
+            sum([n for b, n in stats['hold_time']['buckets']]), 2)
+
+    def test_hooks(self):
+        pool = self.pool
+        conn1 = pool._pool[0]
+        self.assertEqual(self.events, [('connect', conn1)])
+        del self.events[:]
+
+        self.assert_(pool.getconn() is conn1)
+        conn2 = pool.getconn()
+        pool.putconn(conn2)
+        conn1.close()
+        pool.putconn(conn1)
+        self.assertEqual(self.events, [
+            ('checkout', conn1), ('connect', conn2), ('checkout', conn2),
+            ('checkin', conn2), ('checkin', conn1),
+            ('discard', conn1, 'closed')])
+
+    def test_hook_error(self):
+        def hook(conn):
+            raise ZeroDivisionError
+        self.pool.on_checkout = hook
+        conn = self.pool.getconn()
+        self.assertEqual(self.pool.get_stats()['requests'], 1)
+        self.pool.putconn(conn)
+
+    def test_reset_on_return(self):
+        pool = psycopg2.pool.SimpleConnectionPool(1, 1, dsn,
+            reset_on_return=True)
+        try:
+            conn = pool.getconn()
+            conn.autocommit = True
+            conn.cursor().execute("select 1")
+            pool.putconn(conn)
+            self.assert_(pool.getconn() is conn)
+            self.assert_(not conn.autocommit)
+            cur = conn.cursor()
+            cur.execute("select 1")
+            pool.putconn(conn)
+            stats = pool.get_stats()
+            self.assertEqual(stats['returns_reset'], 0)
+            self.assertEqual(stats['returns_rolled_back'], 1)
+
+            self.assert_(pool.getconn() is conn)
+            cur.execute("set search_path to x")
+            pool.putconn(conn)
+            self.assert_(pool.getconn() is conn)
+            self.assertEqual(conn.get_transaction_status(),
+                psycopg2.extensions.TRANSACTION_STATUS_IDLE)
+            cur.execute("show search_path")
+            self.assertNotEqual(cur.fetchone()[0], 'x')
+            self.assertEqual(pool.get_stats()['returns_reset'], 1)
+        finally:
+            pool.closeall()
+
+    def test_histogram(self):
+        h = psycopg2.pool.Histogram()
+        for v in (0.00001, 0.003, 0.003, 100):
+            h.add(v)
+        d = h.as_dict()
+        self.assertEqual(d['count'], 4)
+        self.assertEqual(d['max'], 100)
+        self.assertEqual(d['buckets'][0], (0.0001, 1))
+        self.assertEqual(d['buckets'][3], (0.005, 2))
+        self.assertEqual(d['buckets'][-1], (None, 1))
+
+
+class ForkTests(unittest.TestCase):
+
+    def run_child(self, f):
+        """Run 'f' in a child process, return its exit status."""
+        pid = os.fork()
+        if not pid:
+            rv = 1
+            try:
+                try:
+                    rv = f()
+                except Exception:
+                    import traceback
+                    traceback.print_exc()
+            finally:
+                os._exit(rv)
+        return os.waitpid(pid, 0)[1] >> 8
+
+    def check_fork(self, pool):
+        conn = pool.getconn()
+        cur = conn.cursor()
+        cur.execute("select pg_backend_pid()")
+        parent_pid = cur.fetchone()[0]
+        conn.rollback()
+        pool.putconn(conn)
+
+        def child():
+            conn2 = pool.getconn()
+            if conn2 is conn or not conn.closed:
+                return 2
+            cur = conn2.cursor()
+            cur.execute("select pg_backend_pid()")
+            if cur.fetchone()[0] == parent_pid:
+                return 3
+            pool.putconn(conn2)
+            pool.closeall()
+            return 0
+
+        self.assertEqual(self.run_child(child), 0)
+
+        # the parent session was not closed by the child
+        self.assert_(pool.getconn() is conn)
+        cur.execute("select pg_backend_pid()")
+        self.assertEqual(cur.fetchone()[0], parent_pid)
+
+    def test_simple(self):
+        pool = psycopg2.pool.SimpleConnectionPool(1, 2, dsn)
+        try:
+            self.check_fork(pool)
+        finally:
+            pool.closeall()
+
+    def test_threaded(self):
+        pool = psycopg2.pool.ThreadedConnectionPool(1, 2, dsn,
+            maintenance_interval=10)
+        try:
+            self.check_fork(pool)
+        finally:
+            pool.closeall()
+
+    def test_sharded(self):
+        pool = psycopg2.pool.ShardedConnectionPool(1, 2,
+            {'a': dsn, 'b': dsn}, shard_map={1: 'a'})
+        try:
+            conn = pool.getconn(1)
+            def child():
+                try:
+                    pool.putconn(conn)
+                except psycopg2.pool.PoolError:
+                    pass
+                else:
+                    return 2
+                conn2 = pool.getconn(1)
+                pool.putconn(conn2)
+                pool.closeall()
+                return 0
+            self.assertEqual(self.run_child(child), 0)
+            pool.putconn(conn)
+        finally:
+            pool.closeall()
+
+    def test_checked_out(self):
+        pool = psycopg2.pool.ThreadedConnectionPool(1, 2, dsn)
+        try:
+            conn = pool.getconn()
+            def child():
+                pool.getconn()
+                stats = pool.get_stats()
+                return stats['connections_used'] != 1
+            self.assertEqual(self.run_child(child), 0)
+            cur = conn.cursor()
+            cur.execute("select 1")
+            self.assertEqual(cur.fetchone(), (1,))
+        finally:
+            pool.closeall()
+
+    def test_lazy(self):
+        pool = psycopg2.pool.SimpleConnectionPool(2, 3, dsn, lazy=True)
+        try:
+            self.assertEqual(pool.get_stats()['connections_opened'], 0)
+            pool.getconn()
+            stats = pool.get_stats()
+            self.assertEqual(stats['connections_opened'], 2)
+            self.assertEqual(stats['connections_idle'], 1)
+            self.assertEqual(stats['connections_used'], 1)
+        finally:
+            pool.closeall()
+
+
+class LifecycleTests(unittest.TestCase):
+
+    def setUp(self):
+        self.pools = []
+
+    def tearDown(self):
+        for pool in self.pools:
+            if not pool.closed:
+                pool.closeall()
+
+    def make_pool(self, minconn=1, maxconn=2, **kwargs):
+        pool = psycopg2.pool.ThreadedConnectionPool(
+            minconn, maxconn, dsn, **kwargs)
+        self.pools.append(pool)
+        return pool
+
+    def terminate(self, conn):
+        pid = conn.get_backend_pid()
+        killer = psycopg2.connect(dsn)
+        try:
+            cur = killer.cursor()
+            cur.execute("select pg_terminate_backend(%s)", (pid,))
+            for i in range(100):
+                cur.execute(
+                    "select 1 from pg_stat_activity where pid = %s", (pid,))
+                if not cur.fetchone():
+                    break
+                time.sleep(0.01)
+        finally:
+            killer.close()
+
+    def test_reuse(self):
+        pool = self.make_pool()
+        conn = pool.getconn()
+        pool.putconn(conn)
+        self.assert_(pool.getconn() is conn)
+
+    def test_dead_connection_discarded(self):
+        pool = self.make_pool()
+        conn = pool.getconn()
+        pool.putconn(conn)
+        self.terminate(conn)
+        conn2 = pool.getconn()
+        self.assert_(conn2 is not conn)
+        self.assert_(conn.closed)
+        self.assertEqual(pool.get_stats()['connections_discarded'],
+            {'dead': 1})
+        cur = conn2.cursor()
+        cur.execute("select 1")
+        self.assertEqual(cur.fetchone(), (1,))
+
+    def test_notification_not_dead(self):
+        pool = self.make_pool()
+        conn = pool.getconn()
+        conn.autocommit = True
+        conn.cursor().execute("listen test_pool")
+        pool.putconn(conn)
+        other = psycopg2.connect(dsn)
+        other.autocommit = True
+        other.cursor().execute("notify test_pool")
+        other.close()
+        time.sleep(0.1)
+        self.assert_(pool.getconn() is conn)
+        self.assertEqual(len(conn.notifies), 1)
+
+    def test_max_lifetime(self):
+        pool = self.make_pool(max_lifetime=0.2)
+        conn = pool.getconn()
+        pool.putconn(conn)
+        self.assert_(pool.getconn() is conn)
+        time.sleep(0.2)
+        pool.putconn(conn)
+        self.assert_(conn.closed)
+        self.assert_(pool.getconn() is not conn)
+
+    def test_max_idle(self):
+        pool = self.make_pool(max_idle=0.2)
+        conn1 = pool.getconn()
+        conn2 = pool.getconn()
+        pool.putconn(conn1)
+        pool.putconn(conn2)
+        self.assertEqual(len(pool._pool), 2)
+        time.sleep(0.1)
+        self.assert_(pool.getconn() is conn2)
+        pool.putconn(conn2)
+        time.sleep(0.2)
+        # the surplus connection is closed, the 'minconn' one is kept
+        self.assert_(pool.getconn() is conn1)
+        self.assert_(conn2.closed)
+        self.assert_(not conn1.closed)
+
+    def test_maintain(self):
+        pool = self.make_pool(minconn=2, maxconn=3, max_idle=0.1)
+        conns = [pool.getconn() for i in range(3)]
+        for conn in conns:
+            pool.putconn(conn)
+        self.assertEqual(len(pool._pool), 3)
+        time.sleep(0.1)
+        pool.maintain()
+        self.assertEqual(len(pool._pool), 2)
+        self.assert_(conns[0].closed)
+        self.assert_(conns[0] not in pool._pool)
+        for conn in conns[1:]:
+            self.assert_(not conn.closed)
+
+        # the 'minconn' connections are neither closed nor replaced
+        time.sleep(0.1)
+        pool.maintain()
+        self.assertEqual(pool._pool, conns[1:])
+        stats = pool.get_stats()
+        self.assertEqual(stats['connections_opened'], 3)
+        self.assertEqual(stats['connections_discarded'], {'expired': 1})
+
+    def test_maintain_replaces_dead(self):
+        pool = psycopg2.pool.SimpleConnectionPool(2, 2, dsn)
+        self.pools.append(pool)
+        dead = pool._pool[0]
+        self.terminate(dead)
+        pool.maintain()
+        self.assertEqual(len(pool._pool), 2)
+        self.assert_(dead not in pool._pool)
+
+    def test_maintenance_thread(self):
+        pool = self.make_pool(max_lifetime=0.1, maintenance_interval=0.05)
+        conn = pool._pool[0]
+        for i in range(100):
+            if conn.closed and pool._pool:
+                break
+            time.sleep(0.01)
+        else:
+            self.fail("connection not replaced")
+        pool.closeall()
+        self.assert_(pool._stop.isSet())
+
+
+class RoutingPoolTests(unittest.TestCase):
+
+    def setUp(self):
+        self.pool = None
+
+    def tearDown(self):
+        if self.pool is not None and not self.pool.closed:
+            self.pool.closeall()
+
+    def make_pool(self, replicas=('r1', 'r2'), **kwargs):
+        self.pool = psycopg2.pool.RoutingConnectionPool(1, 2,
+            dsn + " application_name=primary",
+            [dsn + " application_name=" + name for name in replicas],
+            **kwargs)
+        return self.pool
+
+    def server(self, conn):
+        cur = conn.cursor()
+        cur.execute("select current_setting('application_name')")
+        rv = cur.fetchone()[0]
+        conn.rollback()
+        return rv
+
+    def test_primary(self):
+        pool = self.make_pool()
+        conn = pool.getconn()
+        self.assertEqual(self.server(conn), 'primary')
+        pool.putconn(conn)
+
+    def test_least_used(self):
+        pool = self.make_pool()
+        conns = [pool.getconn(readonly=True) for i in range(4)]
+        self.assertEqual(sorted([self.server(c) for c in conns]),
+            ['r1', 'r1', 'r2', 'r2'])
+
+        # both replicas exhausted
+        conn = pool.getconn(readonly=True)
+        self.assertEqual(self.server(conn), 'primary')
+        pool.putconn(conn)
+
+        pool.putconn(conns[0])
+        conn = pool.getconn(readonly=True)
+        self.assertEqual(self.server(conn), self.server(conns[0]))
+
+        stats = pool.get_stats()
+        self.assertEqual(stats['primary']['requests'], 1)
+        self.assertEqual(
+            [r['connections_used'] for r in stats['replicas']], [2, 2])
+
+    def test_replica_down(self):
+        pool = psycopg2.pool.RoutingConnectionPool(1, 2, dsn,
+            [dsn + " port=1"])
+        self.pool = pool
+        self.assertEqual(pool.check_replicas(), [False])
+        conn = pool.getconn(readonly=True)
+        self.assert_(pool.primary._used)
+        pool.putconn(conn)
+
+    def test_check(self):
+        unhealthy = set(['r1'])
+        def check(conn):
+            return self.server(conn) not in unhealthy
+
+        pool = self.make_pool(check=check)
+        self.assertEqual(pool.check_replicas(), [False, True])
+        for i in range(2):
+            conn = pool.getconn(readonly=True)
+            self.assertEqual(self.server(conn), 'r2')
+
+        unhealthy.clear()
+        self.assertEqual(pool.check_replicas(), [True, True])
+        conn = pool.getconn(readonly=True)
+        self.assertEqual(self.server(conn), 'r1')
+
+    def test_lag_check(self):
+        pool = self.make_pool(check=psycopg2.pool.replica_lag_check(10))
+        self.assertEqual(pool.check_replicas(), [True, True])
+
+    def test_lazy(self):
+        pool = self.make_pool(lazy=True)
+        self.assertEqual(pool.primary._pool, [])
+        conn = pool.getconn(readonly=True)
+        self.assertEqual(self.server(conn), 'r1')
+        pool.putconn(conn)
+
+    def test_unkeyed(self):
+        pool = self.make_pool()
+        conn = psycopg2.connect(dsn)
+        try:
+            self.assertRaises(psycopg2.pool.PoolError, pool.putconn, conn)
+        finally:
+            conn.close()
+
+
+class ShardedPoolTests(unittest.TestCase):
+
+    def setUp(self):
+        self.pools = []
+
+    def tearDown(self):
+        for pool in self.pools:
+            if not pool.closed:
+                pool.closeall()
+
+    def make_pool(self, names=('a', 'b', 'c'), minconn=0, **kwargs):
+        pool = psycopg2.pool.ShardedConnectionPool(minconn, 2,
+            dict([(n, dsn + " application_name=" + n) for n in names]),
+            **kwargs)
+        self.pools.append(pool)
+        return pool
+
+    def test_consistent_hashing(self):
+        pool = self.make_pool()
+        keys = range(1000)
+        shards = [pool.shard_for(k) for k in keys]
+        for name in 'abc':
+            self.assert_(shards.count(name) > 200)
+
+        pool2 = self.make_pool(('a', 'b'))
+        for k, name in zip(keys, shards):
+            if name != 'c':
+                self.assertEqual(pool2.shard_for(k), name)
+
+        self.assertEqual(pool.shard_for(u'caf\xe8'),
+            pool.shard_for(u'caf\xe8'.encode('utf-8')))
+
+    def test_shard_map(self):
+        pool = self.make_pool(shard_map={'x': 'c', 'y': 'zz'})
+        self.assertEqual(pool.shard_for('x'), 'c')
+        self.assertRaises(psycopg2.pool.PoolError, pool.shard_for, 'y')
+        pool = self.make_pool(shard_map=lambda k: k < 0 and 'a' or None)
+        self.assertEqual(pool.shard_for(-1), 'a')
+
+    def test_getconn(self):
+        pool = self.make_pool(shard_map={1: 'b'}, limits={'b': (1, 1)})
+        conn = pool.getconn(1)
+        cur = conn.cursor()
+        cur.execute("select current_setting('application_name')")
+        self.assertEqual(cur.fetchone()[0], 'b')
+        self.assertRaises(psycopg2.pool.PoolError, pool.getconn, 1)
+        pool.putconn(conn)
+        self.assertRaises(psycopg2.pool.PoolError, pool.putconn, conn)
+
+        stats = pool.get_stats()
+        self.assertEqual(stats['requests'], 1)
+        self.assertEqual(stats['requests_exhausted'], 1)
+        self.assertEqual(stats['shards']['b']['connections_idle'], 1)
+
+    def test_scatter(self):
+        pool = self.make_pool(minconn=1)
+        rows = pool.scatter(
+            "select current_setting('application_name'), %s", (42,))
+        self.assertEqual(rows, [('a', 42), ('b', 42), ('c', 42)])
+        self.assertEqual(pool.get_stats()['connections_used'], 0)
+
+    def test_scatter_error(self):
+        pool = self.make_pool()
+        self.assertRaises(psycopg2.ProgrammingError,
+            pool.scatter, "select * from nosuchtable")
+        self.assertEqual(pool.get_stats()['connections_used'], 0)
+
+    def test_scatter_connection_lost(self):
+        pool = self.make_pool()
+        self.assertRaises(psycopg2.DatabaseError,
+            pool.scatter, "select pg_terminate_backend(pg_backend_pid())")
+        stats = pool.get_stats()
+        self.assertEqual(stats['connections_used'], 0)
+        self.assertEqual(stats['connections_idle'], 0)
+
+
+def test_suite():
+    return unittest.TestLoader().loadTestsFromName(__name__)
+
+if __name__ == "__main__":
+    unittest.main()
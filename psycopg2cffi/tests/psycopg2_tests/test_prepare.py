@@ -0,0 +1,211 @@
+#!/usr/bin/env python
+
+# test_prepare.py - unit test for the automatic prepared statements
+#
+# psycopg2 is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Lesser General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# psycopg2 is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Lesser General Public
+# License for more details.
+
+import psycopg2
+import psycopg2.extensions
+import psycopg2.extras
+from testconfig import dsn
+from testutils import unittest
+
+
+class PreparedStatementsTests(unittest.TestCase):
+
+    def setUp(self):
+        self.conn = psycopg2.connect(dsn)
+        self.conn.autocommit = True
+        self.prepared = self.conn.prepared_statements
+        self.prepared.maxsize = 3
+        self.prepared.threshold = 0
+
+    def tearDown(self):
+        self.conn.close()
+
+    def server_statements(self):
+        maxsize, self.prepared.maxsize = self.prepared.maxsize, 0
+        try:
+            cur = self.conn.cursor()
+            cur.execute(
+                "select name from pg_prepared_statements order by name")
+            return [r[0] for r in cur.fetchall()]
+        finally:
+            self.prepared.maxsize = maxsize
+
+    def test_disabled(self):
+        conn = psycopg2.connect(dsn)
+        try:
+            cur = conn.cursor()
+            for i in range(10):
+                cur.execute("select 1")
+            self.assertEqual(len(conn.prepared_statements), 0)
+            self.assertEqual(conn.prepared_statements.hits, 0)
+        finally:
+            conn.close()
+
+    def test_threshold(self):
+        self.prepared.threshold = 2
+        cur = self.conn.cursor()
+        cur.server_binding = True
+        for i in range(5):
+            cur.execute("select %s + 1", (i,))
+            self.assertEqual(cur.fetchone(), (i + 1,))
+        self.assertEqual(self.prepared.misses, 3)
+        self.assertEqual(self.prepared.hits, 2)
+        self.assertEqual(self.server_statements(), ['_psycopg2cffi_1'])
+
+    def test_param_types(self):
+        cur = self.conn.cursor()
+        cur.server_binding = True
+        cur.execute("select %s", (1,))
+        cur.execute("select %s", (2 ** 40,))
+        self.assertEqual(cur.fetchone(), (2 ** 40,))
+        cur.execute("select %s", ('a',))
+        self.assertEqual(cur.fetchone(), ('a',))
+        self.assertEqual(len(self.prepared), 3)
+
+    def test_eviction(self):
+        cur = self.conn.cursor()
+        for i in range(3):
+            cur.execute("select %d" % i)
+        cur.execute("select 0")
+        cur.execute("select 3")
+        self.assertEqual(self.prepared.evictions, 1)
+        self.assertEqual(self.prepared.hits, 1)
+        self.assertEqual(self.server_statements(),
+            ['_psycopg2cffi_1', '_psycopg2cffi_3', '_psycopg2cffi_4'])
+
+    def test_not_preparable(self):
+        cur = self.conn.cursor()
+        cur.execute("select 1; select 2")
+        self.assertEqual(cur.fetchone(), (2,))
+        cur.execute("set datestyle to iso")
+        cur.execute("select 1;")
+        self.assertEqual(self.server_statements(), ['_psycopg2cffi_1'])
+
+    def test_prepare_error(self):
+        cur = self.conn.cursor()
+        self.assertRaises(psycopg2.ProgrammingError,
+            cur.execute, "select nosuchcolumn")
+        self.assertEqual(len(self.prepared), 0)
+        cur.execute("select 1")
+        self.assertEqual(cur.fetchone(), (1,))
+
+    def test_discard(self):
+        cur = self.conn.cursor()
+        cur.execute("select 1")
+        self.assertEqual(len(self.prepared), 1)
+        cur.execute("discard all")
+        self.assertEqual(len(self.prepared), 0)
+        cur.execute("select 1")
+        self.assertEqual(cur.fetchone(), (1,))
+
+    def test_deallocate_executemany(self):
+        cur = self.conn.cursor()
+        cur.execute("select 1")
+        cur.pagesize = 2
+        cur.executemany("deallocate all", [(), ()])
+        self.assertEqual(len(self.prepared), 0)
+        cur.execute("select 1")
+        self.assertEqual(cur.fetchone(), (1,))
+
+    def test_deallocate_deferred_begin(self):
+        self.conn.autocommit = False
+        self.conn.deferred_begin = True
+        cur = self.conn.cursor()
+        cur.execute("select 1")
+        self.conn.commit()
+        cur.execute("deallocate all")
+        self.assertEqual(len(self.prepared), 0)
+        self.conn.commit()
+        cur.execute("select 1")
+        self.assertEqual(cur.fetchone(), (1,))
+
+    def test_deferred_begin(self):
+        self.conn.autocommit = False
+        self.conn.deferred_begin = True
+        self.prepared.threshold = 1
+        commands = []
+        execute = self.conn._execute_command
+        def _execute_command(command):
+            commands.append(command)
+            return execute(command)
+        self.conn._execute_command = _execute_command
+
+        # Not prepared yet: the BEGIN is sent with the query
+        cur = self.conn.cursor()
+        cur.execute("select 1")
+        self.assertEqual(cur.fetchone(), (1,))
+        self.assertEqual(self.conn.status, psycopg2.extensions.STATUS_BEGIN)
+        self.assertEqual(commands, [])
+        self.conn.rollback()
+
+        # A prepared statement needs a BEGIN of its own
+        cur.execute("select 1")
+        self.assertEqual(cur.fetchone(), (1,))
+        self.assertEqual(self.conn.status, psycopg2.extensions.STATUS_BEGIN)
+        self.assertEqual(commands[-1:], ['BEGIN'])
+        self.assertEqual(len(self.prepared), 1)
+
+    def test_deallocate_green(self):
+        cur = self.conn.cursor()
+        cur.execute("select 1")
+        cb = psycopg2.extensions.get_wait_callback()
+        psycopg2.extensions.set_wait_callback(psycopg2.extras.wait_select)
+        try:
+            cur.execute("deallocate all")
+        finally:
+            psycopg2.extensions.set_wait_callback(cb)
+        self.assertEqual(len(self.prepared), 0)
+        cur.execute("select 1")
+        self.assertEqual(cur.fetchone(), (1,))
+
+    def test_reset(self):
+        cur = self.conn.cursor()
+        cur.execute("prepare mine as select 1")
+        cur.execute("select 1")
+        self.conn.reset()
+        self.assertEqual(len(self.prepared), 0)
+        self.assertEqual(self.server_statements(), ['mine'])
+
+    def test_reset_session(self):
+        cur = self.conn.cursor()
+        cur.execute("select 1")
+        self.conn._reset_session()
+        self.assertEqual(len(self.prepared), 1)
+        self.assertEqual(self.server_statements(), ['_psycopg2cffi_1'])
+
+        cur.execute("prepare mine as select 1")
+        self.conn._reset_session()
+        self.assertEqual(len(self.prepared), 0)
+        self.assertEqual(self.server_statements(), [])
+
+    def test_cached_plan_invalid(self):
+        cur = self.conn.cursor()
+        cur.execute("create temp table prep (a int)")
+        cur.execute("select * from prep")
+        cur.execute("alter table prep add b int")
+        self.assertRaises(psycopg2.NotSupportedError,
+            cur.execute, "select * from prep")
+        self.assertEqual(len(self.prepared), 0)
+        cur.execute("insert into prep values (1, 2)")
+        cur.execute("select * from prep")
+        self.assertEqual(cur.fetchall(), [(1, 2)])
+        self.assertEqual(self.server_statements(),
+            ['_psycopg2cffi_2', '_psycopg2cffi_3'])
+
+
+def test_suite():
+    return unittest.TestLoader().loadTestsFromName(__name__)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+
+# test_server_binding.py - unit test for parameters sent out of the query
+#
+# psycopg2 is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Lesser General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# psycopg2 is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Lesser General Public
+# License for more details.
+
+import datetime
+from decimal import Decimal
+
+import psycopg2
+from testconfig import dsn
+from testutils import unittest
+
+
+class ServerBindingTests(unittest.TestCase):
+
+    def setUp(self):
+        self.conn = psycopg2.connect(dsn)
+        self.cur = self.conn.cursor()
+        self.cur.server_binding = True
+
+    def tearDown(self):
+        self.conn.close()
+
+    def test_placeholders(self):
+        cur = self.cur
+        cur.execute("select %s, %s, '%%'", (1, 'a'))
+        self.assertEqual(cur.query, "select $1, $2, '%'")
+        self.assertEqual(cur.fetchone(), (1, 'a', '%'))
+
+        cur.execute("select %(a)s, %(b)s, %(a)s", {'a': 1, 'b': 2})
+        self.assertEqual(cur.query, "select $1, $2, $1")
+        self.assertEqual(cur.fetchone(), (1, 2, 1))
+
+    def test_no_params(self):
+        cur = self.cur
+        cur.execute("select '%%'", ())
+        self.assertEqual(cur.fetchone(), ('%',))
+        cur.execute("select 1; select 2", ())
+        self.assertEqual(cur.fetchone(), (2,))
+
+    def test_errors(self):
+        cur = self.cur
+        self.assertRaises(TypeError, cur.execute, "select %s", (1, 2))
+        self.assertRaises(IndexError, cur.execute, "select %s, %s", (1,))
+        self.assertRaises(KeyError, cur.execute, "select %(a)s", {'b': 1})
+        self.assertRaises(ValueError, cur.execute,
+            "select %s, %(a)s", {'a': 1})
+        self.assertRaises(ValueError, cur.execute, "select %d", (1,))
+        self.assertRaises(psycopg2.ProgrammingError, cur.execute,
+            "select %(a", {'a': 1})
+
+    def test_types(self):
+        cur = self.cur
+        values = (None, True, False, 42, -42, 2 ** 40, 2 ** 70, 1.5,
+            Decimal('-12.340'), datetime.date(2012, 1, 2),
+            datetime.datetime(2012, 1, 2, 3, 4, 5, 6),
+            datetime.time(3, 4, 5, 6), datetime.timedelta(2, 3, 4))
+        cur.execute("select " + ", ".join(["%s"] * len(values)), values)
+        self.assertEqual(cur.fetchone(), values)
+
+    def test_special_floats(self):
+        cur = self.cur
+        cur.execute("select %s, %s", (float('inf'), float('-inf')))
+        self.assertEqual(cur.fetchone(), (float('inf'), float('-inf')))
+
+    def test_strings(self):
+        cur = self.cur
+        s = "it's a \\ back'slash"
+        cur.execute("select %s, %s", (s, ''))
+        self.assertEqual(cur.fetchone(), (s, ''))
+
+        self.conn.set_client_encoding('UTF8')
+        snowman = u"\u2603"
+        cur.execute("select %s", (snowman,))
+        self.assertEqual(cur.fetchone()[0], snowman.encode('utf8'))
+
+    def test_bytea(self):
+        cur = self.cur
+        data = ''.join(map(chr, range(256)))
+        cur.execute("select %s", (psycopg2.Binary(data),))
+        self.assertEqual(str(cur.fetchone()[0]), data)
+
+    def test_large_value(self):
+        cur = self.cur
+        cur.execute("create temp table bigvalue (data text)")
+        data = "x'" * 500000
+        cur.execute("insert into bigvalue values (%s)", (data,))
+        self.assertEqual(cur.query, "insert into bigvalue values ($1)")
+        cur.execute("select data from bigvalue")
+        self.assertEqual(cur.fetchone()[0], data)
+
+    def test_merged_adapters(self):
+        cur = self.cur
+        cur.execute("select %s, %s = any(%s), 1 in %s",
+            ('a', 2, [1, 2, 3], (1, 2)))
+        self.assert_(cur.query.startswith("select $1, $2 = any(ARRAY["))
+        self.assertEqual(cur.fetchone(), ('a', True, True))
+
+    def test_named_cursor(self):
+        cur = self.conn.cursor('test_binding')
+        cur.server_binding = True
+        cur.execute("select generate_series(1, %s)", (3,))
+        self.assertEqual(cur.fetchall(), [(1,), (2,), (3,)])
+
+
+def test_suite():
+    return unittest.TestLoader().loadTestsFromName(__name__)
+
+if __name__ == "__main__":
+    unittest.main()
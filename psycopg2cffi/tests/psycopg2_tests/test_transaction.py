@@ -93,6 +93,88 @@ class TransactionTests(unittest.TestCase):
         self.assertEqual(curs.fetchone()[0], 1)
 
 
+class DeferredBeginTransactionTests(TransactionTests):
+
+    def setUp(self):
+        TransactionTests.setUp(self)
+        self.conn.deferred_begin = True
+
+
+class DeferredBeginTests(unittest.TestCase):
+
+    def setUp(self):
+        self.conn = psycopg2.connect(dsn)
+        self.conn.deferred_begin = True
+        self.commands = []
+        execute = self.conn._execute_command
+        def _execute_command(command):
+            self.commands.append(command)
+            return execute(command)
+        self.conn._execute_command = _execute_command
+
+    def tearDown(self):
+        self.conn.close()
+
+    def test_begin_with_query(self):
+        curs = self.conn.cursor()
+        curs.execute("select %s", (10,))
+        self.assertEqual(curs.fetchone(), (10,))
+        self.assertEqual(curs.statusmessage, 'SELECT 1')
+        self.assertEqual(self.conn.status, STATUS_BEGIN)
+        self.assertEqual(self.conn.get_transaction_status(),
+            psycopg2.extensions.TRANSACTION_STATUS_INTRANS)
+        curs.execute("select 20")
+        self.assertEqual(curs.fetchone(), (20,))
+        self.conn.commit()
+        self.assertEqual(self.commands, ['COMMIT'])
+
+    def test_binary_query(self):
+        curs = self.conn.cursor()
+        curs.execute("select 1", binary=True)
+        self.assertEqual(curs.fetchone(), (1,))
+        self.assertEqual(self.commands, ['BEGIN'])
+
+    def test_syntax_error(self):
+        curs = self.conn.cursor()
+        self.assertRaises(psycopg2.ProgrammingError, curs.execute, "selec 1")
+        self.assertEqual(self.conn.status, STATUS_READY)
+        curs.execute("select 1")
+        self.assertEqual(curs.fetchone(), (1,))
+        self.assertEqual(self.conn.status, STATUS_BEGIN)
+
+    def test_error(self):
+        curs = self.conn.cursor()
+        self.assertRaises(psycopg2.DataError, curs.execute, "select 1 / 0")
+        self.assertEqual(self.conn.status, STATUS_BEGIN)
+        self.assertRaises(psycopg2.InternalError, curs.execute, "select 1")
+        self.conn.rollback()
+        curs.execute("select 1")
+        self.assertEqual(curs.fetchone(), (1,))
+
+    def test_empty_query(self):
+        curs = self.conn.cursor()
+        self.assertRaises(psycopg2.ProgrammingError, curs.execute, "")
+
+    def test_transaction(self):
+        curs = self.conn.cursor()
+        curs.execute("create temp table deferred (id int)")
+        self.conn.commit()
+        curs.executemany("insert into deferred values (%s)", [(1,), (2,)])
+        self.assertEqual(curs.rowcount, 2)
+        self.conn.rollback()
+        curs.execute("insert into deferred values (3)")
+        self.conn.commit()
+        curs.execute("select id from deferred")
+        self.assertEqual(curs.fetchall(), [(3,)])
+        self.assert_('BEGIN' not in self.commands)
+
+    def test_named_cursor(self):
+        curs = self.conn.cursor('deferred')
+        curs.execute("select generate_series(1, 3)")
+        self.assertEqual(curs.fetchall(), [(1,), (2,), (3,)])
+        self.assertEqual(self.conn.status, STATUS_BEGIN)
+
+
 class DeadlockSerializationTests(unittest.TestCase):
     """Test deadlock and serialization failure errors."""
 
@@ -340,6 +340,24 @@ class AdaptSubclassTest(unittest.TestCase):
            del psycopg2.extensions.adapters[A, psycopg2.extensions.ISQLQuote]
            del psycopg2.extensions.adapters[B, psycopg2.extensions.ISQLQuote]
 
+    def test_adapt_registry_changes(self):
+        from psycopg2.extensions import adapt, register_adapter, AsIs
+
+        class A(object): pass
+        class B(A): pass
+
+        self.assertRaises(psycopg2.ProgrammingError, adapt, B())
+        register_adapter(A, lambda a: AsIs("a"))
+        try:
+            self.assertEqual(b('a'), adapt(B()).getquoted())
+            register_adapter(B, lambda b: AsIs("b"))
+            self.assertEqual(b('b'), adapt(B()).getquoted())
+            del psycopg2.extensions.adapters[B, psycopg2.extensions.ISQLQuote]
+            self.assertEqual(b('a'), adapt(B()).getquoted())
+        finally:
+           del psycopg2.extensions.adapters[A, psycopg2.extensions.ISQLQuote]
+        self.assertRaises(psycopg2.ProgrammingError, adapt, B())
+
     @testutils.skip_from_python(3)
     def test_no_mro_no_joy(self):
         from psycopg2.extensions import adapt, register_adapter, AsIs
@@ -140,6 +140,37 @@ def skip_if_no_namedtuple(f):
     return skip_if_no_namedtuple_
 
 
+def skip_if_no_numpy(f):
+    """Skip a test if NumPy is not available."""
+    def skip_if_no_numpy_(self):
+        try:
+            import numpy
+        except ImportError:
+            return self.skipTest("numpy not available")
+        else:
+            return f(self)
+
+    skip_if_no_numpy_.__name__ = f.__name__
+    return skip_if_no_numpy_
+
+
+def skip_if_no_stream(f):
+    """Skip a test if results can't be streamed: libpq doesn't support
+    single-row mode or a wait callback is in use."""
+    def skip_if_no_stream_(self):
+        from psycopg2cffi._impl.cursor import _stream_statuses
+        from testconfig import green
+        if not _stream_statuses:
+            return self.skipTest("libpq doesn't support single-row mode")
+        elif green:
+            return self.skipTest("streaming not supported in green mode")
+        else:
+            return f(self)
+
+    skip_if_no_stream_.__name__ = f.__name__
+    return skip_if_no_stream_
+
+
 def skip_if_no_iobase(f):
     """Skip a test if io.TextIOBase is not available."""
     def skip_if_no_iobase_(self):